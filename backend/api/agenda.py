@@ -0,0 +1,161 @@
+"""
+Agenda de visitas: detección de choques entre citas y horarios disponibles.
+
+Una cita ocupa ``[fecha_hora_cita, fecha_fin_cita)`` y choca con otra no cancelada del
+mismo inmueble o del mismo propietario. Como ninguna dura más de
+``CITA_DURACION_MAXIMA_MINUTOS``, las que pueden solaparse con un intervalo empiezan como
+mucho esa duración antes: la búsqueda es un rango sobre los índices
+``(inmueble, fecha_hora_cita, fecha_fin_cita)`` y ``(usuario_propietario, ...)`` y no recorre
+la agenda completa.
+
+``guardar`` bloquea las filas del propietario y del inmueble (SELECT ... FOR UPDATE) antes
+de comprobar, así dos reservas simultáneas para el mismo dueño o inmueble se hacen una
+detrás de otra y la segunda ve la primera. En SQLite las escrituras ya son serializadas.
+
+Las citas creadas antes de que existiera ``fecha_fin_cita`` la tienen vacía y no se verían
+en la búsqueda: ``manage.py completar_fin_citas`` la asigna, y hay que ejecutarlo justo después
+de la migración que agrega la columna (que por eso se crea nullable).
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Cita, Inmueble, Usuario
+
+# Días como máximo que se consultan de una vez en /disponibilidad/
+MAX_DIAS = 31
+
+TAMANO_LOTE = 500
+
+
+class ConflictoCita(APIException):
+	status_code = status.HTTP_409_CONFLICT
+	default_detail = 'El horario se cruza con otra visita del inmueble o del propietario.'
+	default_code = 'conflicto_cita'
+
+
+def duracion_maxima():
+	return datetime.timedelta(minutes=settings.CITA_DURACION_MAXIMA_MINUTOS)
+
+
+def fin_de(cita):
+	return cita.fecha_hora_cita + datetime.timedelta(minutes=cita.duracion_minutos)
+
+
+def completar_fines(tamano_lote=TAMANO_LOTE):
+	"""Asigna ``fecha_fin_cita`` a las citas que no la tienen, por lotes; devuelve cuántas."""
+	total = 0
+	while True:
+		citas = list(
+			Cita.objects.filter(fecha_fin_cita__isnull=True)
+			.only('pk', 'fecha_hora_cita', 'duracion_minutos')[:tamano_lote]
+		)
+		if not citas:
+			return total
+		for cita in citas:
+			cita.fecha_fin_cita = fin_de(cita)
+		Cita.objects.bulk_update(citas, ['fecha_fin_cita'])
+		total += len(citas)
+
+
+def _consultas(desde, hasta, inmueble_id, propietario_id, excluir=None):
+	"""Una consulta por índice con las citas activas que se solapan con [desde, hasta)."""
+	base = (
+		Cita.objects
+		.filter(fecha_hora_cita__gte=desde - duracion_maxima(), fecha_hora_cita__lt=hasta, fecha_fin_cita__gt=desde)
+		.exclude(estatus_cita='Cancelada')
+	)
+	if excluir is not None:
+		base = base.exclude(pk=excluir)
+	consultas = []
+	if inmueble_id is not None:
+		consultas.append(base.filter(inmueble_id=inmueble_id))
+	if propietario_id is not None:
+		consultas.append(base.filter(usuario_propietario_id=propietario_id))
+	return consultas
+
+
+def ocupados(desde, hasta, inmueble_id, propietario_id):
+	"""Intervalos (inicio, fin) ocupados en [desde, hasta), ordenados; una sola consulta (UNION)."""
+	consultas = [c.values_list('id', 'fecha_hora_cita', 'fecha_fin_cita') for c in _consultas(desde, hasta, inmueble_id, propietario_id)]
+	if not consultas:
+		return []
+	filas = consultas[0].union(*consultas[1:]) if len(consultas) > 1 else consultas[0]
+	return sorted((inicio, fin) for _, inicio, fin in filas)
+
+
+def _bloquear(inmueble_id, propietario_id):
+	# Siempre en el mismo orden (propietario, inmueble) para no provocar interbloqueos
+	if propietario_id is not None:
+		list(Usuario.objects.select_for_update().filter(pk=propietario_id).values_list('pk'))
+	if inmueble_id is not None:
+		list(Inmueble.objects.select_for_update().filter(pk=inmueble_id).values_list('pk'))
+
+
+def guardar(cita):
+	"""Guarda ``cita`` si no choca con otra; si choca lanza ConflictoCita (HTTP 409)."""
+	if not 0 < cita.duracion_minutos <= settings.CITA_DURACION_MAXIMA_MINUTOS:
+		raise ValidationError({
+			'duracion_minutos': f'Debe estar entre 1 y {settings.CITA_DURACION_MAXIMA_MINUTOS} minutos.'
+		})
+	with transaction.atomic():
+		if cita.estatus_cita != 'Cancelada':
+			_bloquear(cita.inmueble_id, cita.usuario_propietario_id)
+			for consulta in _consultas(cita.fecha_hora_cita, fin_de(cita), cita.inmueble_id, cita.usuario_propietario_id, cita.pk):
+				# Lectura con bloqueo: ve lo último confirmado aunque la transacción ya tenga una instantánea
+				if consulta.select_for_update().values_list('pk')[:1]:
+					raise ConflictoCita()
+		cita.save()
+	return cita
+
+
+def _dias(desde, hasta):
+	dia = desde
+	while dia <= hasta:
+		yield dia
+		dia += datetime.timedelta(days=1)
+
+
+def _choca(intervalos, desde_indice, inicio, fin):
+	for indice in range(desde_indice, len(intervalos)):
+		ocupado_inicio, ocupado_fin = intervalos[indice]
+		if ocupado_inicio >= fin:
+			return False
+		if ocupado_fin > inicio:
+			return True
+	return False
+
+
+def disponibilidad(inmueble, desde, hasta, duracion_minutos=None, ahora=None):
+	"""Horarios libres para visitar ``inmueble`` entre las fechas ``desde`` y ``hasta`` (incluidas).
+
+	Se ofrecen cada ``CITA_INTERVALO_MINUTOS`` dentro del horario de atención, en la zona
+	``CITA_ZONA_HORARIA``; las citas ocupadas se leen con una consulta para todo el rango.
+	"""
+	duracion = datetime.timedelta(minutes=duracion_minutos or settings.CITA_DURACION_MINUTOS)
+	paso = datetime.timedelta(minutes=settings.CITA_INTERVALO_MINUTOS)
+	ahora = ahora or timezone.now()
+	zona = ZoneInfo(settings.CITA_ZONA_HORARIA)
+
+	inicio_rango = datetime.datetime.combine(desde, datetime.time(settings.CITA_HORA_INICIO), zona)
+	fin_rango = datetime.datetime.combine(hasta, datetime.time(settings.CITA_HORA_FIN), zona)
+	intervalos = ocupados(inicio_rango, fin_rango, inmueble.pk, inmueble.propietario_id)
+
+	libres, i = [], 0
+	for dia in _dias(desde, hasta):
+		inicio = datetime.datetime.combine(dia, datetime.time(settings.CITA_HORA_INICIO), zona)
+		cierre = datetime.datetime.combine(dia, datetime.time(settings.CITA_HORA_FIN), zona)
+		while inicio + duracion <= cierre:
+			fin = inicio + duracion
+			# Los intervalos que terminan antes de este horario tampoco afectan a los siguientes
+			while i < len(intervalos) and intervalos[i][1] <= inicio:
+				i += 1
+			if inicio >= ahora and not _choca(intervalos, i, inicio, fin):
+				libres.append({'inicio': inicio, 'fin': fin})
+			inicio += paso
+	return libres
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def crear_indice_fulltext(sender, using='default', **kwargs):
+    from django.db import connections
+    from .search import IndiceFullText
+
+    if connections[using].vendor == 'mysql':
+        IndiceFullText().asegurar_indice(using)
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(crear_indice_fulltext, sender=self)
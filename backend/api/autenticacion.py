@@ -0,0 +1,94 @@
+"""
+Autenticación JWT contra el modelo Usuario (con su Rol) usando una caché en memoria.
+
+Los tokens se emiten con ``RefreshToken.for_user(usuario)``, así que su ``user_id`` es el id
+de un Usuario (no de ``auth.User``). ``UsuarioJWTAuthentication`` valida la firma como
+simplejwt y resuelve el Usuario desde una caché por proceso de vida corta
+(``AUTH_USUARIO_CACHE_SEGUNDOS``): las peticiones autenticadas dejan de consultar la BD
+por el usuario en cada llamada.
+
+Las señales de Usuario (y de Rol) descartan las entradas al guardar o eliminar, así que
+desactivar a un usuario con ``activo=False`` surte efecto de inmediato en este proceso y,
+en los demás workers, como mucho cuando vence la entrada. ``QuerySet.update()`` no emite
+señales: quien desactive usuarios en bloque debe llamar a ``usuarios.limpiar()``.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+
+class CacheUsuarios:
+	"""Usuarios (con ``rol`` cargado) por id durante ``ttl`` segundos, acotada (LRU).
+
+	Devuelve copias para que una petición que modifique ``request.user`` no afecte a otras.
+	"""
+
+	def __init__(self, ttl=None, max_entradas=1024):
+		self.ttl = ttl
+		self.max_entradas = max_entradas
+		self._datos = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _vigencia(self):
+		return self.ttl if self.ttl is not None else settings.AUTH_USUARIO_CACHE_SEGUNDOS
+
+	def get(self, usuario_id):
+		"""Usuario ``usuario_id`` o None si no existe (una consulta solo si no está en caché)."""
+		ahora = time.monotonic()
+		with self._lock:
+			entrada = self._datos.get(usuario_id)
+			if entrada is not None and entrada[0] > ahora:
+				self._datos.move_to_end(usuario_id)
+				return copy.copy(entrada[1])
+
+		usuario = Usuario.objects.select_related('rol').filter(pk=usuario_id).first()
+		if usuario is not None:
+			with self._lock:
+				self._datos[usuario_id] = (ahora + self._vigencia(), usuario)
+				self._datos.move_to_end(usuario_id)
+				while len(self._datos) > self.max_entradas:
+					self._datos.popitem(last=False)
+			usuario = copy.copy(usuario)
+		return usuario
+
+	def descartar(self, usuario_id):
+		with self._lock:
+			self._datos.pop(usuario_id, None)
+
+	def limpiar(self):
+		with self._lock:
+			self._datos.clear()
+
+
+usuarios = CacheUsuarios()
+
+
+def usuario_activo(usuario_id):
+	usuario = usuarios.get(usuario_id)
+	return usuario if usuario is not None and usuario.activo else None
+
+
+class UsuarioJWTAuthentication(JWTAuthentication):
+	"""JWTAuthentication de simplejwt que resuelve ``request.user`` como Usuario desde la caché."""
+
+	def get_user(self, validated_token):
+		try:
+			usuario_id = int(validated_token[api_settings.USER_ID_CLAIM])
+		except (KeyError, TypeError, ValueError):
+			raise InvalidToken('El token no identifica a un usuario')
+
+		usuario = usuarios.get(usuario_id)
+		if usuario is None:
+			raise AuthenticationFailed('Usuario no encontrado', code='user_not_found')
+		if not usuario.activo:
+			raise AuthenticationFailed('Usuario inactivo', code='user_inactive')
+		return usuario
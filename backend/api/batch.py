@@ -0,0 +1,153 @@
+"""
+Alta y actualización de inmuebles por lotes (POST /api/inmuebles/batch/).
+
+Cada elemento se valida con InmuebleLoteSerializer, pero las llaves foráneas se resuelven
+contra mapas cargados con una consulta por modelo relacionado y la unicidad de
+``codigo_referencia`` se comprueba con una sola consulta para todo el lote. Los elementos
+válidos se escriben en una transacción con ``bulk_create``/``bulk_update``; los inválidos
+se reportan por índice sin detener al resto.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import estadisticas, geo
+from .models import Inmueble, Municipio, TipoInmueble, Usuario
+from .serializers import InmuebleLoteSerializer
+from .signals import inmuebles_guardados_en_bloque
+
+# Campo del payload -> modelo al que apunta
+RELACIONES = {
+	'tipo_inmueble_id': TipoInmueble,
+	'municipio_id': Municipio,
+	'propietario_id': Usuario,
+}
+
+
+def _pk(modelo, valor):
+	"""``valor`` convertido al tipo de la pk de ``modelo``, o None si no es válido."""
+	if valor is None or isinstance(valor, bool):
+		return None
+	try:
+		return modelo._meta.pk.to_python(valor)
+	except (TypeError, ValueError, ValidationError):
+		return None
+
+
+def precargar(items):
+	"""Un mapa pk -> instancia por modelo relacionado, con una consulta por modelo."""
+	preloaded = {}
+	for campo, modelo in RELACIONES.items():
+		pks = {_pk(modelo, item.get(campo)) for item in items if isinstance(item, dict)}
+		pks.discard(None)
+		preloaded[modelo] = modelo.objects.in_bulk(pks) if pks else {}
+	return preloaded
+
+
+def _resultado(indice, estado, **extra):
+	return {'index': indice, 'status': estado, **extra}
+
+
+def procesar_lote(items, context=None):
+	"""Valida y guarda ``items`` (dicts; con ``id`` se actualiza, sin él se crea).
+
+	Devuelve un resultado por elemento, en el mismo orden: ``created``/``updated`` con el
+	``id`` guardado, o ``error`` con los errores de validación.
+	"""
+	context = dict(context or {}, preloaded=precargar(items))
+	resultados = [None] * len(items)
+
+	ids = {_pk(Inmueble, item.get('id')) for item in items if isinstance(item, dict)}
+	ids.discard(None)
+	instancias = Inmueble.objects.in_bulk(ids) if ids else {}
+
+	validos = []
+	for indice, item in enumerate(items):
+		if not isinstance(item, dict):
+			resultados[indice] = _resultado(indice, 'error', errors={'non_field_errors': ['Se esperaba un objeto.']})
+			continue
+		if item.get('id') is not None:
+			instancia = instancias.get(_pk(Inmueble, item['id']))
+			if instancia is None:
+				resultados[indice] = _resultado(indice, 'error', errors={'id': ['No existe un inmueble con este id.']})
+				continue
+			serializer = InmuebleLoteSerializer(instancia, data=item, partial=True, context=context)
+		else:
+			serializer = InmuebleLoteSerializer(data=item, context=context)
+		if serializer.is_valid():
+			validos.append((indice, serializer))
+		else:
+			resultados[indice] = _resultado(indice, 'error', errors=serializer.errors)
+
+	validos = _verificar_codigos(validos, resultados)
+
+	nuevos, cambiados, campos = [], [], set()
+	for indice, serializer in validos:
+		datos = serializer.validated_data
+		if serializer.instance is None:
+			inmueble = Inmueble(**datos)
+			inmueble.geohash = geo.geohash_de(inmueble)
+			nuevos.append((indice, inmueble))
+		else:
+			for campo, valor in datos.items():
+				setattr(serializer.instance, campo, valor)
+			campos.update(datos)
+			if 'latitud' in datos or 'longitud' in datos:
+				# Lo que haría la señal pre_save asignar_geohash
+				serializer.instance.geohash = geo.geohash_de(serializer.instance)
+				campos.add('geohash')
+			cambiados.append((indice, serializer.instance))
+
+	with transaction.atomic():
+		Inmueble.objects.bulk_create([inmueble for _, inmueble in nuevos])
+		# bulk_update no emite señales: lo que aportaban a las estadísticas se toma antes
+		anteriores = estadisticas.aportes([inmueble.pk for _, inmueble in cambiados])
+		if cambiados and campos:
+			Inmueble.objects.bulk_update([inmueble for _, inmueble in cambiados], sorted(campos))
+
+		# MySQL no devuelve los ids generados por bulk_create: se leen por código
+		if any(inmueble.pk is None for _, inmueble in nuevos):
+			por_codigo = dict(
+				Inmueble.objects.filter(codigo_referencia__in=[i.codigo_referencia for _, i in nuevos])
+				.values_list('codigo_referencia', 'id')
+			)
+			for _, inmueble in nuevos:
+				inmueble.pk = por_codigo[inmueble.codigo_referencia]
+
+		# bulk_create/bulk_update no emiten señales
+		tocados = [inmueble.pk for _, inmueble in nuevos + cambiados]
+		if tocados:
+			inmuebles_guardados_en_bloque(Inmueble.objects.filter(pk__in=tocados))
+			estadisticas.aplicar(anteriores, estadisticas.aportes(tocados))
+
+	for estado, guardados in (('created', nuevos), ('updated', cambiados)):
+		for indice, inmueble in guardados:
+			resultados[indice] = _resultado(
+				indice, estado, id=inmueble.pk, codigo_referencia=inmueble.codigo_referencia
+			)
+	return resultados
+
+
+def _verificar_codigos(validos, resultados):
+	"""Descarta (con error) los elementos cuyo codigo_referencia ya usa otro inmueble o se
+	repite dentro del lote. Una sola consulta para todo el lote."""
+	codigos = {
+		serializer.validated_data['codigo_referencia']
+		for _, serializer in validos if 'codigo_referencia' in serializer.validated_data
+	}
+	existentes = dict(
+		Inmueble.objects.filter(codigo_referencia__in=codigos).values_list('codigo_referencia', 'id')
+	) if codigos else {}
+
+	vistos, aceptados = set(), []
+	for indice, serializer in validos:
+		codigo = serializer.validated_data.get('codigo_referencia')
+		propio = serializer.instance.pk if serializer.instance is not None else None
+		if codigo is not None and (codigo in vistos or existentes.get(codigo, propio) != propio):
+			resultados[indice] = _resultado(
+				indice, 'error', errors={'codigo_referencia': ['Ya existe un inmueble con este código de referencia.']}
+			)
+			continue
+		if codigo is not None:
+			vistos.add(codigo)
+		aceptados.append((indice, serializer))
+	return aceptados
@@ -0,0 +1,112 @@
+"""
+Caché de respuestas con invalidación por versión.
+
+Cada espacio (p. ej. 'casas_publicas') tiene un número de versión y las claves de las
+respuestas lo incluyen. Invalidar es incrementar la versión: las entradas viejas dejan de
+ser alcanzables y expiran solas, sin tener que enumerarlas.
+
+Las versiones se guardan en la BD (``VersionCache``), que ven todos los workers, y cada
+proceso las lee a través de la caché de Django durante ``CACHE_VERSION_SEGUNDOS``. Con
+``REDIS_URL`` la invalidación se ve al instante en todos; con la caché por proceso
+(LocMemCache) los demás workers la ven como mucho ese número de segundos después.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersionCache
+
+# Espacios de caché
+CASAS_PUBLICAS = 'casas_publicas'
+REFERENCIA = 'referencia'
+
+
+def calendario(usuario_id):
+	"""Espacio del calendario ICS de un usuario (ver api/calendario.py)."""
+	return f'calendario:{usuario_id}'
+
+
+def _clave_version(espacio):
+	return f'version:{espacio}'
+
+
+def _leer(espacio):
+	"""(versión, momento epoch de la última invalidación) del espacio."""
+	clave = _clave_version(espacio)
+	valor = cache.get(clave)
+	if valor is None:
+		ahora = timezone.now()
+		# Arranca en un valor basado en el reloj para no reutilizar claves de una BD anterior
+		fila, _ = VersionCache.objects.get_or_create(
+			espacio=espacio, defaults={'version': int(ahora.timestamp() * 1000), 'modificado': ahora}
+		)
+		valor = (fila.version, int(fila.modificado.timestamp()))
+		cache.set(clave, valor, timeout=settings.CACHE_VERSION_SEGUNDOS)
+	return valor
+
+
+def version(espacio):
+	"""Versión actual del espacio."""
+	return _leer(espacio)[0]
+
+
+def modificado(espacio):
+	"""Momento (epoch) de la última invalidación del espacio, para ``Last-Modified``."""
+	return _leer(espacio)[1]
+
+
+def invalidar(*espacios):
+	"""Incrementa la versión de los espacios cuando la transacción actual confirma."""
+	def incrementar():
+		# Un espacio sin fila todavía no se ha leído: no hay nada que invalidar
+		VersionCache.objects.filter(espacio__in=espacios).update(version=F('version') + 1, modificado=timezone.now())
+		cache.delete_many([_clave_version(espacio) for espacio in espacios])
+	if espacios:
+		transaction.on_commit(incrementar)
+
+
+def clave(espacio, *partes):
+	"""Clave versionada; las partes se resumen para respetar los límites de longitud."""
+	resumen = hashlib.md5('|'.join(str(p) for p in partes).encode('utf-8')).hexdigest()
+	return f'{espacio}:{version(espacio)}:{resumen}'
+
+
+class MemoriaVersionada:
+	"""Caché en la memoria del proceso cuyas entradas valen mientras no cambie la versión
+	(compartida, ver arriba) de su espacio. Acotada en número de entradas (LRU)."""
+
+	def __init__(self, max_entradas=512):
+		self.max_entradas = max_entradas
+		self._datos = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, espacio, version_actual, clave):
+		with self._lock:
+			entrada = self._datos.get((espacio, clave))
+			if entrada is None:
+				return None
+			if entrada[0] != version_actual:
+				del self._datos[(espacio, clave)]
+				return None
+			self._datos.move_to_end((espacio, clave))
+			return entrada[1]
+
+	def set(self, espacio, version_actual, clave, valor):
+		with self._lock:
+			self._datos[(espacio, clave)] = (version_actual, valor)
+			self._datos.move_to_end((espacio, clave))
+			while len(self._datos) > self.max_entradas:
+				self._datos.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._datos.clear()
+
+
+memoria = MemoriaVersionada()
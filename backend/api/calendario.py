@@ -0,0 +1,142 @@
+"""
+Calendario iCalendar (ICS) de las citas de un usuario (GET /api/citas/calendario.ics).
+
+Los clientes de calendario no envían el JWT: la URL lleva un token firmado con
+``SECRET_KEY`` con el id del usuario y su ``clave_calendario`` (``GET /api/citas/calendario/``
+devuelve la URL del usuario autenticado; ``POST`` cambia la clave y revoca las anteriores).
+El token se comprueba contra el usuario de la caché de autenticación, así que un usuario
+desactivado deja de recibir el calendario sin que cada consulta toque la BD.
+
+Cada usuario tiene su espacio en la caché versionada (api/cache.py) que las señales
+invalidan al guardar o eliminar una de sus citas o al cambiar un inmueble con citas suyas.
+El ETag se arma con esa versión y el día de la ventana, así que una consulta periódica sin
+cambios se responde con 304 sin tocar la BD. Si cambió algo, las citas de la ventana
+(``CALENDARIO_DIAS_ATRAS`` días atrás, ``CALENDARIO_DIAS_ADELANTE`` adelante) se leen con
+una consulta por índice y se envían en streaming.
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+
+from . import autenticacion
+from .export import fragmentos
+from .models import Cita
+
+SAL = 'api.calendario'
+
+TAMANO_LOTE = 500
+
+ESTATUS_ICS = {
+	'Programada': 'CONFIRMED',
+	'Completada': 'CONFIRMED',
+	'Cancelada': 'CANCELLED',
+}
+
+
+def token_de(usuario):
+	return signing.Signer(salt=SAL).sign(f'{usuario.pk}:{usuario.clave_calendario}')
+
+
+def usuario_de(token):
+	"""Id del usuario activo del token, o None si la firma no es válida o la clave cambió."""
+	try:
+		usuario_id, clave = signing.Signer(salt=SAL).unsign(token or '').split(':', 1)
+		usuario = autenticacion.usuario_activo(int(usuario_id))
+	except (signing.BadSignature, ValueError):
+		return None
+	if usuario is None or not constant_time_compare(clave, usuario.clave_calendario):
+		return None
+	return usuario.pk
+
+
+def ventana(hoy):
+	"""[desde, hasta) alrededor de la fecha ``hoy``, en la zona de la agenda."""
+	zona = ZoneInfo(settings.CITA_ZONA_HORARIA)
+	desde = hoy - datetime.timedelta(days=settings.CALENDARIO_DIAS_ATRAS)
+	hasta = hoy + datetime.timedelta(days=settings.CALENDARIO_DIAS_ADELANTE + 1)
+	return (
+		datetime.datetime.combine(desde, datetime.time(), zona),
+		datetime.datetime.combine(hasta, datetime.time(), zona),
+	)
+
+
+def _escapar(texto):
+	return (
+		(texto or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+		.replace('\r\n', '\\n').replace('\n', '\\n')
+	)
+
+
+def _plegar(linea):
+	"""Corta en líneas de 75 octetos como pide RFC 5545 (sin partir caracteres UTF-8)."""
+	partes, actual, tamano = [], '', 0
+	for caracter in linea:
+		octetos = len(caracter.encode('utf-8'))
+		if tamano + octetos > 75:
+			partes.append(actual)
+			actual, tamano = ' ', 1
+		actual += caracter
+		tamano += octetos
+	partes.append(actual)
+	return '\r\n'.join(partes) + '\r\n'
+
+
+def _fecha(valor):
+	return valor.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+COLUMNAS = [
+	'id', 'fecha_hora_cita', 'fecha_fin_cita', 'duracion_minutos', 'estatus_cita', 'observaciones',
+	'fecha_actualizacion', 'inmueble__codigo_referencia', 'inmueble__titulo_publicacion',
+	'inmueble__direccion_exacta',
+]
+
+
+def citas(usuario_id, desde, hasta):
+	"""Citas del usuario (como interesado o propietario) en la ventana, por fecha.
+
+	Un UNION de dos rangos, cada uno sobre su índice, en lugar de un OR que obligaría a
+	recorrer la tabla.
+	"""
+	rango = Cita.objects.filter(fecha_hora_cita__gte=desde, fecha_hora_cita__lt=hasta)
+	interesado = rango.filter(usuario_interesado_id=usuario_id).values_list(*COLUMNAS)
+	propietario = rango.filter(usuario_propietario_id=usuario_id).values_list(*COLUMNAS)
+	return interesado.union(propietario).order_by('fecha_hora_cita', 'id')
+
+
+def lineas(usuario_id, desde, hasta):
+	yield 'BEGIN:VCALENDAR\r\n'
+	yield 'VERSION:2.0\r\n'
+	yield 'PRODID:-//Inmuebles//Citas//ES\r\n'
+	yield 'CALSCALE:GREGORIAN\r\n'
+	yield 'METHOD:PUBLISH\r\n'
+	yield 'X-WR-CALNAME:Visitas\r\n'
+	for fila in citas(usuario_id, desde, hasta).iterator(chunk_size=TAMANO_LOTE):
+		cita = dict(zip(COLUMNAS, fila))
+		# Citas anteriores a fecha_fin_cita que completar_fin_citas aún no ha procesado
+		fin = cita['fecha_fin_cita'] or cita['fecha_hora_cita'] + datetime.timedelta(minutes=cita['duracion_minutos'])
+		titulo = cita['inmueble__titulo_publicacion'] or 'Inmueble'
+		descripcion = cita['observaciones'] or ''
+		if cita['inmueble__codigo_referencia']:
+			descripcion = f"Ref. {cita['inmueble__codigo_referencia']}\n{descripcion}".strip()
+		yield 'BEGIN:VEVENT\r\n'
+		yield f"UID:cita-{cita['id']}@inmuebles\r\n"
+		yield f"DTSTAMP:{_fecha(cita['fecha_actualizacion'])}\r\n"
+		yield f"DTSTART:{_fecha(cita['fecha_hora_cita'])}\r\n"
+		yield f'DTEND:{_fecha(fin)}\r\n'
+		yield _plegar(f'SUMMARY:Visita: {_escapar(titulo)}')
+		if cita['inmueble__direccion_exacta']:
+			yield _plegar(f"LOCATION:{_escapar(cita['inmueble__direccion_exacta'])}")
+		if descripcion:
+			yield _plegar(f'DESCRIPTION:{_escapar(descripcion)}')
+		yield f"STATUS:{ESTATUS_ICS.get(cita['estatus_cita'], 'TENTATIVE')}\r\n"
+		yield 'END:VEVENT\r\n'
+	yield 'END:VCALENDAR\r\n'
+
+
+def exportar(usuario_id, desde, hasta):
+	"""Iterador de bytes con el calendario, en fragmentos (ver export.fragmentos)."""
+	return fragmentos(lineas(usuario_id, desde, hasta))
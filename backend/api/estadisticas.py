@@ -0,0 +1,209 @@
+"""
+Estadísticas de mercado precalculadas por (municipio, tipo de inmueble).
+
+Las sumas y conteos de cada grupo se mantienen al escribir: las señales (y las escrituras
+en bloque) toman con ``aportes`` lo que sumaban los inmuebles afectados antes y después
+del cambio y ``aplicar`` suma la diferencia con un UPDATE por grupo. El coste depende de
+las filas escritas, no del tamaño del grupo, y la API lee las filas de EstadisticaMercado.
+
+Las medianas no se pueden mantener así: las calcula ``recalcular`` (``manage.py
+recalcular_estadisticas``, pensado para cron), que además reescribe las sumas desde cero.
+
+Solo cuentan los inmuebles publicados (``estatus_moderacion='Aprobado'``): los pendientes y
+rechazados no están en el mercado. Aprobar o rechazar también mueve las sumas (ver
+``api/moderacion.py``).
+
+Las sumas y conteos se pueden combinar entre grupos (p. ej. para agrupar solo por
+municipio); las medianas no, y por eso solo se informan por grupo (municipio, tipo).
+Los cierres solo consideran operaciones en ``MONEDA``, la moneda de los precios publicados.
+"""
+import statistics
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q, QuerySet, Sum
+from django.utils import timezone
+
+from .models import EstadisticaMercado, Inmueble, Operacion
+
+MONEDA = 'USD'
+
+# Estatus de moderación de los inmuebles que cuentan (los publicados)
+APROBADO = 'Aprobado'
+
+# Estatus de venta que cuentan como "en el mercado"
+ESTATUS_ACTIVOS = ('Disponible', 'Reservado')
+
+CENTAVOS = Decimal('0.01')
+
+CAMPOS_SUMABLES = [
+	'inmuebles', 'suma_precio', 'con_superficie', 'suma_precio_m2', 'activos',
+	'suma_publicacion_activos', 'cerrados', 'suma_dias_cierre', 'operaciones', 'suma_monto_cierre',
+]
+
+
+def _igual(campo, valor):
+	return Q(**{f'{campo}__isnull': True}) if valor is None else Q(**{campo: valor})
+
+
+def _filtro_grupos(grupos):
+	"""Condición que selecciona exactamente los pares de ``grupos`` (None = sin municipio/tipo)."""
+	condicion = Q()
+	for municipio_id, tipo_id in grupos:
+		condicion |= _igual('municipio_id', municipio_id) & _igual('tipo_inmueble_id', tipo_id)
+	return condicion
+
+
+def _mediana(valores):
+	return Decimal(statistics.median(valores)).quantize(CENTAVOS) if valores else None
+
+
+def _con_operaciones(inmuebles):
+	"""``inmuebles`` con el número, la suma y la primera fecha de sus operaciones en MONEDA."""
+	en_moneda = Q(operaciones__moneda_cierre=MONEDA)
+	return inmuebles.annotate(
+		n_operaciones=Count('operaciones', filter=en_moneda),
+		suma_operaciones=Sum('operaciones__monto_final', filter=en_moneda),
+		primer_cierre=Min('operaciones__fecha_operacion', filter=en_moneda),
+	).values_list(
+		'municipio_id', 'tipo_inmueble_id', 'precio', 'superficie_construccion', 'estatus_venta',
+		'fecha_publicacion', 'n_operaciones', 'suma_operaciones', 'primer_cierre',
+	)
+
+
+def _aporte(precio, superficie, estatus, fecha_publicacion, n_operaciones, suma_operaciones, primer_cierre):
+	"""Lo que suma un inmueble (con sus operaciones) a cada campo de su grupo."""
+	aporte = dict.fromkeys(CAMPOS_SUMABLES, 0)
+	aporte.update(inmuebles=1, suma_precio=precio, operaciones=n_operaciones, suma_monto_cierre=suma_operaciones or 0)
+	if superficie:
+		aporte.update(con_superficie=1, suma_precio_m2=(precio / superficie).quantize(CENTAVOS))
+	if estatus in ESTATUS_ACTIVOS:
+		aporte.update(activos=1, suma_publicacion_activos=fecha_publicacion.timestamp())
+	elif primer_cierre is not None:
+		# Días hasta la primera operación de un inmueble que ya salió del mercado
+		dias = (primer_cierre - timezone.localtime(fecha_publicacion).date()).days
+		aporte.update(cerrados=1, suma_dias_cierre=max(dias, 0))
+	return aporte
+
+
+def aportes(inmuebles):
+	"""{grupo: {campo: suma}} de lo que aportan ``inmuebles`` (ids o queryset); una consulta."""
+	if not isinstance(inmuebles, QuerySet):
+		inmuebles = set(inmuebles) - {None}
+		if not inmuebles:
+			return {}
+	grupos = defaultdict(lambda: dict.fromkeys(CAMPOS_SUMABLES, 0))
+	publicados = Inmueble.objects.filter(pk__in=inmuebles, estatus_moderacion=APROBADO)
+	for municipio_id, tipo_id, *valores in _con_operaciones(publicados):
+		suma = grupos[(municipio_id, tipo_id)]
+		for campo, valor in _aporte(*valores).items():
+			suma[campo] += valor
+	return dict(grupos)
+
+
+def aplicar(antes, despues):
+	"""Suma a las filas de EstadisticaMercado la diferencia entre dos resultados de ``aportes``."""
+	ahora = timezone.now()
+	for grupo in set(antes) | set(despues):
+		delta = {
+			campo: despues.get(grupo, {}).get(campo, 0) - antes.get(grupo, {}).get(campo, 0)
+			for campo in CAMPOS_SUMABLES
+		}
+		cambios = {campo: F(campo) + valor for campo, valor in delta.items() if valor}
+		if not cambios:
+			continue
+		filas = EstadisticaMercado.objects.filter(_filtro_grupos([grupo]))
+		if not filas.update(actualizado=ahora, **cambios) and delta['inmuebles'] > 0:
+			try:
+				with transaction.atomic():
+					EstadisticaMercado.objects.create(municipio_id=grupo[0], tipo_inmueble_id=grupo[1], **delta)
+			except IntegrityError:
+				# Otro proceso creó la fila entre el UPDATE y el INSERT
+				filas.update(actualizado=ahora, **cambios)
+		if delta['inmuebles'] < 0:
+			filas.filter(inmuebles=0, operaciones=0).delete()
+
+
+def recalcular(grupos=None):
+	"""Reescribe desde cero las filas de ``grupos`` (pares (municipio_id, tipo_inmueble_id)),
+	medianas incluidas; todas si es None.
+
+	Devuelve el número de grupos con datos.
+	"""
+	if grupos is not None:
+		grupos = set(grupos)
+		if not grupos:
+			return 0
+		inmuebles = Inmueble.objects.filter(_filtro_grupos(grupos), estatus_moderacion=APROBADO)
+	else:
+		inmuebles = Inmueble.objects.filter(estatus_moderacion=APROBADO)
+
+	sumas = defaultdict(lambda: dict.fromkeys(CAMPOS_SUMABLES, 0))
+	precios = defaultdict(list)
+	for municipio_id, tipo_id, *valores in _con_operaciones(inmuebles).iterator():
+		grupo = (municipio_id, tipo_id)
+		for campo, valor in _aporte(*valores).items():
+			sumas[grupo][campo] += valor
+		precios[grupo].append(valores[0])
+
+	montos = defaultdict(list)
+	for municipio_id, tipo_id, monto in (
+		Operacion.objects.filter(inmueble__in=inmuebles, moneda_cierre=MONEDA)
+		.values_list('inmueble__municipio_id', 'inmueble__tipo_inmueble_id', 'monto_final')
+		.iterator()
+	):
+		montos[(municipio_id, tipo_id)].append(monto)
+
+	estadisticas = [
+		EstadisticaMercado(
+			municipio_id=municipio_id,
+			tipo_inmueble_id=tipo_id,
+			precio_mediana=_mediana(precios[(municipio_id, tipo_id)]),
+			monto_cierre_mediana=_mediana(montos[(municipio_id, tipo_id)]),
+			**suma,
+		)
+		for (municipio_id, tipo_id), suma in sumas.items()
+	]
+
+	with transaction.atomic():
+		anteriores = EstadisticaMercado.objects.all()
+		if grupos is not None:
+			anteriores = anteriores.filter(_filtro_grupos(grupos))
+		anteriores.delete()
+		EstadisticaMercado.objects.bulk_create(estadisticas)
+	return len(estadisticas)
+
+
+def _promedio(suma, n):
+	return round(float(suma) / n, 2) if n else None
+
+
+def resumen(estadistica, ahora=None):
+	"""Valores derivados de una fila (o de la combinación de varias, ver ``combinar``)."""
+	ahora = ahora if ahora is not None else time.time()
+	en_mercado = estadistica.activos + estadistica.cerrados
+	dias = None
+	if en_mercado:
+		dias_activos = (estadistica.activos * ahora - estadistica.suma_publicacion_activos) / 86400
+		dias = round((dias_activos + estadistica.suma_dias_cierre) / en_mercado, 1)
+	return {
+		'inmuebles': estadistica.inmuebles,
+		'precio_promedio': _promedio(estadistica.suma_precio, estadistica.inmuebles),
+		'precio_mediana': float(estadistica.precio_mediana) if estadistica.precio_mediana is not None else None,
+		'precio_m2_promedio': _promedio(estadistica.suma_precio_m2, estadistica.con_superficie),
+		'dias_en_mercado_promedio': dias,
+		'operaciones': estadistica.operaciones,
+		'monto_cierre_promedio': _promedio(estadistica.suma_monto_cierre, estadistica.operaciones),
+		'monto_cierre_mediana': float(estadistica.monto_cierre_mediana) if estadistica.monto_cierre_mediana is not None else None,
+	}
+
+
+def combinar(estadisticas):
+	"""Suma varias filas en una (sin medianas, que no se pueden combinar)."""
+	total = EstadisticaMercado()
+	for estadistica in estadisticas:
+		for campo in CAMPOS_SUMABLES:
+			setattr(total, campo, getattr(total, campo) + getattr(estadistica, campo))
+	return total
@@ -0,0 +1,105 @@
+"""
+Exportación en streaming (NDJSON o CSV) de inmuebles y operaciones.
+
+Las filas se leen por lotes con paginación por clave (``id > último``) en lugar de un
+único SELECT: en MySQL el driver cargaría el resultado completo en memoria aunque se use
+``iterator()``. Así la memoria es constante sin importar el tamaño de la tabla y el primer
+lote sale en cuanto termina la primera consulta.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Inmueble, Operacion
+
+FORMATOS = {
+	'ndjson': 'application/x-ndjson',
+	'csv': 'text/csv',
+}
+
+TAMANO_LOTE = 2000
+
+# Bytes acumulados antes de entregar un fragmento a la respuesta
+TAMANO_FRAGMENTO = 64 * 1024
+
+COLUMNAS = {
+	'inmuebles': [
+		'id', 'codigo_referencia', 'titulo_publicacion', 'tipo_inmueble__nombre_tipo',
+		'municipio__nombre_municipio', 'municipio__ciudad__nombre_ciudad',
+		'municipio__ciudad__estado__nombre_estado', 'direccion_exacta', 'precio',
+		'superficie_terreno', 'superficie_construccion', 'habitaciones', 'banos',
+		'puestos_estacionamiento', 'ano_construccion', 'estatus_venta', 'estatus_moderacion',
+		'propietario_id', 'fecha_publicacion',
+	],
+	'operaciones': [
+		'id', 'inmueble_id', 'inmueble__codigo_referencia', 'usuario_vendedor_id',
+		'usuario_comprador_id', 'tipo_operacion', 'fecha_operacion', 'monto_final',
+		'moneda_cierre', 'notas',
+	],
+}
+
+MODELOS = {
+	'inmuebles': Inmueble,
+	'operaciones': Operacion,
+}
+
+
+def filas(queryset, columnas, tamano_lote=TAMANO_LOTE):
+	"""Genera dicts con ``columnas`` recorriendo ``queryset`` por lotes ordenados por id."""
+	queryset = queryset.prefetch_related(None).order_by('pk').values(*columnas)
+	ultimo_id = None
+	while True:
+		lote = queryset if ultimo_id is None else queryset.filter(pk__gt=ultimo_id)
+		lote = list(lote[:tamano_lote])
+		if not lote:
+			return
+		yield from lote
+		ultimo_id = lote[-1]['id']
+
+
+class _Eco:
+	"""Pseudo-archivo para csv.writer: devuelve lo escrito en vez de guardarlo."""
+	def write(self, valor):
+		return valor
+
+
+def lineas(filas_iter, columnas, formato):
+	if formato == 'csv':
+		writer = csv.writer(_Eco())
+		yield writer.writerow(columnas)
+		for fila in filas_iter:
+			yield writer.writerow([fila[c] for c in columnas])
+	else:
+		for fila in filas_iter:
+			yield json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def fragmentos(lineas_iter, tamano=TAMANO_FRAGMENTO):
+	"""Agrupa líneas en fragmentos de ~``tamano`` bytes para no escribir fila a fila."""
+	partes, acumulado = [], 0
+	for linea in lineas_iter:
+		linea = linea.encode('utf-8')
+		partes.append(linea)
+		acumulado += len(linea)
+		if acumulado >= tamano:
+			yield b''.join(partes)
+			partes, acumulado = [], 0
+	if partes:
+		yield b''.join(partes)
+
+
+def exportar(nombre, queryset=None, formato='ndjson', tamano_lote=TAMANO_LOTE):
+	"""Iterador de bytes con la exportación de ``nombre`` ('inmuebles' u 'operaciones')."""
+	if queryset is None:
+		queryset = MODELOS[nombre].objects.all()
+	columnas = COLUMNAS[nombre]
+	return fragmentos(lineas(filas(queryset, columnas, tamano_lote), columnas, formato))
+
+
+def respuesta_exportacion(nombre, queryset, formato):
+	response = StreamingHttpResponse(exportar(nombre, queryset, formato), content_type=FORMATOS[formato])
+	extension = 'csv' if formato == 'csv' else 'ndjson'
+	response['Content-Disposition'] = f'attachment; filename="{nombre}.{extension}"'
+	return response
@@ -0,0 +1,94 @@
+"""
+Facetas (conteos por opción de filtro) para la búsqueda de inmuebles.
+
+Se calculan en una sola consulta agrupada por (tipo, municipio, rango de precio, habitaciones);
+el número de grupos depende de la variedad del catálogo, no de su tamaño, y el resto se
+acumula en Python.
+"""
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+# Límites de los rangos de precio: [0, 50k), [50k, 100k), ... [500k, ∞); se reemplazan con
+# FACETAS_RANGOS_PRECIO, que se lee en cada petición
+RANGOS_PRECIO = [0, 50000, 100000, 200000, 500000]
+
+# Habitaciones a partir de este número se agrupan como "N+"
+MAX_HABITACIONES = 5
+
+
+def rangos_precio():
+	"""Lista de (desde, hasta) con hasta=None para el último rango."""
+	limites = list(getattr(settings, 'FACETAS_RANGOS_PRECIO', RANGOS_PRECIO))
+	return list(zip(limites, limites[1:] + [None]))
+
+
+def _expresion_rango(rangos):
+	casos = [
+		When(Q(precio__gte=desde) & Q(precio__lt=hasta), then=Value(i))
+		for i, (desde, hasta) in enumerate(rangos) if hasta is not None
+	]
+	return Case(*casos, default=Value(len(rangos) - 1), output_field=IntegerField())
+
+
+def _acumular(destino, clave, valores, n):
+	if clave not in destino:
+		destino[clave] = dict(valores, count=0)
+	destino[clave]['count'] += n
+
+
+def calcular_facetas(queryset):
+	"""Conteos por tipo_inmueble, ciudad, municipio, rango de precio y habitaciones para ``queryset``."""
+	rangos = rangos_precio()
+	filas = (
+		queryset
+		.order_by()
+		.values(
+			'tipo_inmueble_id', 'tipo_inmueble__nombre_tipo',
+			'municipio_id', 'municipio__nombre_municipio',
+			'municipio__ciudad_id', 'municipio__ciudad__nombre_ciudad',
+			'habitaciones',
+		)
+		.annotate(rango_precio=_expresion_rango(rangos), n=Count('id'))
+	)
+
+	tipos, ciudades, municipios, precios, habitaciones = {}, {}, {}, {}, {}
+	total = 0
+	for fila in filas:
+		n = fila['n']
+		total += n
+		_acumular(tipos, fila['tipo_inmueble_id'], {
+			'id': fila['tipo_inmueble_id'],
+			'nombre': fila['tipo_inmueble__nombre_tipo'],
+		}, n)
+		_acumular(ciudades, fila['municipio__ciudad_id'], {
+			'id': fila['municipio__ciudad_id'],
+			'nombre': fila['municipio__ciudad__nombre_ciudad'],
+		}, n)
+		_acumular(municipios, fila['municipio_id'], {
+			'id': fila['municipio_id'],
+			'nombre': fila['municipio__nombre_municipio'],
+			'ciudad_id': fila['municipio__ciudad_id'],
+		}, n)
+		precios[fila['rango_precio']] = precios.get(fila['rango_precio'], 0) + n
+		cuartos = min(fila['habitaciones'] or 0, MAX_HABITACIONES)
+		habitaciones[cuartos] = habitaciones.get(cuartos, 0) + n
+
+	por_conteo = lambda items: sorted(items, key=lambda item: (-item['count'], str(item['nombre'])))
+	return {
+		'total': total,
+		'tipo_inmueble': por_conteo(tipos.values()),
+		'ciudad': por_conteo(ciudades.values()),
+		'municipio': por_conteo(municipios.values()),
+		'precio': [
+			{'desde': desde, 'hasta': hasta, 'count': precios.get(i, 0)}
+			for i, (desde, hasta) in enumerate(rangos)
+		],
+		'habitaciones': [
+			{
+				'valor': cuartos,
+				'etiqueta': f'{cuartos}+' if cuartos == MAX_HABITACIONES else str(cuartos),
+				'count': habitaciones[cuartos],
+			}
+			for cuartos in sorted(habitaciones)
+		],
+	}
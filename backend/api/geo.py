@@ -0,0 +1,153 @@
+"""
+Búsqueda geográfica de inmuebles con un índice geohash (funciona igual en MySQL y SQLite).
+
+Cada inmueble con coordenadas guarda su geohash (ver la señal ``asignar_geohash``). Un
+rectángulo se cubre con unas pocas celdas geohash y cada celda es un rango sobre el índice
+``(geohash, latitud, longitud)``: la consulta lee solo las filas de esas celdas y descarta
+los bordes con la comparación exacta de coordenadas. El radio se resuelve como el
+rectángulo que lo contiene más la distancia haversine, que también sirve para ordenar.
+
+Con poco zoom, ``agrupar`` devuelve grupos por prefijo de geohash en lugar de marcadores.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import Avg, Count, FloatField, Min, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt, Substr
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Caracteres guardados por inmueble (~5 m de lado)
+PRECISION = 9
+
+# Máximo de celdas con que se cubre un rectángulo (una condición de rango por celda)
+MAX_CELDAS = 32
+
+# Por debajo de este zoom (escala de mapas web, 0-20) la búsqueda por bbox devuelve grupos
+ZOOM_AGRUPAR = getattr(settings, 'MAPA_ZOOM_AGRUPAR', 13)
+
+RADIO_TIERRA_KM = 6371.0
+KM_POR_GRADO = 111.32
+
+
+def codificar(lat, lng, precision=PRECISION):
+	"""Geohash de (lat, lng) con ``precision`` caracteres."""
+	rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+	resultado, bits, n, es_lng = [], 0, 0, True
+	while len(resultado) < precision:
+		rango, valor = (rango_lng, lng) if es_lng else (rango_lat, lat)
+		medio = (rango[0] + rango[1]) / 2
+		if valor >= medio:
+			bits, rango[0] = bits * 2 + 1, medio
+		else:
+			bits, rango[1] = bits * 2, medio
+		es_lng = not es_lng
+		n += 1
+		if n == 5:
+			resultado.append(BASE32[bits])
+			bits, n = 0, 0
+	return ''.join(resultado)
+
+
+def geohash_de(inmueble):
+	if inmueble.latitud is None or inmueble.longitud is None:
+		return None
+	return codificar(inmueble.latitud, inmueble.longitud)
+
+
+def _tamano_celda(precision):
+	"""(alto, ancho) en grados de una celda de ``precision`` caracteres."""
+	bits_lng = (5 * precision + 1) // 2
+	bits_lat = 5 * precision // 2
+	return 180.0 / 2 ** bits_lat, 360.0 / 2 ** bits_lng
+
+
+def _indices(desde, hasta, origen, tamano, maximo):
+	primero = min(int((desde - origen) // tamano), maximo - 1)
+	ultimo = min(int((hasta - origen) // tamano), maximo - 1)
+	return range(max(primero, 0), max(ultimo, 0) + 1)
+
+
+def celdas(min_lat, min_lng, max_lat, max_lng, max_celdas=MAX_CELDAS):
+	"""Prefijos geohash, lo más largos posible sin pasar de ``max_celdas``, que cubren el rectángulo."""
+	for precision in range(PRECISION, 0, -1):
+		alto, ancho = _tamano_celda(precision)
+		filas = _indices(min_lat, max_lat, -90.0, alto, round(180.0 / alto))
+		columnas = _indices(min_lng, max_lng, -180.0, ancho, round(360.0 / ancho))
+		if len(filas) * len(columnas) <= max_celdas or precision == 1:
+			return sorted({
+				codificar(-90.0 + (i + 0.5) * alto, -180.0 + (j + 0.5) * ancho, precision)
+				for i in filas for j in columnas
+			})
+
+
+def filtro_bbox(min_lat, min_lng, max_lat, max_lng):
+	# Igual que en search._prefijo: el rango [p, p + '{') equivale a "empieza por p" y usa
+	# el índice B-tree también en SQLite ('{' sigue a 'z', el último carácter del alfabeto).
+	prefijos = Q()
+	for prefijo in celdas(min_lat, min_lng, max_lat, max_lng):
+		prefijos |= Q(geohash__gte=prefijo, geohash__lt=prefijo + '{')
+	return prefijos & Q(
+		latitud__gte=min_lat, latitud__lte=max_lat, longitud__gte=min_lng, longitud__lte=max_lng
+	)
+
+
+def en_bbox(queryset, min_lat, min_lng, max_lat, max_lng):
+	"""Filtra ``queryset`` al rectángulo.
+
+	Los ids se resuelven en una subconsulta sobre el índice geohash: así el planificador
+	parte de las pocas filas del rectángulo en lugar de recorrer el índice del orden del
+	listado (fecha) filtrando fila por fila.
+	"""
+	dentro = queryset.model.objects.filter(filtro_bbox(min_lat, min_lng, max_lat, max_lng))
+	return queryset.filter(pk__in=dentro.values('pk'))
+
+
+def distancia_km(lat, lng):
+	"""Expresión con la distancia haversine (km) desde (lat, lng) a cada inmueble."""
+	lat0, lng0 = math.radians(lat), math.radians(lng)
+	a = (
+		Power(Sin((Radians('latitud') - Value(lat0)) / 2), 2)
+		+ Value(math.cos(lat0)) * Cos(Radians('latitud')) * Power(Sin((Radians('longitud') - Value(lng0)) / 2), 2)
+	)
+	return Value(2 * RADIO_TIERRA_KM) * ASin(Sqrt(Least(a, Value(1.0))), output_field=FloatField())
+
+
+def filtrar_radio(queryset, lat, lng, radio_km):
+	"""Inmuebles a ``radio_km`` o menos de (lat, lng), anotados con ``distancia_km``."""
+	dlat = radio_km / KM_POR_GRADO
+	dlng = radio_km / (KM_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6))
+	return (
+		en_bbox(queryset, max(lat - dlat, -90.0), max(lng - dlng, -180.0), min(lat + dlat, 90.0), min(lng + dlng, 180.0))
+		.annotate(distancia_km=distancia_km(lat, lng))
+		.filter(distancia_km__lte=radio_km)
+	)
+
+
+def precision_para_zoom(zoom):
+	"""Precisión cuyas celdas miden alrededor de un cuarto de tesela de mapa en ``zoom``."""
+	for precision in range(1, PRECISION + 1):
+		if (5 * precision + 1) // 2 >= zoom + 2:
+			return precision
+	return PRECISION
+
+
+def agrupar(queryset, precision):
+	"""Un grupo por celda de ``precision`` caracteres: centroide, total y el id si es uno solo."""
+	grupos = (
+		queryset
+		.order_by()
+		.values(celda=Substr('geohash', 1, precision))
+		.annotate(total=Count('id'), lat=Avg('latitud'), lng=Avg('longitud'), primero=Min('id'))
+		.order_by('-total', 'celda')
+	)
+	return [
+		{
+			'geohash': grupo['celda'],
+			'count': grupo['total'],
+			'lat': grupo['lat'],
+			'lng': grupo['lng'],
+			'id': grupo['primero'] if grupo['total'] == 1 else None,
+		}
+		for grupo in grupos
+	]
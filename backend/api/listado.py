@@ -0,0 +1,93 @@
+"""
+Mantenimiento del modelo de lectura InmuebleListado.
+
+Cada fila guarda la tarjeta del frontend ya armada (ubicación, imagen, características),
+de modo que /api/casas/ y /api/inmuebles/casas/ la leen de una sola tabla. Las señales de
+api/signals.py llaman a ``actualizar`` cuando cambia un inmueble o algo de lo que se copia
+en su tarjeta.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Inmueble, InmuebleCaracteristica, InmuebleListado
+
+TAMANO_LOTE = 1000
+
+# Imágenes de las casas importadas desde casas.json, por código de referencia
+IMAGENES_CASAS = {
+	'ICA-001-VAL': '/Imagenes/20241203200818056423000000-o.jpg',
+	'ICA-002-NAG': '/Imagenes/casa_en_venta_en_naguanagua_carabobo_243_m2_3_hab_5900001739233253971.jpg',
+	'ICA-003-SAN': '/Imagenes/IMG-20230322-WA0294.jpg',
+	'ICA-004-GUA': '/Imagenes/MIL20241116120235.jpg',
+	'ICA-005-PUE': '/Imagenes/las-casas-coloniales-del-casco-historico-de-puerto-cabello-parecen-contar-leyendas-ancestralesjpg-4768.jpg',
+	'ICA-006-LOS': '/Imagenes/ApartamentolosGuayos.png',
+	'ICA-007-LIB': '/Imagenes/TocuyitoTownhouse.png',
+	'ICA-008-DIE': '/Imagenes/CasaMariara.png',
+	'ICA-009-VAL': '/Imagenes/ApartamentoValencia.png',
+	'ICA-010-GUA': '/Imagenes/ApartamentoGuacara.png',
+	'ICA-011-SAN': '/Imagenes/CasaSanJoaquin.png',
+	'ICA-012-NAG': '/Imagenes/ApartamentoNaguanagua.png',
+	'ICA-013-PUE': '/Imagenes/CasaPuertoCabello.png',
+	'ICA-014-LOS': '/Imagenes/ApartamentolosGuayos2.png',
+	'ICA-015-LIB': '/Imagenes/TownhouseTocuyito.png',
+}
+IMAGEN_POR_DEFECTO = '/placeholder.svg?height=400&width=600&text=Casa'
+
+
+def proyectar(inmueble, caracteristicas):
+	"""La fila de InmuebleListado de ``inmueble`` (con ``municipio__ciudad`` cargado)."""
+	municipio = inmueble.municipio
+	ciudad = municipio.ciudad if municipio else None
+	return InmuebleListado(
+		inmueble_id=inmueble.pk,
+		titulo=inmueble.titulo_publicacion,
+		descripcion=inmueble.descripcion_publica or inmueble.titulo_publicacion,
+		precio=inmueble.precio or 0,
+		ubicacion=f"{ciudad.nombre_ciudad if ciudad else 'N/A'}, {municipio.nombre_municipio if municipio else 'N/A'}",
+		habitaciones=inmueble.habitaciones or 0,
+		banos=inmueble.banos or 0,
+		superficie=inmueble.superficie_construccion or 0,
+		imagen=IMAGENES_CASAS.get(inmueble.codigo_referencia, IMAGEN_POR_DEFECTO),
+		caracteristicas=caracteristicas,
+		ano_construccion=inmueble.ano_construccion,
+		estatus_moderacion=inmueble.estatus_moderacion,
+		fecha_publicacion=inmueble.fecha_publicacion,
+	)
+
+
+def actualizar(inmuebles):
+	"""Reescribe las filas de ``inmuebles`` con dos consultas para todo el grupo."""
+	inmuebles = list(inmuebles)
+	if not inmuebles:
+		return
+	caracteristicas = defaultdict(list)
+	for inmueble_id, nombre in (
+		InmuebleCaracteristica.objects.filter(inmueble__in=inmuebles)
+		.order_by('caracteristica__nombre_caracteristica')
+		.values_list('inmueble_id', 'caracteristica__nombre_caracteristica')
+	):
+		caracteristicas[inmueble_id].append(nombre)
+
+	with transaction.atomic():
+		InmuebleListado.objects.filter(inmueble__in=inmuebles).delete()
+		InmuebleListado.objects.bulk_create(
+			[proyectar(inmueble, caracteristicas[inmueble.pk]) for inmueble in inmuebles],
+			batch_size=TAMANO_LOTE
+		)
+
+
+def actualizar_queryset(queryset=None, tamano_lote=TAMANO_LOTE):
+	"""Reescribe por lotes las filas de ``queryset`` (todos los inmuebles por defecto)."""
+	if queryset is None:
+		queryset = Inmueble.objects.all()
+	queryset = queryset.select_related('municipio__ciudad').order_by('pk')
+	total = 0
+	ultimo_pk = 0
+	while True:
+		lote = list(queryset.filter(pk__gt=ultimo_pk)[:tamano_lote])
+		if not lote:
+			return total
+		actualizar(lote)
+		total += len(lote)
+		ultimo_pk = lote[-1].pk
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import agenda
+
+
+class Command(BaseCommand):
+    help = (
+        'Asigna fecha_fin_cita (fecha_hora_cita + duracion_minutos) a las citas que no la tienen. '
+        'Ejecutar después de la migración que agrega la columna; se puede repetir sin riesgo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=agenda.TAMANO_LOTE,
+                            help='Citas actualizadas por lote')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = agenda.completar_fines(options['batch_size'])
+        duracion = time.monotonic() - inicio
+
+        self.stdout.write(
+            self.style.SUCCESS(f'¡Citas completadas! {total} citas en {duracion:.1f}s.')
+        )
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import export
+
+
+class Command(BaseCommand):
+    help = 'Exporta inmuebles u operaciones en NDJSON o CSV con memoria constante'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(export.MODELOS))
+        parser.add_argument('--formato', choices=sorted(export.FORMATOS), default='ndjson')
+        parser.add_argument('--output', '-o', help='Archivo de salida (por defecto, la salida estándar)')
+        parser.add_argument('--batch-size', type=int, default=export.TAMANO_LOTE,
+                            help='Filas leídas por consulta')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = 0
+        salida = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for fragmento in export.exportar(options['modelo'], formato=options['formato'], tamano_lote=options['batch_size']):
+                salida.write(fragmento)
+                total += len(fragmento)
+        finally:
+            if options['output']:
+                salida.close()
+            else:
+                salida.flush()
+
+        if options['output']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'¡Exportación completada! {total / 1024:.0f} KB en {time.monotonic() - inicio:.1f}s -> {options["output"]}'
+                )
+            )
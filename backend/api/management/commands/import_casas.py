@@ -1,143 +1,125 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from decimal import Decimal
 import json
 import os
+import time
 from api.models import (
     Estado, Ciudad, Municipio, TipoInmueble, Inmueble, Usuario, Rol
 )
+from api import estadisticas
+from api.signals import inmuebles_guardados_en_bloque, referencia_modificada_en_bloque
+
+DEFAULT_JSON_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
+    '..', 'frontend', 'casas.json'
+)
+
+# Campos que --update compara y actualiza en inmuebles existentes
+CAMPOS_ACTUALIZABLES = [
+    'titulo_publicacion', 'descripcion_publica', 'tipo_inmueble_id', 'municipio_id',
+    'direccion_exacta', 'precio', 'superficie_terreno', 'superficie_construccion',
+    'habitaciones', 'banos',
+]
+
+CENTAVOS = Decimal('0.01')
+
+
+def iter_registros(archivo, tamano_lectura=1 << 16):
+    """Genera los objetos de un arreglo JSON (o de un archivo NDJSON) sin cargarlo completo."""
+    decoder = json.JSONDecoder()
+    buffer = archivo.read(tamano_lectura).lstrip()
+    if not buffer.startswith('['):
+        # NDJSON: un objeto por línea
+        archivo.seek(0)
+        for linea in archivo:
+            if linea.strip():
+                yield json.loads(linea)
+        return
+
+    pos = 1
+    eof = False
+    while True:
+        # Saltar espacios y separadores entre elementos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = archivo.read(tamano_lectura), 0
+            eof = not buffer
+        if pos >= len(buffer) or buffer[pos] == ']':
+            return
+        try:
+            registro, fin = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Objeto incompleto: leer más y reintentar
+            mas = archivo.read(tamano_lectura)
+            eof = not mas
+            buffer, pos = buffer[pos:] + mas, 0
+            continue
+        yield registro
+        buffer, pos = buffer[fin:], 0
+
+
+def lotes(iterable, tamano):
+    lote = []
+    for item in iterable:
+        lote.append(item)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def a_decimal(valor):
+    return Decimal(str(valor or 0)).quantize(CENTAVOS)
+
 
 class Command(BaseCommand):
-    help = 'Importa datos de casas desde casas.json'
+    help = 'Importa datos de casas desde casas.json (arreglo JSON o NDJSON) por lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=DEFAULT_JSON_PATH,
+                            help='Archivo a importar (por defecto frontend/casas.json)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Registros por lote (una transacción y un bulk_create por lote)')
+        parser.add_argument('--update', action='store_true',
+                            help='Actualizar los inmuebles existentes cuyos datos cambiaron')
 
     def handle(self, *args, **options):
-        # Ruta al archivo casas.json
-        json_file_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-            '..', 'frontend', 'casas.json'
-        )
-        
+        json_file_path = options['file']
+        batch_size = max(1, options['batch_size'])
+        self.actualizar = options['update']
+        self.stats = {'leidos': 0, 'creados': 0, 'actualizados': 0, 'sin_cambios': 0}
+
         try:
+            inicio = time.monotonic()
+            self.preparar()
+
             with open(json_file_path, 'r', encoding='utf-8') as file:
-                casas_data = json.load(file)
-            
-            # Filtrar solo los objetos válidos (ignorar comentarios)
-            casas_validas = [casa for casa in casas_data if isinstance(casa, dict) and 'id' in casa]
-            
-            self.stdout.write(f'Procesando {len(casas_validas)} propiedades...')
-            
-            with transaction.atomic():
-                # Obtener o crear el estado Carabobo
-                estado, created = Estado.objects.get_or_create(
-                    nombre_estado='Carabobo'
-                )
-                if created:
-                    self.stdout.write('✓ Estado Carabobo creado')
-                
-                # Obtener o crear roles
-                rol_propietario, created = Rol.objects.get_or_create(
-                    nombre_rol='Propietario'
-                )
-                if created:
-                    self.stdout.write('✓ Rol Propietario creado')
-                
-                # Obtener o crear tipos de inmueble
-                tipos_inmueble = {}
-                for casa in casas_validas:
-                    tipo_nombre = casa.get('tipo', 'Casa')
-                    if tipo_nombre not in tipos_inmueble:
-                        tipo_obj, created = TipoInmueble.objects.get_or_create(
-                            nombre_tipo=tipo_nombre,
-                            defaults={'descripcion': f'Inmueble tipo {tipo_nombre}'}
-                        )
-                        tipos_inmueble[tipo_nombre] = tipo_obj
-                        if created:
-                            self.stdout.write(f'✓ Tipo de inmueble {tipo_nombre} creado')
-                
-                # Obtener o crear ciudades y municipios
-                ubicaciones = {}
-                for casa in casas_validas:
-                    municipio_nombre = casa.get('municipio', 'Valencia')
-                    zona = casa.get('zona', 'Centro')
-                    
-                    if municipio_nombre not in ubicaciones:
-                        # Crear ciudad si no existe
-                        ciudad_nombre = municipio_nombre  # Asumimos que municipio = ciudad
-                        ciudad, created = Ciudad.objects.get_or_create(
-                            nombre_ciudad=ciudad_nombre,
-                            estado=estado
-                        )
-                        if created:
-                            self.stdout.write(f'✓ Ciudad {ciudad_nombre} creada')
-                        
-                        # Crear municipio
-                        municipio, created = Municipio.objects.get_or_create(
-                            nombre_municipio=municipio_nombre,
-                            ciudad=ciudad
-                        )
-                        if created:
-                            self.stdout.write(f'✓ Municipio {municipio_nombre} creado')
-                        
-                        ubicaciones[municipio_nombre] = municipio
-                
-                # Crear usuario propietario por defecto
-                propietario_default, created = Usuario.objects.get_or_create(
-                    email='propietario@ica.com',
-                    defaults={
-                        'nombres': 'Propietario',
-                        'apellidos': 'Default',
-                        'password_hash': 'default_password',
-                        'telefono': '0000-0000000',
-                        'cedula': 'V-00000000',
-                        'rol': rol_propietario,
-                        'activo': True
-                    }
-                )
-                if created:
-                    self.stdout.write('✓ Usuario propietario por defecto creado')
-                
-                # Crear inmuebles
-                inmuebles_creados = 0
-                for casa in casas_validas:
-                    # Generar código de referencia único
-                    codigo_ref = f"ICA-{casa['id']:03d}-{casa.get('municipio', 'VAL').upper()[:3]}"
-                    
-                    # Verificar si ya existe
-                    if Inmueble.objects.filter(codigo_referencia=codigo_ref).exists():
-                        self.stdout.write(f'⚠ Inmueble {codigo_ref} ya existe, saltando...')
-                        continue
-                    
-                    # Obtener datos
-                    municipio_nombre = casa.get('municipio', 'Valencia')
-                    tipo_nombre = casa.get('tipo', 'Casa')
-                    
-                    inmueble = Inmueble.objects.create(
-                        codigo_referencia=codigo_ref,
-                        titulo_publicacion=casa.get('descripcion', f'Propiedad en {municipio_nombre}'),
-                        descripcion_publica=casa.get('descripcion', ''),
-                        tipo_inmueble=tipos_inmueble.get(tipo_nombre),
-                        municipio=ubicaciones.get(municipio_nombre),
-                        direccion_exacta=casa.get('direccion', 'Dirección no especificada'),
-                        precio=float(casa.get('precio', 0)),
-                        superficie_terreno=float(casa.get('metros_cuadrados', 0)) * 1.2,  # Estimación
-                        superficie_construccion=float(casa.get('metros_cuadrados', 0)),
-                        habitaciones=casa.get('habitaciones', 0),
-                        banos=casa.get('banos', 0),
-                        puestos_estacionamiento=1,  # Valor por defecto
-                        ano_construccion=2020,  # Valor por defecto
-                        estatus_venta='Disponible',
-                        estatus_moderacion='Aprobado',
-                        propietario=propietario_default
-                    )
-                    
-                    inmuebles_creados += 1
-                    self.stdout.write(f'✓ Inmueble {codigo_ref} creado')
-                
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'¡Importación completada! {inmuebles_creados} inmuebles creados exitosamente.'
+                # Filtrar solo los objetos válidos (ignorar comentarios)
+                casas = (casa for casa in iter_registros(file) if isinstance(casa, dict) and 'id' in casa)
+                for lote in lotes(casas, batch_size):
+                    self.importar_lote(lote)
+                    duracion = time.monotonic() - inicio
+                    self.stdout.write(
+                        f'{self.stats["leidos"]} registros procesados '
+                        f'({self.stats["leidos"] / duracion:.0f} registros/s)'
                     )
+
+            duracion = time.monotonic() - inicio
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'¡Importación completada! {self.stats["creados"]} inmuebles creados, '
+                    f'{self.stats["actualizados"]} actualizados y {self.stats["sin_cambios"]} sin cambios '
+                    f'en {duracion:.1f}s ({self.stats["leidos"] / max(duracion, 1e-6):.0f} registros/s).'
                 )
-                
+            )
+
         except FileNotFoundError:
             self.stdout.write(
                 self.style.ERROR('No se encontró el archivo casas.json')
@@ -146,3 +128,149 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'Error durante la importación: {str(e)}')
             )
+
+    def preparar(self):
+        # Obtener o crear el estado Carabobo
+        self.estado, created = Estado.objects.get_or_create(
+            nombre_estado='Carabobo'
+        )
+        if created:
+            self.stdout.write('✓ Estado Carabobo creado')
+
+        # Obtener o crear roles
+        rol_propietario, created = Rol.objects.get_or_create(
+            nombre_rol='Propietario'
+        )
+        if created:
+            self.stdout.write('✓ Rol Propietario creado')
+
+        # Crear usuario propietario por defecto
+        self.propietario_default, created = Usuario.objects.get_or_create(
+            email='propietario@ica.com',
+            defaults={
+                'nombres': 'Propietario',
+                'apellidos': 'Default',
+                'password_hash': 'default_password',
+                'telefono': '0000-0000000',
+                'cedula': 'V-00000000',
+                'rol': rol_propietario,
+                'activo': True
+            }
+        )
+        if created:
+            self.stdout.write('✓ Usuario propietario por defecto creado')
+
+        # Cachés nombre -> id que se completan lote a lote
+        self.tipos = dict(TipoInmueble.objects.values_list('nombre_tipo', 'id'))
+        self.municipios = {
+            nombre: municipio_id
+            for nombre, ciudad_nombre, municipio_id in Municipio.objects.filter(ciudad__estado=self.estado)
+            .values_list('nombre_municipio', 'ciudad__nombre_ciudad', 'id')
+            if nombre == ciudad_nombre
+        }
+
+    def asegurar_tipos(self, nombres):
+        faltantes = {n for n in nombres if n not in self.tipos}
+        if not faltantes:
+            return
+        TipoInmueble.objects.bulk_create(
+            [TipoInmueble(nombre_tipo=n, descripcion=f'Inmueble tipo {n}') for n in faltantes],
+            ignore_conflicts=True
+        )
+        self.tipos.update(TipoInmueble.objects.filter(nombre_tipo__in=faltantes).values_list('nombre_tipo', 'id'))
+        referencia_modificada_en_bloque()
+        for n in sorted(faltantes):
+            self.stdout.write(f'✓ Tipo de inmueble {n} creado')
+
+    def asegurar_municipios(self, nombres):
+        # Asumimos que municipio = ciudad (una ciudad homónima por municipio, en Carabobo)
+        faltantes = {n for n in nombres if n not in self.municipios}
+        if not faltantes:
+            return
+        Ciudad.objects.bulk_create(
+            [Ciudad(nombre_ciudad=n, estado=self.estado) for n in faltantes],
+            ignore_conflicts=True
+        )
+        ciudades = dict(
+            Ciudad.objects.filter(estado=self.estado, nombre_ciudad__in=faltantes).values_list('nombre_ciudad', 'id')
+        )
+        Municipio.objects.bulk_create(
+            [Municipio(nombre_municipio=n, ciudad_id=ciudades[n]) for n in faltantes],
+            ignore_conflicts=True
+        )
+        for nombre, ciudad_id, municipio_id in Municipio.objects.filter(
+            ciudad_id__in=ciudades.values(), nombre_municipio__in=faltantes
+        ).values_list('nombre_municipio', 'ciudad_id', 'id'):
+            if ciudades.get(nombre) == ciudad_id:
+                self.municipios[nombre] = municipio_id
+        referencia_modificada_en_bloque()
+
+    def valores(self, casa):
+        municipio_nombre = casa.get('municipio', 'Valencia')
+        metros = a_decimal(casa.get('metros_cuadrados', 0))
+        return {
+            'titulo_publicacion': casa.get('descripcion', f'Propiedad en {municipio_nombre}'),
+            'descripcion_publica': casa.get('descripcion', ''),
+            'tipo_inmueble_id': self.tipos.get(casa.get('tipo', 'Casa')),
+            'municipio_id': self.municipios.get(municipio_nombre),
+            'direccion_exacta': casa.get('direccion', 'Dirección no especificada'),
+            'precio': a_decimal(casa.get('precio', 0)),
+            'superficie_terreno': (metros * Decimal('1.2')).quantize(CENTAVOS),  # Estimación
+            'superficie_construccion': metros,
+            'habitaciones': casa.get('habitaciones', 0),
+            'banos': casa.get('banos', 0),
+        }
+
+    def importar_lote(self, casas):
+        self.asegurar_tipos({casa.get('tipo', 'Casa') for casa in casas})
+        self.asegurar_municipios({casa.get('municipio', 'Valencia') for casa in casas})
+
+        # Generar código de referencia único; el último registro gana si se repite en el lote
+        por_codigo = {}
+        for casa in casas:
+            codigo_ref = f"ICA-{casa['id']:03d}-{casa.get('municipio', 'VAL').upper()[:3]}"
+            por_codigo[codigo_ref] = self.valores(casa)
+        self.stats['leidos'] += len(casas)
+
+        with transaction.atomic():
+            # Una consulta por lote para saber qué códigos ya existen
+            existentes = {
+                fila['codigo_referencia']: fila
+                for fila in Inmueble.objects.filter(codigo_referencia__in=por_codigo)
+                .values('id', 'codigo_referencia', *CAMPOS_ACTUALIZABLES)
+            }
+
+            nuevos = [
+                Inmueble(
+                    codigo_referencia=codigo_ref,
+                    puestos_estacionamiento=1,  # Valor por defecto
+                    ano_construccion=2020,  # Valor por defecto
+                    estatus_venta='Disponible',
+                    estatus_moderacion='Aprobado',
+                    propietario=self.propietario_default,
+                    **valores
+                )
+                for codigo_ref, valores in por_codigo.items() if codigo_ref not in existentes
+            ]
+            Inmueble.objects.bulk_create(nuevos)
+
+            cambiados, anteriores = [], {}
+            if self.actualizar:
+                for codigo_ref, fila in existentes.items():
+                    valores = por_codigo[codigo_ref]
+                    if any(fila[campo] != valores[campo] for campo in CAMPOS_ACTUALIZABLES):
+                        cambiados.append(Inmueble(id=fila['id'], codigo_referencia=codigo_ref, **valores))
+                # bulk_update no emite señales: lo que aportaban a las estadísticas se toma antes
+                anteriores = estadisticas.aportes([i.id for i in cambiados])
+                Inmueble.objects.bulk_update(cambiados, CAMPOS_ACTUALIZABLES)
+
+            # bulk_create/bulk_update no emiten señales: reindexar e invalidar cachés del lote
+            tocados = [i.codigo_referencia for i in nuevos + cambiados]
+            if tocados:
+                guardados = Inmueble.objects.filter(codigo_referencia__in=tocados)
+                inmuebles_guardados_en_bloque(guardados)
+                estadisticas.aplicar(anteriores, estadisticas.aportes(guardados))
+
+        self.stats['creados'] += len(nuevos)
+        self.stats['actualizados'] += len(cambiados)
+        self.stats['sin_cambios'] += len(existentes) - len(cambiados)
@@ -1,10 +1,15 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from api.models import Estado, Ciudad, Municipio, Rol, TipoInmueble, Caracteristica, Usuario, Inmueble
+from api import estadisticas
+from api.management.seeding import sembrar, sembrar_nombres
+from api.signals import inmuebles_guardados_en_bloque
 from django.contrib.auth.hashers import make_password
 
 class Command(BaseCommand):
     help = 'Inicializa datos básicos para la aplicación'
 
+    @transaction.atomic
     def handle(self, *args, **options):
         self.stdout.write('Inicializando datos básicos...')
         
@@ -16,55 +21,44 @@ class Command(BaseCommand):
             {'nombre_estado': 'Zulia'},
         ]
         
-        for estado_data in estados_data:
-            estado, created = Estado.objects.get_or_create(
-                nombre_estado=estado_data['nombre_estado']
-            )
-            if created:
-                self.stdout.write(f'Creado estado: {estado.nombre_estado}')
+        estados, creados = sembrar_nombres(Estado, 'nombre_estado', [e['nombre_estado'] for e in estados_data])
+        for nombre in creados:
+            self.stdout.write(f'Creado estado: {nombre}')
         
         # Crear ciudades
-        carabobo = Estado.objects.get(nombre_estado='Carabobo')
-        dc = Estado.objects.get(nombre_estado='Distrito Capital')
+        carabobo = estados['Carabobo']
+        dc = estados['Distrito Capital']
         
         ciudades_data = [
-            {'nombre_ciudad': 'Valencia', 'estado': carabobo},
-            {'nombre_ciudad': 'Puerto Cabello', 'estado': carabobo},
-            {'nombre_ciudad': 'Mariara', 'estado': carabobo},
-            {'nombre_ciudad': 'Caracas', 'estado': dc},
+            {'nombre_ciudad': 'Valencia', 'estado_id': carabobo},
+            {'nombre_ciudad': 'Puerto Cabello', 'estado_id': carabobo},
+            {'nombre_ciudad': 'Mariara', 'estado_id': carabobo},
+            {'nombre_ciudad': 'Caracas', 'estado_id': dc},
         ]
         
-        for ciudad_data in ciudades_data:
-            ciudad, created = Ciudad.objects.get_or_create(
-                nombre_ciudad=ciudad_data['nombre_ciudad'],
-                estado=ciudad_data['estado']
-            )
-            if created:
-                self.stdout.write(f'Creada ciudad: {ciudad.nombre_ciudad}')
+        ciudades, creadas = sembrar(Ciudad, ['nombre_ciudad', 'estado_id'], ciudades_data)
+        for nombre, _ in creadas:
+            self.stdout.write(f'Creada ciudad: {nombre}')
         
         # Crear municipios
-        valencia = Ciudad.objects.get(nombre_ciudad='Valencia')
-        puerto_cabello = Ciudad.objects.get(nombre_ciudad='Puerto Cabello')
-        mariara = Ciudad.objects.get(nombre_ciudad='Mariara')
-        caracas = Ciudad.objects.get(nombre_ciudad='Caracas')
+        valencia = ciudades[('Valencia', carabobo)]
+        puerto_cabello = ciudades[('Puerto Cabello', carabobo)]
+        mariara = ciudades[('Mariara', carabobo)]
+        caracas = ciudades[('Caracas', dc)]
         
         municipios_data = [
-            {'nombre_municipio': 'Naguanagua', 'ciudad': valencia},
-            {'nombre_municipio': 'Los Guayos', 'ciudad': valencia},
-            {'nombre_municipio': 'San Joaquín', 'ciudad': valencia},
-            {'nombre_municipio': 'Puerto Cabello', 'ciudad': puerto_cabello},
-            {'nombre_municipio': 'Mariara', 'ciudad': mariara},
-            {'nombre_municipio': 'Chacao', 'ciudad': caracas},
-            {'nombre_municipio': 'Baruta', 'ciudad': caracas},
+            {'nombre_municipio': 'Naguanagua', 'ciudad_id': valencia},
+            {'nombre_municipio': 'Los Guayos', 'ciudad_id': valencia},
+            {'nombre_municipio': 'San Joaquín', 'ciudad_id': valencia},
+            {'nombre_municipio': 'Puerto Cabello', 'ciudad_id': puerto_cabello},
+            {'nombre_municipio': 'Mariara', 'ciudad_id': mariara},
+            {'nombre_municipio': 'Chacao', 'ciudad_id': caracas},
+            {'nombre_municipio': 'Baruta', 'ciudad_id': caracas},
         ]
         
-        for municipio_data in municipios_data:
-            municipio, created = Municipio.objects.get_or_create(
-                nombre_municipio=municipio_data['nombre_municipio'],
-                ciudad=municipio_data['ciudad']
-            )
-            if created:
-                self.stdout.write(f'Creado municipio: {municipio.nombre_municipio}')
+        municipios, creados = sembrar(Municipio, ['nombre_municipio', 'ciudad_id'], municipios_data)
+        for nombre, _ in creados:
+            self.stdout.write(f'Creado municipio: {nombre}')
         
         # Crear roles
         roles_data = [
@@ -73,12 +67,9 @@ class Command(BaseCommand):
             {'nombre_rol': 'Administrador'},
         ]
         
-        for rol_data in roles_data:
-            rol, created = Rol.objects.get_or_create(
-                nombre_rol=rol_data['nombre_rol']
-            )
-            if created:
-                self.stdout.write(f'Creado rol: {rol.nombre_rol}')
+        roles, creados = sembrar_nombres(Rol, 'nombre_rol', [r['nombre_rol'] for r in roles_data])
+        for nombre in creados:
+            self.stdout.write(f'Creado rol: {nombre}')
         
         # Crear tipos de inmueble
         tipos_data = [
@@ -88,12 +79,9 @@ class Command(BaseCommand):
             {'nombre_tipo': 'Penthouse', 'descripcion': 'Ático de lujo'},
         ]
         
-        for tipo_data in tipos_data:
-            tipo, created = TipoInmueble.objects.get_or_create(
-                nombre_tipo=tipo_data['nombre_tipo']
-            )
-            if created:
-                self.stdout.write(f'Creado tipo de inmueble: {tipo.nombre_tipo}')
+        tipos, creados = sembrar(TipoInmueble, ['nombre_tipo'], tipos_data)
+        for (nombre,) in creados:
+            self.stdout.write(f'Creado tipo de inmueble: {nombre}')
         
         # Crear características
         caracteristicas_data = [
@@ -107,41 +95,35 @@ class Command(BaseCommand):
             {'nombre_caracteristica': 'Ascensor'},
         ]
         
-        for caracteristica_data in caracteristicas_data:
-            caracteristica, created = Caracteristica.objects.get_or_create(
-                nombre_caracteristica=caracteristica_data['nombre_caracteristica']
-            )
-            if created:
-                self.stdout.write(f'Creada característica: {caracteristica.nombre_caracteristica}')
+        for (nombre,) in sembrar(Caracteristica, ['nombre_caracteristica'], caracteristicas_data)[1]:
+            self.stdout.write(f'Creada característica: {nombre}')
         
         # Crear usuario administrador
-        admin_rol = Rol.objects.get(nombre_rol='Administrador')
-        admin, created = Usuario.objects.get_or_create(
-            email='admin@ica.com',
-            defaults={
-                'nombres': 'Administrador',
-                'apellidos': 'Sistema',
-                'password_hash': make_password('admin123'),
-                'rol': admin_rol,
-                'activo': True
-            }
-        )
-        if created:
+        admin = Usuario.objects.filter(email='admin@ica.com').first()
+        if admin is None:
+            admin = Usuario.objects.create(
+                email='admin@ica.com',
+                nombres='Administrador',
+                apellidos='Sistema',
+                password_hash=make_password('admin123'),
+                rol_id=roles['Administrador'],
+                activo=True
+            )
             self.stdout.write('Creado usuario administrador: admin@ica.com / admin123')
         
         # Crear algunas propiedades de ejemplo
-        casa_tipo = TipoInmueble.objects.get(nombre_tipo='Casa')
-        apartamento_tipo = TipoInmueble.objects.get(nombre_tipo='Apartamento')
-        naguanagua = Municipio.objects.get(nombre_municipio='Naguanagua')
-        los_guayos = Municipio.objects.get(nombre_municipio='Los Guayos')
+        casa_tipo = tipos[('Casa',)]
+        apartamento_tipo = tipos[('Apartamento',)]
+        naguanagua = municipios[('Naguanagua', valencia)]
+        los_guayos = municipios[('Los Guayos', valencia)]
         
         inmuebles_data = [
             {
                 'codigo_referencia': 'CASA-001',
                 'titulo_publicacion': 'Casa Moderna en Naguanagua',
                 'descripcion_publica': 'Hermosa casa moderna con 3 habitaciones, 2 baños, jardín y garaje para 2 vehículos.',
-                'tipo_inmueble': casa_tipo,
-                'municipio': naguanagua,
+                'tipo_inmueble_id': casa_tipo,
+                'municipio_id': naguanagua,
                 'direccion_exacta': 'Av. Universidad, Naguanagua',
                 'precio': 150000.00,
                 'superficie_terreno': 200.00,
@@ -158,8 +140,8 @@ class Command(BaseCommand):
                 'codigo_referencia': 'APT-002',
                 'titulo_publicacion': 'Apartamento de Lujo en Los Guayos',
                 'descripcion_publica': 'Espectacular apartamento con vista al mar, 2 habitaciones, 2 baños, balcón y todas las comodidades.',
-                'tipo_inmueble': apartamento_tipo,
-                'municipio': los_guayos,
+                'tipo_inmueble_id': apartamento_tipo,
+                'municipio_id': los_guayos,
                 'direccion_exacta': 'Torre Marina, Los Guayos',
                 'precio': 120000.00,
                 'superficie_terreno': 0.00,
@@ -174,13 +156,17 @@ class Command(BaseCommand):
             },
         ]
         
-        for inmueble_data in inmuebles_data:
-            inmueble, created = Inmueble.objects.get_or_create(
-                codigo_referencia=inmueble_data['codigo_referencia'],
-                defaults=inmueble_data
-            )
-            if created:
-                self.stdout.write(f'Creado inmueble: {inmueble.codigo_referencia}')
+        existentes = set(Inmueble.objects.filter(
+            codigo_referencia__in=[i['codigo_referencia'] for i in inmuebles_data]
+        ).values_list('codigo_referencia', flat=True))
+        nuevos = [Inmueble(**data) for data in inmuebles_data if data['codigo_referencia'] not in existentes]
+        if nuevos:
+            Inmueble.objects.bulk_create(nuevos)
+            guardados = Inmueble.objects.filter(codigo_referencia__in=[i.codigo_referencia for i in nuevos])
+            inmuebles_guardados_en_bloque(guardados)
+            estadisticas.aplicar({}, estadisticas.aportes(guardados))
+        for inmueble in nuevos:
+            self.stdout.write(f'Creado inmueble: {inmueble.codigo_referencia}')
         
         self.stdout.write(
             self.style.SUCCESS('¡Datos inicializados correctamente!')
@@ -1,12 +1,15 @@
 import os
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from api.models import Estado, Ciudad, Municipio, TipoInmueble, Caracteristica, Rol, Usuario
+from api.management.seeding import sembrar, sembrar_nombres
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 
 class Command(BaseCommand):
     help = 'Inicializa datos de Venezuela: estados, ciudades, municipios, tipos de inmuebles y características'
 
+    @transaction.atomic
     def handle(self, *args, **options):
         # Datos de estados de Venezuela
         estados_data = [
@@ -17,10 +20,9 @@ class Command(BaseCommand):
         ]
 
         # Crear estados
-        for estado_nombre in estados_data:
-            estado, created = Estado.objects.get_or_create(nombre_estado=estado_nombre)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'✓ Estado {estado_nombre} creado'))
+        estados, creados = sembrar_nombres(Estado, 'nombre_estado', estados_data)
+        for estado_nombre in creados:
+            self.stdout.write(self.style.SUCCESS(f'✓ Estado {estado_nombre} creado'))
 
         # Datos de ciudades principales por estado
         ciudades_data = {
@@ -52,18 +54,16 @@ class Command(BaseCommand):
         }
 
         # Crear ciudades
+        filas = []
         for estado_nombre, ciudades in ciudades_data.items():
-            try:
-                estado = Estado.objects.get(nombre_estado=estado_nombre)
-                for ciudad_nombre in ciudades:
-                    ciudad, created = Ciudad.objects.get_or_create(
-                        nombre_ciudad=ciudad_nombre,
-                        estado=estado
-                    )
-                    if created:
-                        self.stdout.write(self.style.SUCCESS(f'✓ Ciudad {ciudad_nombre} creada en {estado_nombre}'))
-            except Estado.DoesNotExist:
+            if estado_nombre not in estados:
                 self.stdout.write(self.style.WARNING(f'Estado {estado_nombre} no encontrado'))
+                continue
+            filas.extend({'nombre_ciudad': ciudad_nombre, 'estado_id': estados[estado_nombre]} for ciudad_nombre in ciudades)
+        ciudades_ids, creadas = sembrar(Ciudad, ['nombre_ciudad', 'estado_id'], filas)
+        nombres_estados = {pk: nombre for nombre, pk in estados.items()}
+        for ciudad_nombre, estado_id in creadas:
+            self.stdout.write(self.style.SUCCESS(f'✓ Ciudad {ciudad_nombre} creada en {nombres_estados[estado_id]}'))
 
         # Datos de municipios principales (ejemplos para Carabobo)
         municipios_carabobo = {
@@ -79,21 +79,19 @@ class Command(BaseCommand):
         }
 
         # Crear municipios para Carabobo
-        try:
-            estado_carabobo = Estado.objects.get(nombre_estado='Carabobo')
+        if 'Carabobo' in estados:
+            filas = []
             for ciudad_nombre, municipios in municipios_carabobo.items():
-                try:
-                    ciudad = Ciudad.objects.get(nombre_ciudad=ciudad_nombre, estado=estado_carabobo)
-                    for municipio_nombre in municipios:
-                        municipio, created = Municipio.objects.get_or_create(
-                            nombre_municipio=municipio_nombre,
-                            ciudad=ciudad
-                        )
-                        if created:
-                            self.stdout.write(self.style.SUCCESS(f'✓ Municipio {municipio_nombre} creado en {ciudad_nombre}'))
-                except Ciudad.DoesNotExist:
+                ciudad_id = ciudades_ids.get((ciudad_nombre, estados['Carabobo']))
+                if ciudad_id is None:
                     self.stdout.write(self.style.WARNING(f'Ciudad {ciudad_nombre} no encontrada en Carabobo'))
-        except Estado.DoesNotExist:
+                    continue
+                filas.extend({'nombre_municipio': municipio_nombre, 'ciudad_id': ciudad_id} for municipio_nombre in municipios)
+            _, creados = sembrar(Municipio, ['nombre_municipio', 'ciudad_id'], filas)
+            nombres_ciudades = {pk: nombre for (nombre, _), pk in ciudades_ids.items()}
+            for municipio_nombre, ciudad_id in creados:
+                self.stdout.write(self.style.SUCCESS(f'✓ Municipio {municipio_nombre} creado en {nombres_ciudades[ciudad_id]}'))
+        else:
             self.stdout.write(self.style.WARNING('Estado Carabobo no encontrado'))
 
         # Tipos de inmuebles
@@ -102,10 +100,8 @@ class Command(BaseCommand):
             'Local Comercial', 'Oficina', 'Bodega', 'Terreno', 'Finca', 'Edificio'
         ]
 
-        for tipo in tipos_inmueble:
-            tipo_obj, created = TipoInmueble.objects.get_or_create(nombre_tipo=tipo)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'✓ Tipo de inmueble {tipo} creado'))
+        for tipo in sembrar_nombres(TipoInmueble, 'nombre_tipo', tipos_inmueble)[1]:
+            self.stdout.write(self.style.SUCCESS(f'✓ Tipo de inmueble {tipo} creado'))
 
         # Características de inmuebles
         caracteristicas = [
@@ -120,20 +116,16 @@ class Command(BaseCommand):
             'Gas directo', 'Electricidad 220V', 'Telefonía', 'Antena parabólica'
         ]
 
-        for caracteristica in caracteristicas:
-            carac_obj, created = Caracteristica.objects.get_or_create(nombre_caracteristica=caracteristica)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'✓ Característica {caracteristica} creada'))
+        for caracteristica in sembrar_nombres(Caracteristica, 'nombre_caracteristica', caracteristicas)[1]:
+            self.stdout.write(self.style.SUCCESS(f'✓ Característica {caracteristica} creada'))
 
         # Crear roles
         roles = ['Administrador', 'Moderador', 'Propietario', 'Cliente', 'Agente']
-        for rol_nombre in roles:
-            rol, created = Rol.objects.get_or_create(nombre_rol=rol_nombre)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'✓ Rol {rol_nombre} creado'))
+        roles_ids, creados = sembrar_nombres(Rol, 'nombre_rol', roles)
+        for rol_nombre in creados:
+            self.stdout.write(self.style.SUCCESS(f'✓ Rol {rol_nombre} creado'))
 
         # Crear usuario administrador si no existe
-        admin_rol, _ = Rol.objects.get_or_create(nombre_rol='Administrador')
         if not Usuario.objects.filter(email='admin@ica.com').exists():
             admin_user = Usuario.objects.create(
                 nombres='Administrador',
@@ -142,7 +134,7 @@ class Command(BaseCommand):
                 password_hash=make_password('admin123'),
                 telefono='+58 412 000 0000',
                 cedula='V-00000000',
-                rol=admin_rol,
+                rol_id=roles_ids['Administrador'],
                 activo=True
             )
             self.stdout.write(self.style.SUCCESS(f'✓ Usuario administrador creado: {admin_user.email}'))
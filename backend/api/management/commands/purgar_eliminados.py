@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import RegistroEliminado
+from api.sync import RETENCION
+
+
+class Command(BaseCommand):
+    help = 'Borra los registros de eliminación más antiguos que SYNC_RETENCION_DIAS (para cron)'
+
+    def handle(self, *args, **options):
+        borrados, _ = RegistroEliminado.objects.filter(fecha_eliminacion__lt=timezone.now() - RETENCION).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'¡Registros purgados! {borrados} registros de eliminación borrados.')
+        )
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula todas las estadísticas de mercado por municipio y tipo de inmueble, medianas incluidas (para cron)'
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        grupos = estadisticas.recalcular()
+        duracion = time.monotonic() - inicio
+
+        self.stdout.write(
+            self.style.SUCCESS(f'¡Estadísticas recalculadas! {grupos} grupos en {duracion:.1f}s.')
+        )
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import listado
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el modelo de lectura de tarjetas de inmuebles (InmuebleListado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=listado.TAMANO_LOTE,
+                            help='Inmuebles reescritos por lote')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        # Las filas se reescriben por lotes (sin vaciar la tabla) para que el listado nunca quede vacío
+        total = listado.actualizar_queryset(tamano_lote=options['batch_size'])
+        duracion = time.monotonic() - inicio
+
+        self.stdout.write(
+            self.style.SUCCESS(f'¡Listado reconstruido! {total} inmuebles en {duracion:.1f}s.')
+        )
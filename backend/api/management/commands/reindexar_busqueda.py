@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de inmuebles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.TAMANO_LOTE,
+                            help='Inmuebles indexados por lote')
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        self.stdout.write(f'Reindexando con el backend "{backend.nombre}"...')
+
+        inicio = time.monotonic()
+        backend.vaciar()
+        total = search.reindexar(tamano_lote=options['batch_size'])
+        duracion = time.monotonic() - inicio
+
+        self.stdout.write(
+            self.style.SUCCESS(f'¡Índice reconstruido! {total} inmuebles en {duracion:.1f}s.')
+        )
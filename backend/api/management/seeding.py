@@ -0,0 +1,44 @@
+"""
+Sembrado de datos de referencia por conjuntos.
+
+En vez de un ``get_or_create`` por fila, se consulta qué filas deseadas ya existen (una
+consulta), se insertan las faltantes con ``bulk_create`` y se leen sus ids (otra consulta).
+Es idempotente: volver a sembrar no crea duplicados.
+"""
+from api.signals import referencia_modificada_en_bloque
+
+
+def sembrar(modelo, campos_clave, filas):
+    """Crea las ``filas`` (dicts de campos) que no existan según ``campos_clave``.
+
+    Devuelve ``(ids, creadas)``: un mapa clave -> id con todas las filas deseadas y la lista
+    de claves creadas. Las claves son tuplas con los valores de ``campos_clave``.
+    """
+    deseadas = {tuple(fila[campo] for campo in campos_clave): fila for fila in filas}
+    if not deseadas:
+        return {}, []
+
+    ids = _buscar(modelo, campos_clave, deseadas)
+    creadas = [clave for clave in deseadas if clave not in ids]
+    if creadas:
+        modelo.objects.bulk_create([modelo(**deseadas[clave]) for clave in creadas], ignore_conflicts=True)
+        ids.update(_buscar(modelo, campos_clave, creadas))
+        referencia_modificada_en_bloque()
+    return ids, creadas
+
+
+def sembrar_nombres(modelo, campo, nombres):
+    """Atajo para catálogos con un nombre único: devuelve ``({nombre: id}, [nombres creados])``."""
+    ids, creadas = sembrar(modelo, [campo], [{campo: nombre} for nombre in dict.fromkeys(nombres)])
+    return {clave[0]: pk for clave, pk in ids.items()}, [clave[0] for clave in creadas]
+
+
+def _buscar(modelo, campos_clave, claves):
+    claves = set(claves)
+    # El filtro por columnas puede traer combinaciones de más; se descartan en Python
+    filtro = {f'{campo}__in': {clave[i] for clave in claves} for i, campo in enumerate(campos_clave)}
+    return {
+        tuple(fila[:-1]): fila[-1]
+        for fila in modelo.objects.filter(**filtro).values_list(*campos_clave, 'id')
+        if tuple(fila[:-1]) in claves
+    }
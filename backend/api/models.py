@@ -1,3 +1,7 @@
+import secrets
+
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 
@@ -40,6 +44,10 @@ class Rol(models.Model):
 		return self.nombre_rol
 
 
+def clave_calendario_nueva():
+	return secrets.token_urlsafe(16)
+
+
 class Usuario(models.Model):
 	nombres = models.CharField(max_length=100)
 	apellidos = models.CharField(max_length=100)
@@ -50,6 +58,16 @@ class Usuario(models.Model):
 	rol = models.ForeignKey(Rol, null=True, blank=True, on_delete=models.SET_NULL, related_name='usuarios')
 	fecha_registro = models.DateTimeField(default=timezone.now)
 	activo = models.BooleanField(default=True)
+	# Va firmada en la URL del calendario ICS (api/calendario.py); cambiarla revoca las anteriores
+	clave_calendario = models.CharField(max_length=32, default=clave_calendario_nueva, editable=False)
+
+	# Lo que DRF espera de request.user (ver api/autenticacion.py)
+	is_authenticated = True
+	is_anonymous = False
+
+	@property
+	def is_active(self):
+		return self.activo
 
 	def __str__(self):
 		return f"{self.nombres} {self.apellidos} <{self.email}>"
@@ -106,15 +124,54 @@ class Inmueble(models.Model):
 	ano_construccion = models.PositiveSmallIntegerField(null=True, blank=True)
 	estatus_venta = models.CharField(max_length=10, choices=ESTATUS_VENTA_CHOICES, default='Disponible')
 
+	# Location (WGS84); geohash is derived from them on save (see api/geo.py)
+	latitud = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+	longitud = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+	geohash = models.CharField(max_length=12, null=True, blank=True, editable=False)
+
 	# Moderation fields
 	estatus_moderacion = models.CharField(max_length=10, choices=ESTATUS_MODERACION_CHOICES, default='Pendiente')
 	moderador = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='moderated_inmuebles')
 	fecha_moderacion = models.DateTimeField(null=True, blank=True)
 	motivo_rechazo = models.TextField(blank=True, null=True)
+	# Reserva en la cola de moderación (ver api/moderacion.py)
+	reservado_por = models.ForeignKey(
+		Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='inmuebles_reservados', editable=False
+	)
+	reservado_hasta = models.DateTimeField(null=True, blank=True, editable=False)
 
 	propietario = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.CASCADE, related_name='inmuebles')
 	fecha_publicacion = models.DateTimeField(auto_now_add=True)
 
+	# Campos que entran en EstadisticaMercado
+	CAMPOS_ESTADISTICA = (
+		'municipio_id', 'tipo_inmueble_id', 'precio', 'superficie_construccion', 'estatus_venta', 'fecha_publicacion',
+		'estatus_moderacion',
+	)
+
+	class Meta:
+		indexes = [
+			# Keyset pagination (see api/pagination.py)
+			models.Index(fields=['fecha_publicacion', 'id'], name='inmueble_fecha_id_idx'),
+			# Bbox/radius search and map clustering (see api/geo.py)
+			models.Index(fields=['geohash', 'latitud', 'longitud'], name='inmueble_geohash_idx'),
+			# Moderation queue, oldest pending first (see api/moderacion.py)
+			models.Index(fields=['estatus_moderacion', 'fecha_publicacion', 'id'], name='inmueble_moderacion_idx'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Estatus leído de la BD, para saber si un cambio afecta el listado público
+		instance._estatus_moderacion_cargado = instance.__dict__.get('estatus_moderacion')
+		# Valores leídos de la BD, para no tocar las estadísticas si no cambian
+		instance._estadistica_cargada = instance.huella_estadistica()
+		return instance
+
+	def huella_estadistica(self):
+		"""Valores que cuentan para las estadísticas de mercado (ver api/estadisticas.py)."""
+		return tuple(self.__dict__.get(campo) for campo in self.CAMPOS_ESTADISTICA)
+
 	def __str__(self):
 		return f"{self.codigo_referencia} - {self.titulo_publicacion}"
 
@@ -140,6 +197,9 @@ class Operacion(models.Model):
 
 	MONEDA_CHOICES = Inmueble.MONEDA_CHOICES
 
+	# Campos que entran en EstadisticaMercado
+	CAMPOS_ESTADISTICA = ('inmueble_id', 'monto_final', 'moneda_cierre', 'fecha_operacion')
+
 	inmueble = models.ForeignKey(Inmueble, null=True, blank=True, on_delete=models.SET_NULL, related_name='operaciones')
 	usuario_vendedor = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='ventas')
 	usuario_comprador = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='compras')
@@ -149,10 +209,25 @@ class Operacion(models.Model):
 	moneda_cierre = models.CharField(max_length=3, choices=MONEDA_CHOICES, default='USD')
 	notas = models.TextField(blank=True, null=True)
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Valores leídos de la BD, para no tocar las estadísticas si no cambian
+		instance._estadistica_cargada = instance.huella_estadistica()
+		return instance
+
+	def huella_estadistica(self):
+		"""Valores que cuentan para las estadísticas de mercado (ver api/estadisticas.py)."""
+		return tuple(self.__dict__.get(campo) for campo in self.CAMPOS_ESTADISTICA)
+
 	def __str__(self):
 		return f"Operacion {self.id} - {self.tipo_operacion} - {self.monto_final} {self.moneda_cierre}"
 
 
+def duracion_cita_predeterminada():
+	return settings.CITA_DURACION_MINUTOS
+
+
 class Cita(models.Model):
 	ESTATUS_CITA_CHOICES = (
 		('Programada', 'Programada'),
@@ -164,8 +239,35 @@ class Cita(models.Model):
 	usuario_interesado = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='citas_interesado')
 	usuario_propietario = models.ForeignKey(Usuario, null=True, blank=True, on_delete=models.SET_NULL, related_name='citas_propietario')
 	fecha_hora_cita = models.DateTimeField()
+	duracion_minutos = models.PositiveSmallIntegerField(default=duracion_cita_predeterminada)
+	# fecha_hora_cita + duracion_minutos (ver la señal asignar_fin_cita); detección de choques en api/agenda.py.
+	# Nullable sólo para que la columna pueda agregarse a una tabla con citas: toda cita guardada la
+	# recibe, y las anteriores al campo se completan con ``manage.py completar_fin_citas`` (ver README)
+	fecha_fin_cita = models.DateTimeField(null=True, editable=False)
 	estatus_cita = models.CharField(max_length=10, choices=ESTATUS_CITA_CHOICES, default='Programada')
 	observaciones = models.TextField(blank=True, null=True)
+	# Sincronización incremental (ver api/sync.py)
+	fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['fecha_hora_cita', 'id'], name='cita_fecha_id_idx'),
+			models.Index(fields=['fecha_actualizacion', 'id'], name='cita_actualizacion_idx'),
+			# Intervalos ocupados por inmueble y por propietario
+			models.Index(fields=['inmueble', 'fecha_hora_cita', 'fecha_fin_cita'], name='cita_inmueble_intervalo_idx'),
+			models.Index(fields=['usuario_propietario', 'fecha_hora_cita', 'fecha_fin_cita'], name='cita_propietario_intervalo_idx'),
+			# Calendario del interesado (api/calendario.py)
+			models.Index(fields=['usuario_interesado', 'fecha_hora_cita'], name='cita_interesado_fecha_idx'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Participantes leídos de la BD, para invalidar también sus calendarios si cambian (si
+		# alguno quedó diferido los consulta la señal pre_save)
+		if 'usuario_interesado_id' in instance.__dict__ and 'usuario_propietario_id' in instance.__dict__:
+			instance._participantes_cargados = {instance.usuario_interesado_id, instance.usuario_propietario_id}
+		return instance
 
 	def __str__(self):
 		return f"Cita {self.id} - {self.inmueble} - {self.fecha_hora_cita}"
@@ -192,7 +294,146 @@ class Mensaje(models.Model):
 	contenido_mensaje = models.TextField()
 	fecha_envio = models.DateTimeField(auto_now_add=True)
 	leido = models.BooleanField(default=False)
+	# Sincronización incremental (ver api/sync.py)
+	fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['fecha_envio', 'id'], name='mensaje_fecha_id_idx'),
+			models.Index(fields=['fecha_actualizacion', 'id'], name='mensaje_actualizacion_idx'),
+			# Inbox: last message and unread count per conversation
+			models.Index(fields=['conversacion', 'fecha_envio'], name='mensaje_conv_fecha_idx'),
+			models.Index(fields=['conversacion', 'leido'], name='mensaje_conv_leido_idx'),
+		]
 
 	def __str__(self):
 		return f"Mensaje {self.id} - {self.usuario_emisor} - {self.fecha_envio}"
 
+
+class RegistroEliminado(models.Model):
+	"""Marca de borrado de un mensaje o cita, para que la sincronización incremental
+	(api/sync.py) informe a los clientes qué filas eliminar. La escriben las señales post_delete."""
+	modelo = models.CharField(max_length=30)
+	objeto_id = models.BigIntegerField()
+	fecha_eliminacion = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['modelo', 'fecha_eliminacion', 'id'], name='eliminado_modelo_fecha_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.modelo} {self.objeto_id} eliminado"
+
+
+class VersionCache(models.Model):
+	"""Versión de un espacio de la caché de respuestas (api/cache.py). Está en la BD para que
+	todos los workers vean las invalidaciones aunque la caché de Django sea por proceso."""
+	espacio = models.CharField(max_length=100, unique=True)
+	version = models.BigIntegerField()
+	modificado = models.DateTimeField()
+
+	def __str__(self):
+		return f"{self.espacio} v{self.version}"
+
+
+# Full-text search index models
+class InmuebleDocumento(models.Model):
+	"""Texto normalizado (sin acentos, en minúsculas) indexado con FULLTEXT en MySQL."""
+	inmueble = models.OneToOneField(Inmueble, on_delete=models.CASCADE, primary_key=True, related_name='documento_busqueda')
+	texto = models.TextField()
+
+	def __str__(self):
+		return f"Documento {self.inmueble_id}"
+
+
+class InmuebleTermino(models.Model):
+	"""Índice invertido portable (SQLite/tests): un término normalizado por inmueble con su peso."""
+	termino = models.CharField(max_length=64)
+	inmueble = models.ForeignKey(Inmueble, on_delete=models.CASCADE, related_name='terminos_busqueda')
+	peso = models.PositiveIntegerField(default=1)
+
+	class Meta:
+		unique_together = (('termino', 'inmueble'),)
+
+	def __str__(self):
+		return f"{self.termino} -> {self.inmueble_id} ({self.peso})"
+
+
+# Read models
+class InmuebleListado(models.Model):
+	"""Tarjeta de un inmueble tal como la muestra el frontend, sin joins al leerla.
+
+	Se mantiene desde api/signals.py (ver api/listado.py); ``manage.py reconstruir_listado``
+	la regenera completa.
+	"""
+	inmueble = models.OneToOneField(Inmueble, on_delete=models.CASCADE, primary_key=True, related_name='listado')
+	titulo = models.CharField(max_length=255)
+	descripcion = models.TextField()
+	precio = models.DecimalField(max_digits=18, decimal_places=2)
+	ubicacion = models.CharField(max_length=255)
+	habitaciones = models.IntegerField(default=0)
+	banos = models.IntegerField(default=0)
+	superficie = models.DecimalField(max_digits=10, decimal_places=2)
+	imagen = models.CharField(max_length=255)
+	caracteristicas = models.JSONField(default=list)
+	ano_construccion = models.PositiveSmallIntegerField(null=True, blank=True)
+	estatus_moderacion = models.CharField(max_length=10)
+	fecha_publicacion = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['fecha_publicacion', 'inmueble'], name='listado_fecha_idx'),
+			models.Index(fields=['estatus_moderacion', 'fecha_publicacion', 'inmueble'], name='listado_estatus_fecha_idx'),
+		]
+
+	def a_front(self):
+		return {
+			'id': str(self.pk),
+			'title': self.titulo,
+			'description': self.descripcion,
+			'price': float(self.precio or 0),
+			'location': self.ubicacion,
+			'bedrooms': self.habitaciones,
+			'bathrooms': self.banos,
+			'size': float(self.superficie or 0),
+			'image': self.imagen,
+			'features': self.caracteristicas,
+			'yearBuilt': self.ano_construccion,
+			'energyRating': 'A',
+		}
+
+	def __str__(self):
+		return f"Listado {self.inmueble_id}"
+
+
+class EstadisticaMercado(models.Model):
+	"""Resumen precalculado del mercado por (municipio, tipo de inmueble).
+
+	Guarda sumas y conteos (combinables entre grupos) y las medianas del grupo. Las sumas se
+	ajustan desde api/signals.py al escribir inmuebles u operaciones (ver api/estadisticas.py);
+	las medianas solo las calcula ``manage.py recalcular_estadisticas``, que reescribe todo.
+	"""
+	municipio = models.ForeignKey(Municipio, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+	tipo_inmueble = models.ForeignKey(TipoInmueble, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+	inmuebles = models.PositiveIntegerField(default=0)
+	suma_precio = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+	precio_mediana = models.DecimalField(max_digits=18, decimal_places=2, null=True, blank=True)
+	# Inmuebles con superficie_construccion > 0 y la suma de sus precio / superficie
+	con_superficie = models.PositiveIntegerField(default=0)
+	suma_precio_m2 = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+	# Días en el mercado: los activos cuentan hasta "ahora" (se resuelve al leer)
+	activos = models.PositiveIntegerField(default=0)
+	suma_publicacion_activos = models.FloatField(default=0)
+	cerrados = models.PositiveIntegerField(default=0)
+	suma_dias_cierre = models.FloatField(default=0)
+	operaciones = models.PositiveIntegerField(default=0)
+	suma_monto_cierre = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+	monto_cierre_mediana = models.DecimalField(max_digits=18, decimal_places=2, null=True, blank=True)
+	actualizado = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		unique_together = (('municipio', 'tipo_inmueble'),)
+
+	def __str__(self):
+		return f"Estadística {self.municipio_id}/{self.tipo_inmueble_id}: {self.inmuebles} inmuebles"
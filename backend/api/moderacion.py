@@ -0,0 +1,87 @@
+"""
+Cola de moderación: cada moderador reserva un lote de inmuebles ``Pendiente`` y los
+aprueba o rechaza en bloque.
+
+``reclamar`` toma los pendientes más antiguos que nadie tiene reservados (o cuya reserva
+venció) por el índice ``(estatus_moderacion, fecha_publicacion, id)`` y los marca a nombre
+del moderador por ``MODERACION_RESERVA_MINUTOS``. Dos moderadores que reclaman a la vez
+reciben lotes distintos:
+
+- En PostgreSQL/MySQL las filas se eligen con ``SELECT ... FOR UPDATE SKIP LOCKED``: las
+  que otra transacción está reservando se saltan en lugar de esperarlas.
+- En SQLite se reservan con un solo ``UPDATE ... WHERE id IN (SELECT ... LIMIT n)``, que es
+  atómico porque las escrituras están serializadas.
+
+Las decisiones son un solo UPDATE que vuelve a exigir que la reserva sea del moderador (o
+que no haya una vigente), así que un inmueble reservado por otro no se puede decidir. Una
+reserva que vence sin decisión vuelve sola a la cola.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import estadisticas
+from .models import Inmueble
+from .signals import inmuebles_guardados_en_bloque
+
+PENDIENTE = 'Pendiente'
+DECISIONES = ('Aprobado', 'Rechazado')
+
+
+def disponibles(moderador_id, ahora):
+	"""Pendientes sin reserva vigente de otro moderador."""
+	return Inmueble.objects.filter(estatus_moderacion=PENDIENTE).filter(
+		Q(reservado_hasta__isnull=True) | Q(reservado_hasta__lte=ahora) | Q(reservado_por_id=moderador_id)
+	)
+
+
+def reclamar(moderador, cantidad):
+	"""Reserva hasta ``cantidad`` pendientes (los propios renuevan su reserva).
+
+	Devuelve el queryset del lote reservado, del más antiguo al más reciente.
+	"""
+	ahora = timezone.now()
+	hasta = ahora + datetime.timedelta(minutes=settings.MODERACION_RESERVA_MINUTOS)
+	candidatos = disponibles(moderador.pk, ahora).order_by('fecha_publicacion', 'id')
+	with transaction.atomic():
+		if connection.features.has_select_for_update_skip_locked:
+			elegidos = list(candidatos.select_for_update(skip_locked=True).values_list('pk', flat=True)[:cantidad])
+		else:
+			elegidos = candidatos.values('pk')[:cantidad]
+		Inmueble.objects.filter(pk__in=elegidos).update(reservado_por=moderador, reservado_hasta=hasta)
+	# La marca de vencimiento identifica este lote
+	return Inmueble.objects.filter(reservado_por=moderador, reservado_hasta=hasta).order_by('fecha_publicacion', 'id')
+
+
+def liberar(moderador, ids=None):
+	"""Devuelve a la cola las reservas del moderador (todas o las de ``ids``)."""
+	reservados = Inmueble.objects.filter(reservado_por=moderador)
+	if ids is not None:
+		reservados = reservados.filter(pk__in=ids)
+	return reservados.update(reservado_por=None, reservado_hasta=None)
+
+
+def decidir(moderador, ids, estatus, motivo=None):
+	"""Aprueba o rechaza los ``ids`` que el moderador puede decidir; devuelve los decididos."""
+	if estatus not in DECISIONES:
+		raise ValueError(f'Decisión inválida: {estatus}')
+	ahora = timezone.now()
+	with transaction.atomic():
+		# Solo los aprobados cuentan en las estadísticas de mercado
+		anteriores = estadisticas.aportes(ids)
+		disponibles(moderador.pk, ahora).filter(pk__in=ids).update(
+			estatus_moderacion=estatus,
+			moderador=moderador,
+			fecha_moderacion=ahora,
+			motivo_rechazo=motivo if estatus == 'Rechazado' else None,
+			reservado_por=None,
+			reservado_hasta=None,
+		)
+		decididos = Inmueble.objects.filter(pk__in=ids, moderador=moderador, fecha_moderacion=ahora)
+		# QuerySet.update no emite señales: listado público, búsqueda y cachés se actualizan aquí
+		inmuebles_guardados_en_bloque(decididos)
+		estadisticas.aplicar(anteriores, estadisticas.aportes(decididos))
+	return sorted(decididos.values_list('pk', flat=True))
@@ -0,0 +1,195 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+En lugar de ``OFFSET`` + ``COUNT(*)`` el cursor guarda los valores de las columnas de
+orden de la última fila entregada, y la siguiente página se pide con
+``WHERE (fecha, id) < (:fecha, :id)``. El coste de cada página es el mismo sin importar
+su profundidad y las inserciones concurrentes no desplazan ni duplican filas.
+
+El orden se toma del queryset (``order_by`` de la vista, ``?ordering=`` o la relevancia de
+``?search=``) y siempre se desempata por la clave primaria (``pk``, que no siempre se llama
+``id``: la de InmuebleListado es ``inmueble``). ``?count=false`` omite el conteo total.
+"""
+import base64
+import datetime
+import decimal
+import json
+from functools import reduce
+from operator import or_
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+	page_size = api_settings.PAGE_SIZE
+	page_size_query_param = 'page_size'
+	max_page_size = 100
+	cursor_query_param = 'cursor'
+	count_query_param = 'count'
+	invalid_cursor_message = 'Cursor inválido'
+
+	# Orden usado cuando el queryset no trae uno propio
+	ordering = ('-pk',)
+
+	# Si se define, los enlaces next/previous solo conservan estos parámetros de la URL
+	link_query_params = None
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.request = request
+		self.page_size = self.get_page_size(request)
+		if not self.page_size:
+			return None
+
+		self.ordering = self.get_ordering(queryset)
+		queryset = queryset.order_by(*self.ordering)
+		self.count = queryset.count() if self.include_count(request) else None
+
+		cursor = self.decode_cursor(request)
+		reverse = bool(cursor and cursor.get('r'))
+		if cursor:
+			try:
+				queryset = queryset.filter(self.after(cursor['v'], reverse))
+			except (DjangoValidationError, TypeError, ValueError):
+				# Valores que no encajan con el tipo de las columnas de orden
+				raise NotFound(self.invalid_cursor_message)
+		if reverse:
+			queryset = queryset.order_by(*[self.invert(campo) for campo in self.ordering])
+
+		rows = list(queryset[:self.page_size + 1])
+		has_more = len(rows) > self.page_size
+		rows = rows[:self.page_size]
+		if reverse:
+			rows.reverse()
+			self.has_next, self.has_previous = True, has_more
+		else:
+			self.has_next, self.has_previous = has_more, cursor is not None
+
+		self.first = self.position(rows[0]) if rows else (cursor['v'] if cursor else None)
+		self.last = self.position(rows[-1]) if rows else (cursor['v'] if cursor else None)
+		if not rows and reverse:
+			self.has_next = False
+		return rows
+
+	def get_paginated_response(self, data):
+		payload = {}
+		if self.count is not None:
+			payload['count'] = self.count
+		payload.update({
+			'next': self.get_next_link(),
+			'previous': self.get_previous_link(),
+			'results': data,
+		})
+		return Response(payload)
+
+	def get_paginated_response_schema(self, schema):
+		return {
+			'type': 'object',
+			'required': ['results'],
+			'properties': {
+				'count': {'type': 'integer', 'example': 123},
+				'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+				'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+				'results': schema,
+			},
+		}
+
+	def get_page_size(self, request):
+		if self.page_size_query_param:
+			try:
+				value = int(request.query_params[self.page_size_query_param])
+				if value > 0:
+					return min(value, self.max_page_size)
+			except (KeyError, ValueError):
+				pass
+		return self.page_size
+
+	def include_count(self, request):
+		return request.query_params.get(self.count_query_param, 'true').lower() not in ('0', 'false', 'no')
+
+	def get_ordering(self, queryset):
+		"""Orden del queryset (sólo nombres de campo) con la clave primaria como desempate final."""
+		ordering = [campo for campo in queryset.query.order_by if isinstance(campo, str) and campo != '?']
+		if not ordering:
+			ordering = list(self.ordering)
+		nombres = {campo.lstrip('-') for campo in ordering}
+		if not nombres & {'pk', queryset.model._meta.pk.name, queryset.model._meta.pk.attname}:
+			ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+		return tuple(ordering)
+
+	@staticmethod
+	def invert(campo):
+		return campo[1:] if campo.startswith('-') else '-' + campo
+
+	def after(self, valores, reverse=False):
+		"""Condición "viene después de ``valores``" en el orden actual (o en el inverso)."""
+		if len(valores) != len(self.ordering):
+			raise NotFound(self.invalid_cursor_message)
+		condiciones = []
+		for i, campo in enumerate(self.ordering):
+			descendente = campo.startswith('-') != reverse
+			nombre = campo.lstrip('-')
+			iguales = {self.ordering[j].lstrip('-'): valores[j] for j in range(i)}
+			condiciones.append(Q(**iguales, **{f'{nombre}__{"lt" if descendente else "gt"}': valores[i]}))
+		# La cota no estricta sobre la primera columna permite un range scan sobre el índice
+		primero = self.ordering[0].lstrip('-')
+		cota = Q(**{f'{primero}__{"lte" if self.ordering[0].startswith("-") != reverse else "gte"}': valores[0]})
+		return cota & reduce(or_, condiciones)
+
+	def position(self, instance):
+		valores = []
+		for campo in self.ordering:
+			valor = instance
+			for parte in campo.lstrip('-').split('__'):
+				valor = getattr(valor, parte) if valor is not None else None
+			valores.append(valor)
+		return valores
+
+	def encode_cursor(self, valores, reverse):
+		def convertir(valor):
+			if isinstance(valor, (datetime.datetime, datetime.date)):
+				return valor.isoformat()
+			if isinstance(valor, decimal.Decimal):
+				return str(valor)
+			return valor
+		crudo = json.dumps({'v': [convertir(v) for v in valores], 'r': int(reverse)}, separators=(',', ':'))
+		token = base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+		return replace_query_param(self.base_url(), self.cursor_query_param, token)
+
+	def base_url(self):
+		url = self.request.build_absolute_uri()
+		if self.link_query_params is None:
+			return url
+		partes = urlsplit(url)
+		query = [(k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True) if k in self.link_query_params]
+		return urlunsplit(partes._replace(query=urlencode(query)))
+
+	def decode_cursor(self, request):
+		token = request.query_params.get(self.cursor_query_param)
+		if not token:
+			return None
+		try:
+			cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+			if not isinstance(cursor.get('v'), list):
+				raise ValueError
+			return cursor
+		except (TypeError, ValueError, UnicodeError, AttributeError):
+			raise NotFound(self.invalid_cursor_message)
+
+	def get_next_link(self):
+		if not self.has_next or self.last is None:
+			return None
+		return self.encode_cursor(self.last, reverse=False)
+
+	def get_previous_link(self):
+		if not self.has_previous:
+			return None
+		if self.first is None:
+			return remove_query_param(self.base_url(), self.cursor_query_param)
+		return self.encode_cursor(self.first, reverse=True)
@@ -0,0 +1,250 @@
+"""
+Búsqueda de texto completo para Inmueble.
+
+Dos backends intercambiables con la misma interfaz:
+- ``IndiceFullText``: índice FULLTEXT de MySQL sobre ``InmuebleDocumento.texto``.
+- ``IndiceInvertido``: tabla ``InmuebleTermino`` (término, inmueble, peso), portable a SQLite/tests.
+
+Ambos trabajan sobre texto normalizado (sin acentos, en minúsculas), por lo que
+"san joaquin" encuentra "San Joaquín". El backend se elige con ``settings.BUSQUEDA_BACKEND``
+('auto', 'fulltext' o 'invertido'); 'auto' usa FULLTEXT sólo si la base de datos es MySQL.
+"""
+import re
+import unicodedata
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Case, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Inmueble, InmuebleDocumento, InmuebleTermino
+
+
+# Peso de cada campo en la relevancia
+PESOS = {
+	'codigo_referencia': 8,
+	'titulo_publicacion': 4,
+	'municipio': 2,
+	'ciudad': 2,
+	'descripcion_publica': 1,
+}
+
+STOPWORDS = frozenset({
+	'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los',
+	'para', 'por', 'un', 'una', 'y', 'e', 'o', 'u',
+})
+
+# Lista de stopwords por defecto de InnoDB (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD):
+# no entran en el índice FULLTEXT, así que un ``+termino`` con ellas no encuentra nada
+STOPWORDS_INNODB = frozenset({
+	'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from',
+	'how', 'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to',
+	'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www',
+})
+
+LONGITUD_TERMINO = 64
+MAX_TERMINOS_CONSULTA = 8
+TAMANO_LOTE = 500
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalizar(texto):
+	"""Minúsculas y sin acentos: 'Joaquín' -> 'joaquin'."""
+	texto = unicodedata.normalize('NFKD', texto or '')
+	return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+	return [t[:LONGITUD_TERMINO] for t in _TOKEN_RE.findall(normalizar(texto)) if t not in STOPWORDS]
+
+
+def terminos_consulta(consulta):
+	"""Términos únicos de la consulta del usuario, en orden y acotados."""
+	vistos = []
+	for termino in tokenizar(consulta):
+		if termino not in vistos:
+			vistos.append(termino)
+	return vistos[:MAX_TERMINOS_CONSULTA]
+
+
+def campos_inmueble(inmueble):
+	"""Texto de cada campo indexado (requiere municipio/ciudad ya cargados para evitar consultas)."""
+	municipio = inmueble.municipio
+	ciudad = municipio.ciudad if municipio else None
+	return {
+		'codigo_referencia': inmueble.codigo_referencia,
+		'titulo_publicacion': inmueble.titulo_publicacion,
+		'municipio': municipio.nombre_municipio if municipio else '',
+		'ciudad': ciudad.nombre_ciudad if ciudad else '',
+		'descripcion_publica': inmueble.descripcion_publica,
+	}
+
+
+def terminos_ponderados(inmueble):
+	pesos = {}
+	for campo, texto in campos_inmueble(inmueble).items():
+		for termino in tokenizar(texto):
+			pesos[termino] = pesos.get(termino, 0) + PESOS[campo]
+	return pesos
+
+
+def _prefijo(campo, termino):
+	# Los términos sólo contienen [a-z0-9] y '{' es el siguiente carácter tras 'z', así que
+	# el rango [termino, termino + '{') equivale a "empieza por" y usa el índice B-tree
+	# tanto en MySQL como en SQLite (donde LIKE no lo usa).
+	return Q(**{f'{campo}__gte': termino, f'{campo}__lt': termino + '{'})
+
+
+class IndiceInvertido:
+	"""Índice invertido sobre InmuebleTermino; coincidencia por prefijo y relevancia = suma de pesos."""
+	nombre = 'invertido'
+
+	def indexar(self, inmuebles):
+		inmuebles = list(inmuebles)
+		InmuebleTermino.objects.filter(inmueble__in=inmuebles).delete()
+		InmuebleTermino.objects.bulk_create([
+			InmuebleTermino(inmueble=inmueble, termino=termino, peso=peso)
+			for inmueble in inmuebles
+			for termino, peso in terminos_ponderados(inmueble).items()
+		], batch_size=TAMANO_LOTE)
+
+	def vaciar(self):
+		InmuebleTermino.objects.all().delete()
+
+	def puntuaciones(self, terminos):
+		"""Filas (inmueble_id, relevancia) de los inmuebles que contienen todos los términos."""
+		coincide = {
+			f'coincide_{i}': Max(Case(When(_prefijo('termino', t), then=Value(1)), default=Value(0), output_field=IntegerField()))
+			for i, t in enumerate(terminos)
+		}
+		return (
+			InmuebleTermino.objects
+			.filter(reduce(or_, [_prefijo('termino', t) for t in terminos]))
+			.values('inmueble_id')
+			.annotate(relevancia=Sum('peso'), **coincide)
+			.filter(**{nombre: 1 for nombre in coincide})
+			.values('inmueble_id', 'relevancia')
+		)
+
+
+class IndiceFullText:
+	"""Índice FULLTEXT de MySQL. El peso de cada campo se aplica repitiendo su texto en el documento."""
+	nombre = 'fulltext'
+	nombre_indice = 'ft_inmuebledocumento_texto'
+
+	def documento(self, inmueble):
+		partes = []
+		for campo, texto in campos_inmueble(inmueble).items():
+			texto = normalizar(texto)
+			if texto:
+				partes.extend([texto] * PESOS[campo])
+		return ' '.join(partes)
+
+	def indexar(self, inmuebles):
+		inmuebles = list(inmuebles)
+		InmuebleDocumento.objects.filter(inmueble__in=inmuebles).delete()
+		InmuebleDocumento.objects.bulk_create([
+			InmuebleDocumento(inmueble=inmueble, texto=self.documento(inmueble))
+			for inmueble in inmuebles
+		], batch_size=TAMANO_LOTE)
+
+	def vaciar(self):
+		InmuebleDocumento.objects.all().delete()
+
+	def consulta_booleana(self, terminos):
+		"""``+t1* +t2*`` sin los términos que InnoDB no indexa (cortos o stopwords).
+
+		Exigir uno de ellos con ``+`` dejaría la búsqueda sin resultados.
+		"""
+		minimo = getattr(settings, 'BUSQUEDA_FT_MIN_TOKEN', 3)
+		return ' '.join(
+			f'+{t}*' for t in terminos
+			if len(t) >= minimo and t not in STOPWORDS_INNODB
+		)
+
+	def puntuaciones(self, terminos):
+		tabla = InmuebleDocumento._meta.db_table
+		consulta = self.consulta_booleana(terminos)
+		puntuaciones = (
+			InmuebleDocumento.objects
+			.annotate(relevancia=RawSQL(f'MATCH ({tabla}.texto) AGAINST (%s IN BOOLEAN MODE)', (consulta,)))
+			.filter(relevancia__gt=0)
+			.values('inmueble_id', 'relevancia')
+		)
+		# Si ningún término está en el índice nada puede coincidir
+		return puntuaciones if consulta else puntuaciones.none()
+
+	def asegurar_indice(self, using='default'):
+		"""Crea el índice FULLTEXT si no existe (las migraciones no se versionan en este repo)."""
+		conexion = connections[using]
+		tabla = InmuebleDocumento._meta.db_table
+		with conexion.cursor() as cursor:
+			cursor.execute(
+				'SELECT COUNT(*) FROM information_schema.statistics '
+				'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s',
+				[tabla, self.nombre_indice]
+			)
+			if cursor.fetchone()[0] == 0:
+				cursor.execute(f'ALTER TABLE {tabla} ADD FULLTEXT INDEX {self.nombre_indice} (texto)')
+
+
+BACKENDS = {
+	IndiceInvertido.nombre: IndiceInvertido,
+	IndiceFullText.nombre: IndiceFullText,
+}
+
+
+def get_backend():
+	nombre = getattr(settings, 'BUSQUEDA_BACKEND', 'auto')
+	if nombre == 'auto':
+		nombre = IndiceFullText.nombre if connection.vendor == 'mysql' else IndiceInvertido.nombre
+	return BACKENDS[nombre]()
+
+
+def indexar(inmuebles):
+	"""(Re)indexa los inmuebles dados dentro de una transacción."""
+	with transaction.atomic():
+		get_backend().indexar(inmuebles)
+
+
+def reindexar(queryset=None, tamano_lote=TAMANO_LOTE):
+	"""Reconstruye el índice por lotes; devuelve el número de inmuebles indexados."""
+	if queryset is None:
+		queryset = Inmueble.objects.all()
+	queryset = queryset.select_related('municipio__ciudad').order_by('pk')
+	total = 0
+	ultimo_pk = 0
+	while True:
+		lote = list(queryset.filter(pk__gt=ultimo_pk)[:tamano_lote])
+		if not lote:
+			return total
+		indexar(lote)
+		total += len(lote)
+		ultimo_pk = lote[-1].pk
+
+
+def buscar(queryset, consulta):
+	"""Filtra ``queryset`` por la consulta y anota ``relevancia``, ordenando por ella."""
+	terminos = terminos_consulta(consulta)
+	if not terminos:
+		return queryset
+	puntuaciones = get_backend().puntuaciones(terminos)
+	return (
+		queryset
+		.filter(pk__in=puntuaciones.values('inmueble_id'))
+		.annotate(relevancia=Subquery(puntuaciones.filter(inmueble_id=OuterRef('pk')).values('relevancia')[:1]))
+		.order_by('-relevancia', '-fecha_publicacion', '-pk')
+	)
+
+
+class BusquedaTextoFilter(filters.BaseFilterBackend):
+	"""Reemplazo de SearchFilter que usa el índice de texto completo (mismo parámetro ``?search=``)."""
+	search_param = api_settings.SEARCH_PARAM
+
+	def filter_queryset(self, request, queryset, view):
+		return buscar(queryset, request.query_params.get(self.search_param, ''))
@@ -5,14 +5,136 @@ from .models import (
     Operacion, Cita, Conversacion, Mensaje
 )
 from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_field_tree(value):
+    """'id,municipio.ciudad,municipio.nombre_municipio' -> {'id': {}, 'municipio': {'ciudad': {}, 'nombre_municipio': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets for GET requests: ``?fields=`` and ``?expand=``.
+
+    - ``?fields=id,precio,municipio.nombre_municipio`` keeps only those fields (dotted paths
+      select inside nested objects).
+    - ``?expand=municipio.ciudad`` keeps only those relations nested; every other nested
+      relation is returned as its primary key. Without ``expand`` everything stays nested.
+
+    The top-level serializer reads the query string; nested serializers receive their
+    part of the tree from their parent. Pass ``sparse=False`` to ignore the request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._sparse_enabled = kwargs.pop('sparse', True)
+        self._sparse_spec = None
+        super().__init__(*args, **kwargs)
+
+    def get_sparse_spec(self):
+        """(fields tree or None, expand tree or None) for this serializer."""
+        if self._sparse_spec is not None:
+            return self._sparse_spec
+        request = self.context.get('request')
+        top_level = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+        if not (self._sparse_enabled and top_level and request is not None and request.method in SAFE_METHODS):
+            return None, None
+        params = request.query_params
+        fields = parse_field_tree(params['fields']) if 'fields' in params else None
+        expand = parse_field_tree(params['expand']) if 'expand' in params else None
+        return fields or None, expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.get_sparse_spec()
+        if only is None and expand is None:
+            return fields
+
+        for name in list(fields):
+            field = fields[name]
+            if field.write_only:
+                continue
+            if only is not None and name not in only:
+                del fields[name]
+                continue
+
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+            if expand is not None and name not in expand:
+                # Collapse to primary key(s): no nested serialization, no join needed
+                fields[name] = serializers.PrimaryKeyRelatedField(source=field.source, read_only=True, many=many)
+            elif isinstance(nested, DynamicFieldsMixin):
+                nested._sparse_spec = (
+                    (only or {}).get(name) or None,
+                    expand.get(name, {}) if expand is not None else None,
+                )
+        return fields
+
+
+class DynamicFieldsModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+
+def related_paths(serializer, prefix=''):
+    """select_related / prefetch_related lookups needed to render ``serializer``'s fields."""
+    from django.db.models import Prefetch
+
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ManyRelatedField):
+            prefetch.append(path)
+        elif isinstance(field, serializers.ListSerializer):
+            child_select, child_prefetch = related_paths(field.child)
+            queryset = field.child.Meta.model.objects.select_related(*child_select).prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            child_select, child_prefetch = related_paths(field, prefix=path + '__')
+            select.extend(child_select)
+            prefetch.extend(child_prefetch)
+    return select, prefetch
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that first looks the pk up in ``context['preloaded'][model]``
+    (a pk -> instance map loaded once for a whole batch) instead of querying per value."""
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        preloaded = self.context.get('preloaded', {}).get(model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
 
 # Geographical serializers
-class EstadoSerializer(serializers.ModelSerializer):
+class EstadoSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Estado
         fields = '__all__'
 
-class CiudadSerializer(serializers.ModelSerializer):
+class CiudadSerializer(DynamicFieldsModelSerializer):
     estado = EstadoSerializer(read_only=True)
     estado_id = serializers.PrimaryKeyRelatedField(
         queryset=Estado.objects.all(),
@@ -24,7 +146,7 @@ class CiudadSerializer(serializers.ModelSerializer):
         model = Ciudad
         fields = ['id', 'nombre_ciudad', 'estado', 'estado_id']
 
-class MunicipioSerializer(serializers.ModelSerializer):
+class MunicipioSerializer(DynamicFieldsModelSerializer):
     ciudad = CiudadSerializer(read_only=True)
     ciudad_id = serializers.PrimaryKeyRelatedField(
         queryset=Ciudad.objects.all(),
@@ -37,12 +159,12 @@ class MunicipioSerializer(serializers.ModelSerializer):
         fields = ['id', 'nombre_municipio', 'ciudad', 'ciudad_id']
 
 # User and authentication serializers
-class RolSerializer(serializers.ModelSerializer):
+class RolSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Rol
         fields = '__all__'
 
-class UsuarioSerializer(serializers.ModelSerializer):
+class UsuarioSerializer(DynamicFieldsModelSerializer):
     rol = RolSerializer(read_only=True)
     rol_id = serializers.PrimaryKeyRelatedField(
         queryset=Rol.objects.all(),
@@ -71,41 +193,41 @@ class UsuarioSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 # Property related serializers
-class TipoInmuebleSerializer(serializers.ModelSerializer):
+class TipoInmuebleSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = TipoInmueble
         fields = '__all__'
 
-class CaracteristicaSerializer(serializers.ModelSerializer):
+class CaracteristicaSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Caracteristica
         fields = '__all__'
 
-class InmuebleCaracteristicaSerializer(serializers.ModelSerializer):
+class InmuebleCaracteristicaSerializer(DynamicFieldsModelSerializer):
     caracteristica = CaracteristicaSerializer(read_only=True)
     class Meta:
         model = InmuebleCaracteristica
         fields = ['caracteristica', 'valor']
 
-class InmuebleSerializer(serializers.ModelSerializer):
+class InmuebleSerializer(DynamicFieldsModelSerializer):
     # Nested serializers to show related data
     tipo_inmueble = TipoInmuebleSerializer(read_only=True)
     municipio = MunicipioSerializer(read_only=True)
     propietario = UsuarioSerializer(read_only=True)
     moderador = UsuarioSerializer(read_only=True)
 
-    # Writable fields for creating/updating
-    tipo_inmueble_id = serializers.PrimaryKeyRelatedField(
+    # Writable fields for creating/updating (batch writes preload them, see api/batch.py)
+    tipo_inmueble_id = PreloadedPrimaryKeyRelatedField(
         queryset=TipoInmueble.objects.all(),
         source='tipo_inmueble',
         write_only=True
     )
-    municipio_id = serializers.PrimaryKeyRelatedField(
+    municipio_id = PreloadedPrimaryKeyRelatedField(
         queryset=Municipio.objects.all(),
         source='municipio',
         write_only=True
     )
-    propietario_id = serializers.PrimaryKeyRelatedField(
+    propietario_id = PreloadedPrimaryKeyRelatedField(
         queryset=Usuario.objects.all(),
         source='propietario',
         write_only=True
@@ -122,29 +244,90 @@ class InmuebleSerializer(serializers.ModelSerializer):
             'direccion_exacta', 'precio', 'superficie_terreno',
             'superficie_construccion', 'habitaciones', 'banos',
             'puestos_estacionamiento', 'ano_construccion', 'estatus_venta',
-            'estatus_moderacion', 'moderador', 'fecha_moderacion', 'motivo_rechazo',
+            'latitud', 'longitud', 'estatus_moderacion', 'moderador', 'fecha_moderacion', 'motivo_rechazo',
             'propietario', 'propietario_id', 'fecha_publicacion', 'caracteristicas'
         ]
         read_only_fields = ['estatus_moderacion', 'moderador', 'fecha_moderacion', 'motivo_rechazo']
 
 
+class InmuebleLoteSerializer(InmuebleSerializer):
+    """One item of POST /api/inmuebles/batch/. Uniqueness of codigo_referencia is checked
+    for the whole batch at once in api/batch.py instead of one query per item."""
+
+    class Meta(InmuebleSerializer.Meta):
+        extra_kwargs = {'codigo_referencia': {'validators': []}}
+
+
 # Transactional and communication serializers
-class OperacionSerializer(serializers.ModelSerializer):
+class OperacionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Operacion
         fields = '__all__'
 
-class CitaSerializer(serializers.ModelSerializer):
+class CitaSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Cita
         fields = '__all__'
 
-class ConversacionSerializer(serializers.ModelSerializer):
+class ConversacionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Conversacion
         fields = '__all__'
 
-class MensajeSerializer(serializers.ModelSerializer):
+class MensajeSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Mensaje
         fields = '__all__'
+
+
+# Inbox serializers (GET /api/conversaciones/inbox/)
+class UsuarioResumenSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = Usuario
+        fields = ['id', 'nombres', 'apellidos']
+
+
+class MensajeResumenSerializer(DynamicFieldsModelSerializer):
+    usuario_emisor = UsuarioResumenSerializer(read_only=True)
+
+    class Meta:
+        model = Mensaje
+        fields = ['id', 'contenido_mensaje', 'fecha_envio', 'leido', 'usuario_emisor']
+
+
+class ConversacionInboxSerializer(DynamicFieldsModelSerializer):
+    """One inbox row. The view loads the last messages and unread counts for the whole
+    page at once and passes them in ``context['ultimos']`` / ``context['no_leidos']``."""
+    inmueble = serializers.SerializerMethodField()
+    usuario_interesado = UsuarioResumenSerializer(read_only=True)
+    usuario_vendedor = UsuarioResumenSerializer(read_only=True)
+    ultima_actividad = serializers.DateTimeField(read_only=True)
+    ultimo_mensaje = serializers.SerializerMethodField()
+    no_leidos = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversacion
+        fields = [
+            'id', 'inmueble', 'usuario_interesado', 'usuario_vendedor', 'fecha_creacion',
+            'ultima_actividad', 'ultimo_mensaje', 'no_leidos'
+        ]
+
+    def get_inmueble(self, obj):
+        inmueble = obj.inmueble
+        # Card data comes from the listing read model when it exists (see api/listado.py)
+        listado = getattr(inmueble, 'listado', None)
+        return {
+            'id': inmueble.id,
+            'codigo_referencia': inmueble.codigo_referencia,
+            'titulo_publicacion': inmueble.titulo_publicacion,
+            'precio': inmueble.precio,
+            'ubicacion': listado.ubicacion if listado else None,
+            'imagen': listado.imagen if listado else None,
+        }
+
+    def get_ultimo_mensaje(self, obj):
+        mensaje = self.context.get('ultimos', {}).get(obj.id)
+        return MensajeResumenSerializer(mensaje).data if mensaje else None
+
+    def get_no_leidos(self, obj):
+        return self.context.get('no_leidos', {}).get(obj.id, 0)
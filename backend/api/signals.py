@@ -0,0 +1,294 @@
+"""Señales del app api: mantienen al día el índice de búsqueda, el modelo de lectura del
+listado, las estadísticas y las cachés de respuestas, y publican los mensajes nuevos."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import agenda, autenticacion, cache, estadisticas, geo, listado, search, tiempo_real
+from .models import (
+	Caracteristica, Cita, Ciudad, Estado, Inmueble, InmuebleCaracteristica, Mensaje, Municipio, Operacion,
+	RegistroEliminado, Rol, TipoInmueble, Usuario
+)
+
+
+@receiver(pre_save, sender=Inmueble)
+def asignar_geohash(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	instance.geohash = geo.geohash_de(instance)
+
+
+@receiver(pre_save, sender=Cita)
+def asignar_fin_cita(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	instance.fecha_fin_cita = agenda.fin_de(instance)
+
+
+@receiver(post_save, sender=Inmueble)
+def indexar_inmueble(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	search.indexar([instance])
+
+
+@receiver(post_save, sender=Municipio)
+def reindexar_municipio(sender, instance, created=False, raw=False, **kwargs):
+	# El nombre del municipio forma parte del documento de cada inmueble
+	if raw or created:
+		return
+	search.reindexar(Inmueble.objects.filter(municipio=instance))
+
+
+@receiver(post_save, sender=Ciudad)
+def reindexar_ciudad(sender, instance, created=False, raw=False, **kwargs):
+	if raw or created:
+		return
+	search.reindexar(Inmueble.objects.filter(municipio__ciudad=instance))
+
+
+@receiver(post_save, sender=Inmueble)
+def actualizar_listado_inmueble(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	listado.actualizar([instance])
+
+
+@receiver(post_save, sender=InmuebleCaracteristica)
+@receiver(post_delete, sender=InmuebleCaracteristica)
+def actualizar_listado_caracteristicas(sender, instance, raw=False, origin=None, **kwargs):
+	# Al borrar el inmueble sus características se borran en cascada junto con su fila
+	if raw or isinstance(origin, Inmueble) or getattr(origin, 'model', None) is Inmueble:
+		return
+	listado.actualizar_queryset(Inmueble.objects.filter(pk=instance.inmueble_id))
+
+
+@receiver(post_save, sender=Caracteristica)
+def actualizar_listado_caracteristica(sender, instance, created=False, raw=False, **kwargs):
+	if raw or created:
+		return
+	listado.actualizar_queryset(Inmueble.objects.filter(inmueblecaracteristica__caracteristica=instance))
+
+
+@receiver(post_save, sender=Municipio)
+def actualizar_listado_municipio(sender, instance, created=False, raw=False, **kwargs):
+	if raw or created:
+		return
+	listado.actualizar_queryset(Inmueble.objects.filter(municipio=instance))
+
+
+@receiver(post_save, sender=Ciudad)
+def actualizar_listado_ciudad(sender, instance, created=False, raw=False, **kwargs):
+	if raw or created:
+		return
+	listado.actualizar_queryset(Inmueble.objects.filter(municipio__ciudad=instance))
+
+
+# Borrar un municipio o una ciudad pone sus llaves en NULL con un UPDATE sin señales:
+# se anotan los inmuebles afectados antes y se actualizan después.
+@receiver(pre_delete, sender=Municipio)
+def anotar_listado_municipio(sender, instance, **kwargs):
+	instance._inmuebles_listado = list(Inmueble.objects.filter(municipio=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Ciudad)
+def anotar_listado_ciudad(sender, instance, **kwargs):
+	instance._inmuebles_listado = list(Inmueble.objects.filter(municipio__ciudad=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Municipio)
+@receiver(post_delete, sender=Ciudad)
+def actualizar_listado_ubicacion_eliminada(sender, instance, **kwargs):
+	pks = getattr(instance, '_inmuebles_listado', None)
+	if pks:
+		listado.actualizar_queryset(Inmueble.objects.filter(pk__in=pks))
+
+
+# Estadísticas de mercado: antes de escribir se toma lo que aportaban los inmuebles
+# afectados y después se suma la diferencia (ver api/estadisticas.py)
+def _tomar_aportes(instance, inmuebles):
+	if instance.huella_estadistica() != getattr(instance, '_estadistica_cargada', None):
+		instance._aportes_previos = estadisticas.aportes(inmuebles)
+
+
+def _aplicar_aportes(instance, inmuebles, eliminado):
+	if '_aportes_previos' not in instance.__dict__:
+		return
+	estadisticas.aplicar(instance.__dict__.pop('_aportes_previos'), estadisticas.aportes(inmuebles))
+	instance._estadistica_cargada = None if eliminado else instance.huella_estadistica()
+
+
+@receiver(pre_save, sender=Inmueble)
+@receiver(pre_delete, sender=Inmueble)
+def tomar_estadisticas_inmueble(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	if kwargs['signal'] is pre_delete:
+		instance._estadistica_cargada = None
+	_tomar_aportes(instance, [instance.pk])
+
+
+@receiver(post_save, sender=Inmueble)
+@receiver(post_delete, sender=Inmueble)
+def actualizar_estadisticas_inmueble(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	_aplicar_aportes(instance, [instance.pk], eliminado=kwargs['signal'] is post_delete)
+
+
+@receiver(pre_save, sender=Operacion)
+@receiver(pre_delete, sender=Operacion)
+def tomar_estadisticas_operacion(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	if kwargs['signal'] is pre_delete:
+		instance._estadistica_cargada = None
+	cargada = getattr(instance, '_estadistica_cargada', None)
+	inmuebles = {instance.inmueble_id}
+	if cargada is not None:
+		inmuebles.add(cargada[0])
+	elif instance.pk is not None:
+		# Sin lo leído de la BD: el inmueble anterior se consulta
+		inmuebles.update(Operacion.objects.filter(pk=instance.pk).values_list('inmueble_id', flat=True))
+	instance._inmuebles_estadistica = inmuebles
+	_tomar_aportes(instance, inmuebles)
+
+
+@receiver(post_save, sender=Operacion)
+@receiver(post_delete, sender=Operacion)
+def actualizar_estadisticas_operacion(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	inmuebles = instance.__dict__.pop('_inmuebles_estadistica', {instance.inmueble_id})
+	_aplicar_aportes(instance, inmuebles, eliminado=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=Mensaje)
+def publicar_mensaje_creado(sender, instance, created=False, raw=False, **kwargs):
+	# Entrega en tiempo real a los participantes (ver api/tiempo_real.py); un fallo del broker
+	# no debe deshacer el envío del mensaje
+	if raw or not created:
+		return
+	transaction.on_commit(lambda: tiempo_real.publicar_mensaje(instance.pk), robust=True)
+
+
+@receiver(post_delete, sender=Mensaje)
+@receiver(post_delete, sender=Cita)
+def registrar_eliminado(sender, instance, **kwargs):
+	# Marca de borrado para la sincronización incremental (ver api/sync.py)
+	RegistroEliminado.objects.create(modelo=sender._meta.label_lower, objeto_id=instance.pk)
+
+
+def _afecta_listado_publico(instance, created):
+	"""Sólo los inmuebles aprobados (antes o después del cambio) aparecen en /api/casas/."""
+	if instance.estatus_moderacion == 'Aprobado':
+		return True
+	if created:
+		return False
+	anterior = getattr(instance, '_estatus_moderacion_cargado', 'Aprobado')
+	return anterior == 'Aprobado'
+
+
+@receiver(post_save, sender=Inmueble)
+def invalidar_casas_inmueble(sender, instance, created=False, **kwargs):
+	if _afecta_listado_publico(instance, created):
+		cache.invalidar(cache.CASAS_PUBLICAS)
+	instance._estatus_moderacion_cargado = instance.estatus_moderacion
+
+
+@receiver(post_delete, sender=Inmueble)
+def invalidar_casas_inmueble_eliminado(sender, instance, **kwargs):
+	if _afecta_listado_publico(instance, created=False):
+		cache.invalidar(cache.CASAS_PUBLICAS)
+
+
+@receiver(post_save, sender=Municipio)
+@receiver(post_save, sender=Ciudad)
+def invalidar_casas_ubicacion(sender, instance, created=False, **kwargs):
+	# La ubicación de cada casa se arma con los nombres de ciudad y municipio
+	if not created:
+		cache.invalidar(cache.CASAS_PUBLICAS)
+
+
+@receiver(post_save, sender=Estado)
+@receiver(post_save, sender=Ciudad)
+@receiver(post_save, sender=Municipio)
+@receiver(post_save, sender=TipoInmueble)
+@receiver(post_save, sender=Caracteristica)
+@receiver(post_delete, sender=Estado)
+@receiver(post_delete, sender=Ciudad)
+@receiver(post_delete, sender=Municipio)
+@receiver(post_delete, sender=TipoInmueble)
+@receiver(post_delete, sender=Caracteristica)
+def invalidar_referencia(sender, **kwargs):
+	cache.invalidar(cache.REFERENCIA)
+
+
+def invalidar_calendarios(usuario_ids):
+	cache.invalidar(*[cache.calendario(usuario_id) for usuario_id in set(usuario_ids) - {None}])
+
+
+@receiver(pre_save, sender=Cita)
+def tomar_participantes_cita(sender, instance, raw=False, **kwargs):
+	# Sin lo leído de la BD (instancia armada a mano o con campos diferidos) se consultan
+	if raw or '_participantes_cargados' in instance.__dict__ or instance.pk is None:
+		return
+	instance._participantes_cargados = {
+		usuario_id
+		for fila in Cita.objects.filter(pk=instance.pk).values_list('usuario_interesado_id', 'usuario_propietario_id')
+		for usuario_id in fila
+	}
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+def invalidar_calendario_cita(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	participantes = {instance.usuario_interesado_id, instance.usuario_propietario_id}
+	invalidar_calendarios(participantes | getattr(instance, '_participantes_cargados', set()))
+	instance._participantes_cargados = participantes
+
+
+def _participantes_citas(inmuebles):
+	filas = Cita.objects.filter(inmueble__in=inmuebles).values_list('usuario_interesado_id', 'usuario_propietario_id')
+	return {usuario_id for fila in filas for usuario_id in fila}
+
+
+@receiver(post_save, sender=Inmueble)
+def invalidar_calendario_inmueble(sender, instance, created=False, raw=False, **kwargs):
+	# Los eventos del calendario muestran el título y la dirección del inmueble
+	if raw or created:
+		return
+	invalidar_calendarios(_participantes_citas([instance.pk]))
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def descartar_usuario_autenticado(sender, instance, **kwargs):
+	# Incluye los cambios de ``activo``: un usuario desactivado deja de autenticarse
+	autenticacion.usuarios.descartar(instance.pk)
+
+
+@receiver(post_save, sender=Rol)
+@receiver(post_delete, sender=Rol)
+def descartar_usuarios_autenticados(sender, **kwargs):
+	autenticacion.usuarios.limpiar()
+
+
+# Bulk writes (bulk_create, bulk_update, QuerySet.update) do not send signals;
+# code doing them calls these hooks once per batch instead.
+def inmuebles_guardados_en_bloque(queryset):
+	"""Lo que harían los post_save de Inmueble para cada fila de ``queryset``.
+
+	Las estadísticas no: quien escribe toma ``estadisticas.aportes`` de las filas antes de
+	escribir y llama a ``estadisticas.aplicar`` después.
+	"""
+	search.reindexar(queryset)
+	listado.actualizar_queryset(queryset)
+	invalidar_calendarios(_participantes_citas(queryset.values('pk')))
+	cache.invalidar(cache.CASAS_PUBLICAS)
+
+
+def referencia_modificada_en_bloque():
+	cache.invalidar(cache.REFERENCIA)
@@ -0,0 +1,171 @@
+"""
+Sincronización incremental de mensajes y citas (``?since=`` / ``?after_id=`` en sus listados).
+
+``?since=<marca>`` devuelve las filas creadas o modificadas después de la marca (por el
+índice ``(fecha_actualizacion, id)``) y los ids eliminados desde entonces (RegistroEliminado),
+junto con la marca nueva. El cliente la guarda y la envía en la siguiente consulta; el coste
+de cada una depende de lo que cambió, no del tamaño del historial. La primera sincronización
+se hace con ``?since=0`` (o con una fecha ISO 8601) y se recorre mientras ``has_more`` sea true.
+
+La marca nunca avanza más allá de ``ahora - MARGEN``: una transacción que asignó su
+``fecha_actualizacion`` antes de la consulta pero confirmó después quedaría detrás de la
+marca y se perdería. Las filas de ese margen se vuelven a enviar en la consulta siguiente;
+como el cliente las aplica por id, repetirlas no tiene efecto.
+
+``?after_id=<id>`` es el modo simple para listas de solo inserción: filas con id mayor.
+
+``QuerySet.update()`` no actualiza los campos ``auto_now``: las escrituras en bloque sobre
+estos modelos deben asignar ``fecha_actualizacion=Now()`` para que la sincronización las vea.
+"""
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import RegistroEliminado
+
+TAMANO_LOTE = 200
+MAX_LOTE = 1000
+
+MARGEN = datetime.timedelta(seconds=getattr(settings, 'SYNC_MARGEN_SEGUNDOS', 5))
+
+# Los registros de borrado más antiguos se pueden purgar (manage.py purgar_eliminados); una
+# marca anterior a esta ventana obliga al cliente a sincronizar desde cero
+RETENCION = datetime.timedelta(days=getattr(settings, 'SYNC_RETENCION_DIAS', 30))
+
+INICIO = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _posterior(campo_fecha, fecha, ultimo_id):
+	"""Filas después de (fecha, id) en el orden ``campo_fecha, id``."""
+	return Q(**{f'{campo_fecha}__gte': fecha}) & (
+		Q(**{f'{campo_fecha}__gt': fecha}) | Q(**{campo_fecha: fecha, 'id__gt': ultimo_id})
+	)
+
+
+def codificar_marca(cambios, eliminados):
+	crudo = json.dumps(
+		{'c': [cambios[0].isoformat(), cambios[1]], 'e': [eliminados[0].isoformat(), eliminados[1]]},
+		separators=(',', ':')
+	)
+	return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+
+
+def _fecha(valor):
+	fecha = parse_datetime(valor)
+	if fecha is None:
+		raise ValueError(valor)
+	return fecha if timezone.is_aware(fecha) else timezone.make_aware(fecha)
+
+
+def decodificar_marca(valor, ahora):
+	"""Posiciones (fecha, id) de cambios y de eliminados.
+
+	``0`` es el inicio (sin eliminados: el cliente aún no tiene nada que borrar) y una fecha
+	ISO 8601 equivale a una marca en ese instante.
+	"""
+	try:
+		if valor == '0':
+			return (INICIO, 0), (ahora, 0)
+		try:
+			fecha = _fecha(valor)
+			return (fecha, 0), (fecha, 0)
+		except ValueError:
+			pass
+		marca = json.loads(base64.urlsafe_b64decode(valor.encode('ascii')).decode('utf-8'))
+		return (_fecha(marca['c'][0]), int(marca['c'][1])), (_fecha(marca['e'][0]), int(marca['e'][1]))
+	except (TypeError, ValueError, KeyError, IndexError, UnicodeError, AttributeError):
+		raise ValidationError({'since': 'Marca de sincronización inválida.'})
+
+
+def _lote(queryset, campo_fecha, posicion, limite):
+	filas = list(queryset.filter(_posterior(campo_fecha, *posicion)).order_by(campo_fecha, 'id')[:limite + 1])
+	return filas[:limite], len(filas) > limite
+
+
+def _avance(posicion, ultima, hay_mas, ahora):
+	"""Posición tras entregar un lote: la de la última fila, pero sin pasar de ``ahora - MARGEN``
+	cuando ya no quedan más (ver el docstring del módulo)."""
+	nueva = ultima if ultima is not None else posicion
+	if not hay_mas and nueva[0] > ahora - MARGEN:
+		nueva = max(posicion, (ahora - MARGEN, 0))
+	return nueva
+
+
+def cambios_desde(queryset, marca, limite, ahora=None):
+	"""(filas modificadas, ids eliminados, marca nueva, hay_mas) del ``queryset`` desde ``marca``."""
+	ahora = ahora or timezone.now()
+	cambios, eliminados = decodificar_marca(marca, ahora)
+	if eliminados[0] < ahora - RETENCION:
+		return None
+
+	filas, mas_filas = _lote(queryset, 'fecha_actualizacion', cambios, limite)
+	registros, mas_registros = _lote(
+		RegistroEliminado.objects.filter(modelo=queryset.model._meta.label_lower),
+		'fecha_eliminacion', eliminados, limite
+	)
+	nueva = codificar_marca(
+		_avance(cambios, (filas[-1].fecha_actualizacion, filas[-1].id) if filas else None, mas_filas, ahora),
+		_avance(eliminados, (registros[-1].fecha_eliminacion, registros[-1].id) if registros else None, mas_registros, ahora),
+	)
+	return filas, [registro.objeto_id for registro in registros], nueva, mas_filas or mas_registros
+
+
+class SincronizacionMixin:
+	"""Añade ``?since=`` y ``?after_id=`` al listado de un ModelViewSet cuyo modelo tiene
+	``fecha_actualizacion`` y registra sus borrados en RegistroEliminado (ver api/signals.py)."""
+
+	def list(self, request, *args, **kwargs):
+		if 'since' in request.query_params:
+			return self.sincronizar(request)
+		if 'after_id' in request.query_params:
+			return self.posteriores(request)
+		return super().list(request, *args, **kwargs)
+
+	def tamano_lote(self, request):
+		try:
+			valor = int(request.query_params.get('page_size', TAMANO_LOTE))
+		except ValueError:
+			valor = TAMANO_LOTE
+		return min(max(valor, 1), MAX_LOTE)
+
+	def sincronizar(self, request):
+		resultado = cambios_desde(
+			self.filter_queryset(self.get_queryset()), request.query_params['since'], self.tamano_lote(request)
+		)
+		if resultado is None:
+			return Response(
+				{'error': 'La marca es demasiado antigua; sincronice de nuevo con since=0.'},
+				status=status.HTTP_410_GONE
+			)
+		filas, eliminados, marca, hay_mas = resultado
+		return Response({
+			'results': self.get_serializer(filas, many=True).data,
+			'deleted': eliminados,
+			'watermark': marca,
+			'has_more': hay_mas,
+		})
+
+	def posteriores(self, request):
+		try:
+			ultimo_id = int(request.query_params['after_id'])
+		except ValueError:
+			raise ValidationError({'after_id': 'Debe ser un número entero.'})
+		limite = self.tamano_lote(request)
+		filas = list(
+			self.filter_queryset(self.get_queryset()).filter(id__gt=ultimo_id).order_by('id')[:limite + 1]
+		)
+		hay_mas = len(filas) > limite
+		filas = filas[:limite]
+		return Response({
+			'results': self.get_serializer(filas, many=True).data,
+			'after_id': filas[-1].id if filas else ultimo_id,
+			'has_more': hay_mas,
+		})
@@ -1,3 +1,1588 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+	autenticacion, cache as cache_respuestas, estadisticas, export, geo, moderacion, search, sync, throttling, tiempo_real, verificacion_google
+)
+from .management.commands import import_casas
+from .management.seeding import sembrar_nombres
+from .models import (
+	Estado, Ciudad, Municipio, Rol, Usuario, TipoInmueble, Caracteristica,
+	Inmueble, InmuebleCaracteristica, InmuebleListado, EstadisticaMercado, Operacion,
+	Conversacion, Mensaje, RegistroEliminado, Cita, VersionCache
+)
+
+
+class InmuebleQueryCountTests(TestCase):
+	"""Los listados de inmuebles deben costar el mismo número de consultas sin importar
+	cuántas filas traiga la página (regresión de N+1 en InmuebleSerializer)."""
+
+	@classmethod
+	def setUpTestData(cls):
+		rol = Rol.objects.create(nombre_rol='Propietario')
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		tipo = TipoInmueble.objects.create(nombre_tipo='Casa')
+		piscina = Caracteristica.objects.create(nombre_caracteristica='Piscina')
+		jardin = Caracteristica.objects.create(nombre_caracteristica='Jardín')
+
+		for i in range(12):
+			municipio = Municipio.objects.create(nombre_municipio=f'Municipio {i}', ciudad=ciudad)
+			propietario = Usuario.objects.create(
+				nombres='Dueño', apellidos=str(i), email=f'owner{i}@example.com', password_hash='x', rol=rol
+			)
+			moderador = Usuario.objects.create(
+				nombres='Moderador', apellidos=str(i), email=f'mod{i}@example.com', password_hash='x', rol=rol
+			)
+			inmueble = Inmueble.objects.create(
+				codigo_referencia=f'CASA-{i:03d}', titulo_publicacion=f'Casa {i}', tipo_inmueble=tipo,
+				municipio=municipio, direccion_exacta='Centro', precio=100000 + i, superficie_construccion=100,
+				habitaciones=3, banos=2, estatus_moderacion='Aprobado', propietario=propietario, moderador=moderador
+			)
+			InmuebleCaracteristica.objects.create(inmueble=inmueble, caracteristica=piscina, valor='Sí')
+			InmuebleCaracteristica.objects.create(inmueble=inmueble, caracteristica=jardin, valor='Sí')
+		# La fila de versión de la caché (api/cache.py) ya existe: cada petición solo la lee
+		cache.clear()
+		cache_respuestas.version(cache_respuestas.CASAS_PUBLICAS)
+
+	def setUp(self):
+		self.client = APIClient()
+		cache.clear()
+
+	def count_queries(self, url):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		return len(ctx.captured_queries)
+
+	def assertConstantQueries(self, url):
+		separator = '&' if '?' in url else '?'
+		small = self.count_queries(f'{url}{separator}page_size=2')
+		cache.clear()
+		large = self.count_queries(f'{url}{separator}page_size=10')
+		self.assertEqual(small, large, f'{url}: {small} consultas con 2 filas vs {large} con 10')
+		return large
+
+	def test_list(self):
+		self.assertLessEqual(self.assertConstantQueries('/api/inmuebles/'), 3)
+
+	def test_search(self):
+		self.assertLessEqual(self.assertConstantQueries('/api/inmuebles/search/?habitaciones=2'), 3)
+
+	def test_casas_action(self):
+		self.assertLessEqual(self.assertConstantQueries('/api/inmuebles/casas/'), 3)
+
+	def test_casas_publicas(self):
+		# Versión de la caché, conteo y página
+		self.assertLessEqual(self.assertConstantQueries('/api/casas/'), 3)
+
+
+class BusquedaFacetasTests(TestCase):
+	"""?facets= agrega conteos a la búsqueda sin cambiar la forma de la respuesta cuando está apagado."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		municipio = Municipio.objects.create(nombre_municipio='Naguanagua', ciudad=ciudad)
+		casa = TipoInmueble.objects.create(nombre_tipo='Casa')
+		apartamento = TipoInmueble.objects.create(nombre_tipo='Apartamento')
+		for i, (tipo, precio, habitaciones) in enumerate([
+			(casa, 40000, 2), (casa, 120000, 3), (apartamento, 60000, 7),
+		]):
+			Inmueble.objects.create(
+				codigo_referencia=f'FAC-{i}', titulo_publicacion='Casa', tipo_inmueble=tipo, municipio=municipio,
+				direccion_exacta='Centro', precio=precio, superficie_construccion=80, habitaciones=habitaciones,
+				estatus_moderacion='Aprobado'
+			)
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def test_facet_counts(self):
+		response = self.client.get('/api/inmuebles/search/?facets=1')
+		self.assertEqual(len(response.data['results']), 3)
+		facetas = response.data['facets']
+		self.assertEqual(facetas['total'], 3)
+		self.assertEqual([(t['nombre'], t['count']) for t in facetas['tipo_inmueble']], [('Casa', 2), ('Apartamento', 1)])
+		self.assertEqual([p['count'] for p in facetas['precio']], [1, 1, 1, 0, 0])
+		self.assertEqual([(h['etiqueta'], h['count']) for h in facetas['habitaciones']], [('2', 1), ('3', 1), ('5+', 1)])
+
+	def test_facets_only(self):
+		response = self.client.get('/api/inmuebles/search/?facets=only&precio_min=50000')
+		self.assertEqual(list(response.data), ['facets'])
+		self.assertEqual(response.data['facets']['total'], 2)
+
+	def test_facets_off_keeps_response_shape(self):
+		sin_facetas = self.client.get('/api/inmuebles/search/').data
+		for valor in ('0', 'false'):
+			self.assertEqual(self.client.get(f'/api/inmuebles/search/?facets={valor}').data, sin_facetas)
+		self.assertNotIn('facets', sin_facetas)
+
+	def test_price_ranges_from_settings(self):
+		with self.settings(FACETAS_RANGOS_PRECIO=[0, 100000]):
+			facetas = self.client.get('/api/inmuebles/search/?facets=only').data['facets']
+		self.assertEqual(
+			[(p['desde'], p['hasta'], p['count']) for p in facetas['precio']],
+			[(0, 100000, 2), (100000, None, 1)]
+		)
+
+
+@override_settings(BUSQUEDA_BACKEND='invertido')
+class BusquedaTextoTests(TestCase):
+	"""?search= con el índice invertido: relevancia, acentos, prefijos, todos los términos
+	y reindexado al renombrar municipio o ciudad."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		cls.ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		cls.naguanagua = Municipio.objects.create(nombre_municipio='Naguanagua', ciudad=cls.ciudad)
+		cls.san_diego = Municipio.objects.create(nombre_municipio='San Diego', ciudad=cls.ciudad)
+		cls.colonial, cls.apartamento, cls.quinta = [
+			Inmueble.objects.create(
+				codigo_referencia=f'BUS-{i}', titulo_publicacion=titulo, descripcion_publica=descripcion,
+				municipio=municipio, direccion_exacta='Centro', precio=1000, superficie_construccion=80,
+				estatus_moderacion='Aprobado'
+			)
+			for i, (titulo, descripcion, municipio) in enumerate([
+				('Casa colonial en Joaquín', '', cls.naguanagua),
+				('Apartamento', 'Cerca de una casa', cls.san_diego),
+				('Casa', 'Casa grande', cls.naguanagua),
+			])
+		]
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def buscar(self, consulta):
+		response = self.client.get('/api/inmuebles/', {'search': consulta})
+		self.assertEqual(response.status_code, 200)
+		return [fila['id'] for fila in response.data['results']]
+
+	def test_relevance_order(self):
+		# Título (4) + descripción (1) > sólo título > sólo descripción
+		self.assertEqual(self.buscar('casa'), [self.quinta.pk, self.colonial.pk, self.apartamento.pk])
+
+	def test_accent_and_case_insensitive(self):
+		for consulta in ('joaquin', 'JOAQUÍN', 'Joaquín'):
+			self.assertEqual(self.buscar(consulta), [self.colonial.pk], consulta)
+
+	def test_prefix_match(self):
+		self.assertEqual(self.buscar('apart'), [self.apartamento.pk])
+		self.assertEqual(self.buscar('colon joaq'), [self.colonial.pk])
+
+	def test_all_terms_required(self):
+		self.assertEqual(self.buscar('casa colonial'), [self.colonial.pk])
+		self.assertEqual(self.buscar('casa apartamento'), [self.apartamento.pk])
+		self.assertEqual(self.buscar('colonial apartamento'), [])
+		# Las stopwords no cuentan como términos
+		self.assertEqual(self.buscar('casa de la colonial'), [self.colonial.pk])
+
+	def test_rename_reindexes(self):
+		self.san_diego.nombre_municipio = 'Los Guayos'
+		self.san_diego.save()
+		self.assertEqual(self.buscar('guayos'), [self.apartamento.pk])
+		self.assertEqual(self.buscar('diego'), [])
+
+		self.ciudad.nombre_ciudad = 'Puerto Cabello'
+		self.ciudad.save()
+		self.assertEqual(sorted(self.buscar('cabello')), sorted([self.colonial.pk, self.apartamento.pk, self.quinta.pk]))
+		self.assertEqual(self.buscar('valencia'), [])
+
+	def test_fulltext_query_skips_unindexed_terms(self):
+		indice = search.IndiceFullText()
+		self.assertEqual(indice.consulta_booleana(['casa', 'the', '3', 'en', 'san', 'joaquin']), '+casa* +san* +joaquin*')
+		with override_settings(BUSQUEDA_FT_MIN_TOKEN=4):
+			self.assertEqual(indice.consulta_booleana(['casa', 'san']), '+casa*')
+		# Sin términos indexables no hay consulta (MATCH no existe en SQLite: no debe ejecutarse)
+		with self.assertNumQueries(0):
+			self.assertEqual(list(indice.puntuaciones(['ab', 'of'])), [])
+
+
+class ReferenciaCacheTests(TestCase):
+	"""Los catálogos se sirven desde memoria mientras no cambie la versión guardada en la BD."""
+
+	@classmethod
+	def setUpTestData(cls):
+		Estado.objects.create(nombre_estado='Carabobo')
+
+	def setUp(self):
+		self.client = APIClient()
+		cache.clear()
+		cache_respuestas.memoria.clear()
+
+	def nombres(self, response):
+		return [fila['nombre_estado'] for fila in response.data['results']]
+
+	def test_served_from_memory(self):
+		self.client.get('/api/estados/')
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get('/api/estados/')
+		self.assertEqual(self.nombres(response), ['Carabobo'])
+		self.assertEqual(len(ctx.captured_queries), 0)
+
+		not_modified = self.client.get('/api/estados/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(not_modified.status_code, 304)
+
+	def test_write_invalidates(self):
+		antes = self.client.get('/api/estados/')
+		with self.captureOnCommitCallbacks(execute=True):
+			Estado.objects.create(nombre_estado='Aragua')
+		despues = self.client.get('/api/estados/')
+		self.assertEqual(sorted(self.nombres(despues)), ['Aragua', 'Carabobo'])
+		self.assertNotEqual(antes['ETag'], despues['ETag'])
+		self.assertEqual(self.client.get('/api/estados/', HTTP_IF_NONE_MATCH=antes['ETag']).status_code, 200)
+
+	def test_invalidation_from_another_worker(self):
+		# Otro worker escribe e incrementa la versión en la BD; este proceso no recibe señal alguna
+		with self.settings(CACHE_VERSION_SEGUNDOS=0):
+			self.client.get('/api/estados/')
+			Estado.objects.create(nombre_estado='Aragua')
+			VersionCache.objects.filter(espacio=cache_respuestas.REFERENCIA).update(version=F('version') + 1)
+			self.assertEqual(sorted(self.nombres(self.client.get('/api/estados/'))), ['Aragua', 'Carabobo'])
+
+
+class CasasPublicasTests(TestCase):
+	"""/api/casas/ se sirve desde caché con claves acotadas y se invalida al publicar."""
+
+	@classmethod
+	def setUpTestData(cls):
+		for i in range(3):
+			cls.crear(i)
+
+	@staticmethod
+	def crear(i):
+		return Inmueble.objects.create(
+			codigo_referencia=f'PUB-{i}', titulo_publicacion=f'Casa {i}', direccion_exacta='Centro',
+			precio=1000, superficie_construccion=80, estatus_moderacion='Aprobado'
+		)
+
+	def setUp(self):
+		self.client = APIClient()
+		cache.clear()
+
+	def test_unknown_params_share_cache_entry(self):
+		primera = self.client.get('/api/casas/?page_size=2')
+		with CaptureQueriesContext(connection) as ctx:
+			otra = self.client.get('/api/casas/?page_size=2&utm_source=x')
+		self.assertEqual(len(ctx.captured_queries), 0)
+		self.assertEqual(otra.data, primera.data)
+
+		siguiente = self.client.get('/api/casas/?page_size=2&utm_source=y&cursor=' + primera.data['next'].split('cursor=')[1])
+		self.assertEqual(len(siguiente.data['results']), 1)
+		self.assertNotIn('utm_source', siguiente.data['previous'])
+
+	def test_publishing_invalidates(self):
+		self.assertEqual(self.client.get('/api/casas/').data['count'], 3)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.crear(3)
+		self.assertEqual(self.client.get('/api/casas/').data['count'], 4)
+
+	def test_bad_cursor_is_404(self):
+		# Ni base64, JSON que no es objeto, valores de más o de menos y de otro tipo
+		for crudo in (None, b'[1]', b'{"v": [1]}', b'{"v": ["ayer", "x"]}'):
+			cursor = base64.urlsafe_b64encode(crudo).decode('ascii') if crudo else 'zzz'
+			response = self.client.get('/api/casas/', {'cursor': cursor})
+			self.assertEqual(response.status_code, 404, cursor)
+
+
+class PaginacionKeysetTests(TestCase):
+	"""KeysetPagination: next/previous, ?count=false, empates en ?ordering=, cursores
+	inválidos y modelos cuya pk no es ``id``."""
+
+	@classmethod
+	def setUpTestData(cls):
+		# Precios repetidos y la misma fecha de publicación: todo depende del desempate por pk
+		fecha = timezone.now()
+		cls.ids = []
+		for i in range(7):
+			inmueble = Inmueble.objects.create(
+				codigo_referencia=f'PAG-{i}', titulo_publicacion=f'Casa {i}', direccion_exacta='Centro',
+				precio=[100, 200, 300][i % 3], superficie_construccion=80, estatus_moderacion='Aprobado'
+			)
+			cls.ids.append(inmueble.pk)
+		Inmueble.objects.update(fecha_publicacion=fecha)
+		InmuebleListado.objects.update(fecha_publicacion=fecha)
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def paginas(self, url, params, clave='next'):
+		paginas = []
+		while url:
+			response = self.client.get(url, params)
+			self.assertEqual(response.status_code, 200)
+			paginas.append(response.data)
+			url, params = response.data[clave], None
+		return paginas
+
+	@staticmethod
+	def ids_de(paginas):
+		return [int(fila['id']) for pagina in paginas for fila in pagina['results']]
+
+	def test_next_previous_round_trip(self):
+		adelante = self.paginas('/api/inmuebles/', {'page_size': 3})
+		self.assertEqual([len(p['results']) for p in adelante], [3, 3, 1])
+		self.assertEqual(self.ids_de(adelante), sorted(self.ids, reverse=True))
+		self.assertIsNone(adelante[0]['previous'])
+		self.assertIsNone(adelante[-1]['next'])
+
+		# Desde la última página, previous reproduce las anteriores en el mismo orden
+		atras = self.paginas(adelante[-1]['previous'], None, clave='previous')
+		self.assertEqual([p['results'] for p in atras], [p['results'] for p in reversed(adelante[:-1])])
+		self.assertEqual(atras[0]['next'], adelante[1]['next'])
+
+	def test_count_false(self):
+		self.assertEqual(self.client.get('/api/inmuebles/', {'page_size': 3}).data['count'], 7)
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get('/api/inmuebles/', {'page_size': 3, 'count': 'false'})
+		self.assertNotIn('count', response.data)
+		self.assertFalse(any('COUNT(' in q['sql'].upper() for q in ctx.captured_queries))
+		# Los enlaces conservan ?count=false para las páginas siguientes
+		siguientes = self.paginas(response.data['next'], None)
+		self.assertTrue(all('count' not in p for p in siguientes))
+		self.assertEqual(len(self.ids_de(siguientes)), 4)
+
+	def test_ordering_with_ties(self):
+		for ordering in ('precio', '-precio'):
+			for page_size in (1, 2, 4):
+				ids = self.ids_de(self.paginas('/api/inmuebles/', {'ordering': ordering, 'page_size': page_size}))
+				precios = dict(Inmueble.objects.values_list('pk', 'precio'))
+				esperado = sorted(self.ids, key=lambda pk: (precios[pk], pk), reverse=ordering.startswith('-'))
+				self.assertEqual(ids, esperado, (ordering, page_size))
+
+	def test_bad_cursor_is_404(self):
+		for cursor in ('zzz', base64.urlsafe_b64encode(b'{"v": [1], "r": 0}').decode('ascii')):
+			response = self.client.get('/api/inmuebles/', {'cursor': cursor})
+			self.assertEqual(response.status_code, 404, cursor)
+
+	def test_non_id_primary_key(self):
+		# La pk de InmuebleListado es 'inmueble'
+		adelante = self.paginas('/api/inmuebles/casas/', {'ordering': 'precio', 'page_size': 2})
+		ids = self.ids_de(adelante)
+		self.assertEqual(sorted(ids), sorted(self.ids))
+		self.assertEqual(len(ids), len(set(ids)))
+		atras = self.paginas(adelante[-1]['previous'], None, clave='previous')
+		self.assertEqual(self.ids_de(reversed(atras)), ids[:-len(adelante[-1]['results'])])
+
+
+class ListadoTests(TestCase):
+	"""InmuebleListado se mantiene desde las señales y /api/inmuebles/casas/ lo pagina con
+	?search= y ?ordering= aunque su pk no se llame id."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		cls.ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		cls.municipio = Municipio.objects.create(nombre_municipio='Naguanagua', ciudad=cls.ciudad)
+		cls.inmuebles = [
+			cls.crear(f'LST-{i}', titulo, precio)
+			for i, (titulo, precio) in enumerate([
+				('Casa con jardín', 300), ('Apartamento céntrico', 100), ('Casa de campo', 200),
+				('Quinta con jardín', 100), ('Townhouse', 200),
+			])
+		]
+
+	@classmethod
+	def crear(cls, codigo, titulo, precio):
+		return Inmueble.objects.create(
+			codigo_referencia=codigo, titulo_publicacion=titulo, direccion_exacta='Centro', precio=precio,
+			superficie_construccion=80, municipio=cls.municipio, estatus_moderacion='Aprobado'
+		)
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def tarjeta(self, inmueble):
+		return InmuebleListado.objects.get(pk=inmueble.pk).a_front()
+
+	def test_signals_keep_rows_current(self):
+		inmueble = self.inmuebles[0]
+		self.assertEqual(self.tarjeta(inmueble)['location'], 'Valencia, Naguanagua')
+
+		inmueble.precio = 350
+		inmueble.save()
+		self.assertEqual(self.tarjeta(inmueble)['price'], 350.0)
+
+		piscina = Caracteristica.objects.create(nombre_caracteristica='Piscina')
+		InmuebleCaracteristica.objects.create(inmueble=inmueble, caracteristica=piscina)
+		self.assertEqual(self.tarjeta(inmueble)['features'], ['Piscina'])
+		piscina.nombre_caracteristica = 'Piscina techada'
+		piscina.save()
+		self.assertEqual(self.tarjeta(inmueble)['features'], ['Piscina techada'])
+
+		self.municipio.nombre_municipio = 'San Diego'
+		self.municipio.save()
+		self.ciudad.nombre_ciudad = 'Gran Valencia'
+		self.ciudad.save()
+		self.assertEqual(self.tarjeta(inmueble)['location'], 'Gran Valencia, San Diego')
+
+		self.municipio.delete()
+		self.assertEqual(self.tarjeta(inmueble)['location'], 'N/A, N/A')
+
+		pk = inmueble.pk
+		inmueble.delete()
+		self.assertFalse(InmuebleListado.objects.filter(pk=pk).exists())
+
+	def test_reconstruir_listado(self):
+		antes = {fila.pk: fila.a_front() for fila in InmuebleListado.objects.all()}
+		InmuebleListado.objects.all().delete()
+		call_command('reconstruir_listado', stdout=StringIO())
+		self.assertEqual({fila.pk: fila.a_front() for fila in InmuebleListado.objects.all()}, antes)
+
+	def recorrer(self, params):
+		ids, url = [], '/api/inmuebles/casas/'
+		while url:
+			response = self.client.get(url, params)
+			self.assertEqual(response.status_code, 200)
+			ids += [int(tarjeta['id']) for tarjeta in response.data['results']]
+			url, params = response.data['next'], None
+		return ids
+
+	def test_casas_ordering(self):
+		ids = [inmueble.pk for inmueble in self.inmuebles]
+		# Empates de precio: se desempata por pk en el mismo sentido
+		self.assertEqual(self.recorrer({'ordering': 'precio', 'page_size': 2}), [ids[1], ids[3], ids[2], ids[4], ids[0]])
+		self.assertEqual(self.recorrer({'ordering': '-precio', 'page_size': 2}), [ids[0], ids[4], ids[2], ids[3], ids[1]])
+		self.assertEqual(self.recorrer({'page_size': 2}), ids[::-1])
+
+	def test_casas_search(self):
+		ids = [inmueble.pk for inmueble in self.inmuebles]
+		self.assertEqual(sorted(self.recorrer({'search': 'jardin', 'page_size': 1})), [ids[0], ids[3]])
+		self.assertEqual(self.recorrer({'search': 'jardin', 'ordering': 'precio'}), [ids[3], ids[0]])
+
+
+class SparseFieldsTests(TestCase):
+	"""?fields= y ?expand= recortan la respuesta y las relaciones que se consultan."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		municipio = Municipio.objects.create(nombre_municipio='Naguanagua', ciudad=ciudad)
+		tipo = TipoInmueble.objects.create(nombre_tipo='Casa')
+		propietario = Usuario.objects.create(nombres='Dueño', apellidos='Uno', email='owner@example.com', password_hash='x')
+		cls.inmueble = Inmueble.objects.create(
+			codigo_referencia='SPARSE-1', titulo_publicacion='Casa', tipo_inmueble=tipo, municipio=municipio,
+			direccion_exacta='Centro', precio=1000, superficie_construccion=80, propietario=propietario
+		)
+		cls.piscina = Caracteristica.objects.create(nombre_caracteristica='Piscina')
+		InmuebleCaracteristica.objects.create(inmueble=cls.inmueble, caracteristica=cls.piscina, valor='Sí')
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def get(self, query):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(f'/api/inmuebles/?count=false&{query}')
+		self.assertEqual(response.status_code, 200)
+		return response.data['results'][0], [q['sql'] for q in ctx.captured_queries]
+
+	def test_fields_prune_response_and_joins(self):
+		fila, queries = self.get('fields=id,precio')
+		self.assertEqual(set(fila), {'id', 'precio'})
+		self.assertEqual(len(queries), 1)
+		self.assertNotIn('JOIN', queries[0])
+
+	def test_nested_fields(self):
+		fila, queries = self.get('fields=id,municipio.nombre_municipio')
+		self.assertEqual(fila, {'id': self.inmueble.id, 'municipio': {'nombre_municipio': 'Naguanagua'}})
+		self.assertIn('api_municipio', queries[0])
+		self.assertNotIn('api_ciudad', queries[0])
+
+	def test_expand_collapses_other_relations(self):
+		fila, queries = self.get('expand=municipio')
+		self.assertEqual(fila['tipo_inmueble'], self.inmueble.tipo_inmueble_id)
+		self.assertEqual(fila['propietario'], self.inmueble.propietario_id)
+		self.assertEqual(fila['municipio']['nombre_municipio'], 'Naguanagua')
+		self.assertEqual(len(fila['caracteristicas']), 1)
+		self.assertNotIn('api_tipoinmueble', queries[0])
+		self.assertNotIn('api_usuario', queries[0])
+
+
+class ArbolUbicacionesTests(TestCase):
+	"""El árbol comprimido y el sin comprimir tienen ETags distintos y siempre llevan Vary."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def test_etag_per_encoding(self):
+		plano = self.client.get('/api/ubicaciones/arbol/')
+		comprimido = self.client.get('/api/ubicaciones/arbol/', HTTP_ACCEPT_ENCODING='gzip')
+		self.assertEqual(comprimido['Content-Encoding'], 'gzip')
+		self.assertNotEqual(plano['ETag'], comprimido['ETag'])
+		self.assertIn('Accept-Encoding', plano['Vary'])
+
+		# El ETag del cuerpo comprimido no valida el cuerpo plano
+		response = self.client.get('/api/ubicaciones/arbol/', HTTP_IF_NONE_MATCH=comprimido['ETag'])
+		self.assertEqual(response.status_code, 200)
+		response = self.client.get(
+			'/api/ubicaciones/arbol/', HTTP_IF_NONE_MATCH=comprimido['ETag'], HTTP_ACCEPT_ENCODING='gzip'
+		)
+		self.assertEqual(response.status_code, 304)
+		self.assertIn('Accept-Encoding', response['Vary'])
+
+
+class BusquedaGeograficaTests(TestCase):
+	"""?bbox=, ?lat=&lng=&radio_km= y los grupos por zoom de la búsqueda (api/geo.py)."""
+
+	@classmethod
+	def setUpTestData(cls):
+		puntos = {
+			'valencia': (10.1620, -68.0077),
+			'naguanagua': (10.2500, -68.0100),
+			'caracas': (10.4806, -66.9036),
+			'sin_coordenadas': (None, None),
+		}
+		cls.ids = {}
+		for nombre, (lat, lng) in puntos.items():
+			cls.ids[nombre] = Inmueble.objects.create(
+				codigo_referencia=f'GEO-{nombre}', titulo_publicacion=nombre, direccion_exacta='Centro',
+				precio=1000, superficie_construccion=80, latitud=lat, longitud=lng
+			).id
+
+	def setUp(self):
+		self.client = APIClient()
+
+	def buscar(self, query):
+		response = self.client.get(f'/api/inmuebles/search/?{query}')
+		self.assertEqual(response.status_code, 200, response.data)
+		return response.data
+
+	def test_geohash_assigned_on_save(self):
+		self.assertEqual(Inmueble.objects.get(pk=self.ids['valencia']).geohash, geo.codificar(10.1620, -68.0077))
+		self.assertIsNone(Inmueble.objects.get(pk=self.ids['sin_coordenadas']).geohash)
+
+	def test_bbox(self):
+		data = self.buscar('bbox=-68.1,10.1,-67.9,10.3')
+		self.assertEqual({fila['id'] for fila in data['results']}, {self.ids['valencia'], self.ids['naguanagua']})
+
+	def test_radius_sorted_by_distance(self):
+		data = self.buscar('lat=10.1620&lng=-68.0077&radio_km=5')
+		self.assertEqual([fila['id'] for fila in data['results']], [self.ids['valencia']])
+		data = self.buscar('lat=10.1620&lng=-68.0077&radio_km=15')
+		self.assertEqual([fila['id'] for fila in data['results']], [self.ids['valencia'], self.ids['naguanagua']])
+
+	def test_low_zoom_returns_clusters(self):
+		data = self.buscar('bbox=-69,10,-66,11&zoom=5')
+		self.assertEqual(sorted(grupo['count'] for grupo in data['clusters']), [1, 2])
+		solo = next(grupo for grupo in data['clusters'] if grupo['count'] == 1)
+		self.assertEqual(solo['id'], self.ids['caracas'])
+
+	def test_invalid_parameters(self):
+		for query in ('bbox=1,2,3', 'bbox=-66,10,-69,11', 'bbox=-69,10,-66,11&zoom=x', 'lat=95&lng=0'):
+			self.assertEqual(self.client.get(f'/api/inmuebles/search/?{query}').status_code, 400, query)
+
+
+class EstadisticasMercadoTests(TestCase):
+	"""Las señales ajustan las sumas de EstadisticaMercado igual que un recálculo completo."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		cls.municipio = Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad)
+		cls.casa = TipoInmueble.objects.create(nombre_tipo='Casa')
+		cls.apartamento = TipoInmueble.objects.create(nombre_tipo='Apartamento')
+
+	def crear(self, codigo, precio, superficie, **extra):
+		extra.setdefault('estatus_moderacion', 'Aprobado')
+		return Inmueble.objects.create(
+			codigo_referencia=codigo, titulo_publicacion=codigo, direccion_exacta='Centro', precio=precio,
+			superficie_construccion=superficie, municipio=self.municipio, tipo_inmueble=self.casa, **extra
+		)
+
+	def filas(self):
+		return {
+			(fila.municipio_id, fila.tipo_inmueble_id): [
+				round(valor, 3) if isinstance(valor, float) else valor
+				for valor in (getattr(fila, campo) for campo in estadisticas.CAMPOS_SUMABLES)
+			]
+			for fila in EstadisticaMercado.objects.all()
+		}
+
+	def assertIgualAlRecalculo(self):
+		incrementales = self.filas()
+		estadisticas.recalcular()
+		self.assertEqual(incrementales, self.filas())
+
+	def test_deltas_match_recalcular(self):
+		primero = self.crear('EST-1', '100000.00', '100')
+		segundo = self.crear('EST-2', '200000.00', '0')
+		self.assertIgualAlRecalculo()
+		fila = EstadisticaMercado.objects.get()
+		self.assertEqual((fila.inmuebles, fila.suma_precio, fila.con_superficie, fila.activos), (2, 300000, 1, 2))
+
+		segundo.estatus_venta = 'Vendido'
+		segundo.save()
+		operacion = Operacion.objects.create(
+			inmueble=segundo, tipo_operacion='Venta', fecha_operacion=datetime.date.today(), monto_final='190000.00'
+		)
+		self.assertIgualAlRecalculo()
+		fila = EstadisticaMercado.objects.get()
+		self.assertEqual((fila.activos, fila.cerrados, fila.operaciones, fila.suma_monto_cierre), (1, 1, 1, 190000))
+
+		# Cambiar de tipo mueble el aporte a otro grupo; reasignar la operación también
+		operacion = Operacion.objects.get(pk=operacion.pk)
+		operacion.inmueble = primero
+		operacion.monto_final = '95000.00'
+		operacion.save()
+		primero = Inmueble.objects.get(pk=primero.pk)
+		primero.tipo_inmueble = self.apartamento
+		primero.save()
+		self.assertIgualAlRecalculo()
+		self.assertEqual(EstadisticaMercado.objects.get(tipo_inmueble=self.apartamento).operaciones, 1)
+
+		operacion.delete()
+		primero.delete()
+		self.assertIgualAlRecalculo()
+		self.assertEqual(list(EstadisticaMercado.objects.values_list('tipo_inmueble_id', 'inmuebles')), [(self.casa.id, 1)])
+
+	def test_only_approved_count(self):
+		self.crear('EST-1', '100000.00', '100')
+		pendiente = self.crear('EST-2', '200000.00', '100', estatus_moderacion='Pendiente')
+		rechazado = self.crear('EST-3', '300000.00', '100', estatus_moderacion='Pendiente')
+		Operacion.objects.create(
+			inmueble=pendiente, tipo_operacion='Venta', fecha_operacion=datetime.date.today(), monto_final='190000.00'
+		)
+		self.assertIgualAlRecalculo()
+		self.assertEqual(EstadisticaMercado.objects.values_list('inmuebles', 'operaciones').get(), (1, 0))
+
+		# Las decisiones de moderación (UPDATE en bloque, sin señales) también mueven las sumas
+		moderador = Usuario.objects.create(nombres='Mod', apellidos='M', email='mod@example.com', password_hash='x')
+		moderacion.decidir(moderador, [pendiente.pk], 'Aprobado')
+		moderacion.decidir(moderador, [rechazado.pk], 'Rechazado')
+		self.assertIgualAlRecalculo()
+		fila = EstadisticaMercado.objects.get()
+		self.assertEqual((fila.inmuebles, fila.suma_precio, fila.operaciones), (2, 300000, 1))
+
+		# Y guardar un cambio de estatus por el ORM
+		pendiente = Inmueble.objects.get(pk=pendiente.pk)
+		pendiente.estatus_moderacion = 'Rechazado'
+		pendiente.save()
+		self.assertIgualAlRecalculo()
+		self.assertEqual(EstadisticaMercado.objects.values_list('inmuebles', 'operaciones').get(), (1, 0))
+
+	def test_unrelated_save_skips_statistics(self):
+		inmueble = Inmueble.objects.get(pk=self.crear('EST-1', '100000.00', '100').pk)
+		inmueble.titulo_publicacion = 'Otro título'
+		with CaptureQueriesContext(connection) as ctx:
+			inmueble.save()
+		self.assertFalse([q for q in ctx.captured_queries if 'estadistica' in q['sql'].lower()])
+
+	def test_api(self):
+		self.crear('EST-1', '100000.00', '100')
+		self.crear('EST-2', '200000.00', '200')
+		client = APIClient()
+		with CaptureQueriesContext(connection) as ctx:
+			grupo, = client.get('/api/estadisticas/mercado/').data['results']
+		self.assertEqual(len(ctx.captured_queries), 1)
+		self.assertEqual((grupo['inmuebles'], grupo['precio_promedio'], grupo['precio_m2_promedio']), (2, 150000.0, 1000.0))
+		# Las medianas solo las calcula recalcular_estadisticas
+		self.assertIsNone(grupo['precio_mediana'])
+		estadisticas.recalcular()
+		grupo, = client.get('/api/estadisticas/mercado/').data['results']
+		self.assertEqual(grupo['precio_mediana'], 150000.0)
+
+
+class ExportacionTests(TestCase):
+	"""/export/ entrega todas las filas filtradas en streaming, en CSV o NDJSON, por lotes."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.usuario = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		cls.inmuebles = [
+			Inmueble.objects.create(
+				codigo_referencia=f'EXP-{i}', titulo_publicacion=titulo, direccion_exacta='Centro',
+				precio='1500.50', superficie_construccion=80, estatus_moderacion='Aprobado'
+			)
+			for i, titulo in enumerate(['Casa "grande", con jardín\nen dos líneas', 'Apartamento', 'Casa'])
+		]
+		cls.operacion = Operacion.objects.create(
+			inmueble=cls.inmuebles[0], tipo_operacion='Venta', fecha_operacion=datetime.date(2024, 5, 1),
+			monto_final='1400.00', notas='Pago; "contado"'
+		)
+
+	def setUp(self):
+		self.client = APIClient()
+		self.client.force_authenticate(self.usuario)
+
+	def descargar(self, url, **params):
+		response = self.client.get(url, params)
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		return response, b''.join(response.streaming_content).decode('utf-8')
+
+	def test_csv(self):
+		response, cuerpo = self.descargar('/api/inmuebles/export/', formato='csv')
+		self.assertEqual(response['Content-Type'], 'text/csv')
+		self.assertEqual(response['Content-Disposition'], 'attachment; filename="inmuebles.csv"')
+		encabezado, *filas = list(csv.reader(StringIO(cuerpo)))
+		self.assertEqual(encabezado, export.COLUMNAS['inmuebles'])
+		self.assertEqual([int(fila[0]) for fila in filas], [inmueble.pk for inmueble in self.inmuebles])
+		# Comillas, comas y saltos de línea quedan entre comillas y se leen intactos
+		self.assertIn('"Casa ""grande"", con jardín\nen dos líneas"', cuerpo)
+		self.assertEqual(filas[0][2], self.inmuebles[0].titulo_publicacion)
+		self.assertEqual(filas[0][encabezado.index('precio')], '1500.50')
+
+	def test_ndjson(self):
+		response, cuerpo = self.descargar('/api/operaciones/export/')
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		self.assertEqual(response['Content-Disposition'], 'attachment; filename="operaciones.ndjson"')
+		self.assertTrue(cuerpo.endswith('\n'))
+		fila, = [json.loads(linea) for linea in cuerpo.splitlines()]
+		self.assertEqual(list(fila), export.COLUMNAS['operaciones'])
+		self.assertEqual(
+			(fila['inmueble__codigo_referencia'], fila['monto_final'], fila['fecha_operacion'], fila['notas']),
+			('EXP-0', '1400.00', '2024-05-01', 'Pago; "contado"')
+		)
+
+	def test_filters_apply(self):
+		_, cuerpo = self.descargar('/api/inmuebles/export/', search='casa')
+		self.assertEqual(
+			sorted(json.loads(linea)['id'] for linea in cuerpo.splitlines()),
+			[self.inmuebles[0].pk, self.inmuebles[2].pk]
+		)
+
+	def test_bad_format_and_anonymous(self):
+		self.assertEqual(self.client.get('/api/inmuebles/export/', {'formato': 'xml'}).status_code, 400)
+		self.assertIn(APIClient().get('/api/inmuebles/export/').status_code, (401, 403))
+
+	def test_batches(self):
+		# Una consulta por lote más la que encuentra el final
+		with CaptureQueriesContext(connection) as ctx:
+			lineas = b''.join(export.exportar('inmuebles', tamano_lote=2)).decode('utf-8').splitlines()
+		self.assertEqual(len(lineas), 3)
+		self.assertEqual(len(ctx.captured_queries), 3)
+
+	def test_command(self):
+		descriptor, ruta = tempfile.mkstemp(suffix='.csv')
+		os.close(descriptor)
+		self.addCleanup(os.remove, ruta)
+		call_command('exportar', 'inmuebles', '--formato=csv', f'--output={ruta}', '--batch-size=1', stdout=StringIO())
+		with open(ruta, encoding='utf-8', newline='') as archivo:
+			self.assertEqual(len(list(csv.reader(archivo))), 1 + len(self.inmuebles))
+
+
+class ImportCasasTests(TestCase):
+	"""import_casas lee arreglos JSON y NDJSON por lotes, --update no duplica filas y cada lote
+	actualiza el listado, el índice de búsqueda y las estadísticas."""
+
+	CASAS = [
+		{'id': i, 'descripcion': f'Casa {nombre}', 'municipio': municipio, 'tipo': 'Casa',
+		 'precio': 100000 + i, 'metros_cuadrados': 100, 'habitaciones': 3, 'banos': 2}
+		for i, (nombre, municipio) in enumerate([
+			('con piscina', 'Valencia'), ('colonial', 'Valencia'), ('moderna', 'Naguanagua'),
+			('de campo', 'Naguanagua'), ('con jardín', 'Valencia'),
+		], start=1)
+	]
+
+	def archivo(self, casas, ndjson=False):
+		descriptor, ruta = tempfile.mkstemp(suffix='.ndjson' if ndjson else '.json')
+		with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+			if ndjson:
+				archivo.writelines(json.dumps(casa) + '\n' for casa in casas)
+			else:
+				json.dump(casas, archivo, indent=2)
+		self.addCleanup(os.remove, ruta)
+		return ruta
+
+	def importar(self, ruta, *args):
+		salida = StringIO()
+		with mock.patch.object(
+			import_casas, 'inmuebles_guardados_en_bloque', wraps=import_casas.inmuebles_guardados_en_bloque
+		) as hook:
+			call_command('import_casas', f'--file={ruta}', '--batch-size=2', *args, stdout=salida)
+		self.assertIn('¡Importación completada!', salida.getvalue())
+		return hook.call_count
+
+	def assertImportado(self, casas):
+		self.assertEqual(Inmueble.objects.count(), len(casas))
+		self.assertEqual(InmuebleListado.objects.count(), len(casas))
+		precios = Inmueble.objects.values_list('precio', flat=True)
+		self.assertEqual(sorted(precios), sorted(casa['precio'] for casa in casas))
+		# Búsqueda, listado y estadísticas igual que si cada fila se hubiera guardado por el ORM
+		self.assertEqual(len(search.buscar(Inmueble.objects.all(), 'colonial')), 1)
+		incrementales = sorted(EstadisticaMercado.objects.values_list('municipio_id', 'inmuebles', 'suma_precio'))
+		estadisticas.recalcular()
+		self.assertEqual(sorted(EstadisticaMercado.objects.values_list('municipio_id', 'inmuebles', 'suma_precio')), incrementales)
+		self.assertEqual(sum(fila[1] for fila in incrementales), len(casas))
+
+	def test_json_array(self):
+		# 5 registros en lotes de 2: los ganchos corren una vez por lote
+		self.assertEqual(self.importar(self.archivo(self.CASAS)), 3)
+		self.assertImportado(self.CASAS)
+
+	def test_ndjson(self):
+		self.assertEqual(self.importar(self.archivo(self.CASAS, ndjson=True)), 3)
+		self.assertImportado(self.CASAS)
+
+	def test_update(self):
+		self.importar(self.archivo(self.CASAS))
+		ids = dict(Inmueble.objects.values_list('codigo_referencia', 'id'))
+
+		# Sin --update los existentes no cambian; con --update solo se escriben los que cambiaron
+		cambiadas = [dict(casa, precio=casa['precio'] * 2) if casa['id'] <= 2 else casa for casa in self.CASAS]
+		self.assertEqual(self.importar(self.archivo(cambiadas)), 0)
+		self.assertEqual(Inmueble.objects.filter(precio__gt=200000).count(), 0)
+		self.assertEqual(self.importar(self.archivo(cambiadas), '--update'), 1)
+
+		self.assertEqual(dict(Inmueble.objects.values_list('codigo_referencia', 'id')), ids)
+		self.assertEqual(Inmueble.objects.filter(precio__gt=200000).count(), 2)
+		self.assertEqual(InmuebleListado.objects.filter(precio__gt=200000).count(), 2)
+		self.assertImportado(cambiadas)
+
+
+class SembradoTests(TestCase):
+	"""init_venezuela_data e init_data se pueden ejecutar varias veces sin duplicar filas."""
+
+	MODELOS = [
+		Estado, Ciudad, Municipio, Rol, TipoInmueble, Caracteristica, Usuario, Inmueble,
+		InmuebleListado, EstadisticaMercado,
+	]
+
+	def filas(self):
+		return {modelo.__name__: sorted(modelo.objects.values_list('pk', flat=True)) for modelo in self.MODELOS}
+
+	def sembrar(self):
+		for comando in ('init_venezuela_data', 'init_data'):
+			call_command(comando, stdout=StringIO())
+
+	def test_idempotent(self):
+		self.sembrar()
+		primera = self.filas()
+		self.assertTrue(all(primera[nombre] for nombre in ('Estado', 'Ciudad', 'Municipio', 'TipoInmueble', 'Inmueble')))
+		estadisticas_previas = list(EstadisticaMercado.objects.values_list('municipio_id', 'tipo_inmueble_id', 'inmuebles'))
+
+		self.sembrar()
+		self.assertEqual(self.filas(), primera)
+		self.assertEqual(list(EstadisticaMercado.objects.values_list('municipio_id', 'tipo_inmueble_id', 'inmuebles')), estadisticas_previas)
+
+	def test_sembrar_reports_only_new_rows(self):
+		ids, creadas = sembrar_nombres(TipoInmueble, 'nombre_tipo', ['Casa', 'Local', 'Casa'])
+		self.assertEqual(sorted(creadas), ['Casa', 'Local'])
+		with CaptureQueriesContext(connection) as ctx:
+			otra_vez, creadas = sembrar_nombres(TipoInmueble, 'nombre_tipo', ['Casa', 'Local'])
+		self.assertEqual((otra_vez, creadas), (ids, []))
+		# Solo la consulta que busca las existentes
+		self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class InmuebleBatchTests(TestCase):
+	"""POST /api/inmuebles/batch/ valida las llaves foráneas con una consulta por modelo."""
+
+	@classmethod
+	def setUpTestData(cls):
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		cls.municipio = Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad)
+		cls.tipo = TipoInmueble.objects.create(nombre_tipo='Casa')
+		cls.propietario = Usuario.objects.create(nombres='Dueño', apellidos='Uno', email='owner@example.com', password_hash='x')
+
+	def setUp(self):
+		self.client = APIClient()
+		self.client.force_authenticate(User.objects.create(username='agencia'))
+
+	def item(self, codigo, **extra):
+		return {
+			'codigo_referencia': codigo, 'titulo_publicacion': 'Casa', 'tipo_inmueble_id': self.tipo.id,
+			'municipio_id': self.municipio.id, 'propietario_id': self.propietario.id,
+			'direccion_exacta': 'Centro', 'precio': '100000.00', 'superficie_construccion': '120', **extra
+		}
+
+	def post(self, items):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.post('/api/inmuebles/batch/', items, format='json')
+		return response, len(ctx.captured_queries)
+
+	def test_constant_queries(self):
+		# El primer lote del grupo crea además su fila de EstadisticaMercado
+		self.post([self.item('LOTE-INICIAL')])
+		response, small = self.post([self.item(f'LOTE-{i}') for i in range(2)])
+		self.assertEqual(response.status_code, 200)
+		response, large = self.post([self.item(f'LOTE-{i}') for i in range(2, 30)])
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['created'], 28)
+		self.assertEqual(small, large)
+
+	def test_per_item_results(self):
+		existente = Inmueble.objects.create(**{
+			k: v for k, v in self.item('EXISTE').items() if not k.endswith('_id')
+		}, municipio=self.municipio)
+		response, _ = self.post([
+			self.item('NUEVO'),
+			self.item('OTRO', municipio_id=999999),
+			self.item('NUEVO'),
+			self.item('EXISTE'),
+			{'id': existente.id, 'precio': '90000.00'},
+		])
+		self.assertEqual(response.status_code, 207)
+		self.assertEqual(
+			[r['status'] for r in response.data['results']],
+			['created', 'error', 'error', 'error', 'updated']
+		)
+		self.assertIn('municipio_id', response.data['results'][1]['errors'])
+		existente.refresh_from_db()
+		self.assertEqual(str(existente.precio), '90000.00')
+
+
+class UsuarioJWTAuthenticationTests(TestCase):
+	"""Los tokens de RefreshToken.for_user(usuario) autentican al Usuario sin consultarlo en
+	cada petición; desactivarlo surte efecto en la siguiente."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.rol = Rol.objects.create(nombre_rol='Interesado')
+		cls.usuario = Usuario.objects.create(
+			nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x', rol=cls.rol
+		)
+
+	def setUp(self):
+		autenticacion.usuarios.limpiar()
+		self.client = APIClient()
+		self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.usuario).access_token}')
+
+	def count_queries(self):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get('/api/citas/calendario/')
+		return response, [q['sql'] for q in ctx.captured_queries]
+
+	def test_cached_user(self):
+		response, queries = self.count_queries()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(queries), 1)
+		response, queries = self.count_queries()
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(queries, [])
+
+	def test_deactivated_user(self):
+		self.count_queries()
+		self.usuario.activo = False
+		self.usuario.save()
+		response, _ = self.count_queries()
+		self.assertEqual(response.status_code, 401)
+
+
+class MensajesStreamTests(TestCase):
+	"""GET /api/mensajes/stream/ solo se abre por ASGI y con el token propio del flujo."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.interesado = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		cls.vendedor = Usuario.objects.create(nombres='Luis', apellidos='Gil', email='luis@example.com', password_hash='x')
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		inmueble = Inmueble.objects.create(
+			codigo_referencia='MSJ-1', titulo_publicacion='Casa', direccion_exacta='Centro', precio='100000.00',
+			superficie_construccion='100', municipio=Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad),
+			tipo_inmueble=TipoInmueble.objects.create(nombre_tipo='Casa')
+		)
+		cls.conversacion = Conversacion.objects.create(
+			inmueble=inmueble, usuario_interesado=cls.interesado, usuario_vendedor=cls.vendedor
+		)
+
+	def setUp(self):
+		autenticacion.usuarios.limpiar()
+		backend = mock.patch.object(tiempo_real, '_backend', tiempo_real.DifusionMemoria())
+		backend.start()
+		self.addCleanup(backend.stop)
+
+	async def test_receives_new_message(self):
+		acceso = str(RefreshToken.for_user(self.interesado).access_token)
+		response = await self.async_client.post(
+			'/api/mensajes/stream/token/', headers={'Authorization': f'Bearer {acceso}'}
+		)
+		self.assertEqual(response.status_code, 200)
+		response = await self.async_client.get('/api/mensajes/stream/', {'token': response.json()['token']})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		flujo = aiter(response.streaming_content)
+		# El primer fragmento llega ya suscrito al canal del usuario
+		self.assertEqual(await anext(flujo), b'retry: 3000\n\n')
+
+		mensaje = await Mensaje.objects.acreate(
+			conversacion=self.conversacion, usuario_emisor=self.vendedor, contenido_mensaje='¿Sigue disponible?'
+		)
+		await sync_to_async(tiempo_real.publicar_mensaje)(mensaje.pk)
+		evento = (await asyncio.wait_for(anext(flujo), 5)).decode('utf-8')
+		self.assertTrue(evento.startswith(f'id: {mensaje.pk}\nevent: mensaje\n'))
+		self.assertIn('¿Sigue disponible?', evento)
+		await flujo.aclose()
+
+	async def test_rejects_other_tokens(self):
+		acceso = str(RefreshToken.for_user(self.interesado).access_token)
+		response = await self.async_client.get('/api/mensajes/stream/', {'token': acceso})
+		self.assertEqual(response.status_code, 401)
+
+		token = tiempo_real.token_de(self.interesado.pk)
+		with override_settings(TIEMPO_REAL_TOKEN_SEGUNDOS=-1):
+			response = await self.async_client.get('/api/mensajes/stream/', {'token': token})
+		self.assertEqual(response.status_code, 401)
+
+	def test_wsgi_unavailable(self):
+		# Bajo WSGI la respuesta se leería entera y no terminaría: 503 en lugar de colgar
+		response = self.client.get('/api/mensajes/stream/', {'token': tiempo_real.token_de(self.interesado.pk)})
+		self.assertEqual(response.status_code, 503)
+		client = APIClient()
+		client.force_authenticate(self.interesado)
+		self.assertEqual(client.post('/api/mensajes/stream/token/').status_code, 503)
+
+
+class SincronizacionTests(TestCase):
+	"""?since= entrega cambios y borrados desde la marca; ?after_id= solo filas nuevas."""
+
+	@classmethod
+	def setUpTestData(cls):
+		interesado = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		cls.vendedor = Usuario.objects.create(nombres='Luis', apellidos='Gil', email='luis@example.com', password_hash='x')
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		inmueble = Inmueble.objects.create(
+			codigo_referencia='SYNC-1', titulo_publicacion='Casa', direccion_exacta='Centro', precio='100000.00',
+			superficie_construccion='100', municipio=Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad),
+			tipo_inmueble=TipoInmueble.objects.create(nombre_tipo='Casa')
+		)
+		cls.conversacion = Conversacion.objects.create(
+			inmueble=inmueble, usuario_interesado=interesado, usuario_vendedor=cls.vendedor
+		)
+
+	def setUp(self):
+		self.client = APIClient()
+		self.mensajes = [
+			Mensaje.objects.create(conversacion=self.conversacion, usuario_emisor=self.vendedor, contenido_mensaje=f'Mensaje {i}')
+			for i in range(3)
+		]
+
+	def sincronizar(self, marca, **params):
+		response = self.client.get('/api/mensajes/', {'since': marca, **params})
+		self.assertEqual(response.status_code, 200)
+		return [fila['id'] for fila in response.data['results']], response.data
+
+	def test_since(self):
+		ids = [mensaje.id for mensaje in self.mensajes]
+		# Sin margen, para que la marca avance hasta la última fila entregada
+		with mock.patch.object(sync, 'MARGEN', datetime.timedelta(0)):
+			primeros, datos = self.sincronizar('0', page_size=2)
+			self.assertEqual((primeros, datos['has_more'], datos['deleted']), (ids[:2], True, []))
+			resto, datos = self.sincronizar(datos['watermark'], page_size=2)
+			self.assertEqual((resto, datos['has_more']), (ids[2:], False))
+
+			self.mensajes[0].leido = True
+			self.mensajes[0].save()
+			self.mensajes[1].delete()
+			cambios, datos = self.sincronizar(datos['watermark'])
+			self.assertEqual((cambios, datos['deleted']), ([ids[0]], [ids[1]]))
+
+			cambios, datos = self.sincronizar(datos['watermark'])
+			self.assertEqual((cambios, datos['deleted']), ([], []))
+
+	def test_margin_resends_recent_rows(self):
+		_, datos = self.sincronizar('0')
+		# Las filas de los últimos MARGEN segundos se repiten: una transacción lenta podría
+		# confirmar otra con fecha anterior a la marca
+		repetidos, _ = self.sincronizar(datos['watermark'])
+		self.assertEqual(repetidos, [mensaje.id for mensaje in self.mensajes])
+
+	def test_invalid_and_expired_watermarks(self):
+		self.assertEqual(self.client.get('/api/mensajes/', {'since': 'no-es-una-marca'}).status_code, 400)
+		antigua = (timezone.now() - sync.RETENCION - datetime.timedelta(days=1)).isoformat()
+		response = self.client.get('/api/mensajes/', {'since': antigua})
+		self.assertEqual(response.status_code, 410)
+
+	def test_after_id(self):
+		ids = [mensaje.id for mensaje in self.mensajes]
+		response = self.client.get('/api/mensajes/', {'after_id': ids[0], 'page_size': 1})
+		self.assertEqual([fila['id'] for fila in response.data['results']], ids[1:2])
+		self.assertEqual((response.data['after_id'], response.data['has_more']), (ids[1], True))
+		response = self.client.get('/api/mensajes/', {'after_id': ids[2]})
+		self.assertEqual((response.data['results'], response.data['after_id'], response.data['has_more']), ([], ids[2], False))
+		self.assertEqual(self.client.get('/api/mensajes/', {'after_id': 'x'}).status_code, 400)
+
+	def test_purgar_eliminados(self):
+		ids = [mensaje.id for mensaje in self.mensajes]
+		self.mensajes[0].delete()
+		self.mensajes[1].delete()
+		antiguo = RegistroEliminado.objects.get(objeto_id=ids[0])
+		# fecha_eliminacion es auto_now_add: se envejece con update()
+		RegistroEliminado.objects.filter(pk=antiguo.pk).update(
+			fecha_eliminacion=timezone.now() - sync.RETENCION - datetime.timedelta(hours=1)
+		)
+		call_command('purgar_eliminados', stdout=StringIO())
+		self.assertEqual(list(RegistroEliminado.objects.values_list('objeto_id', flat=True)), [ids[1]])
+
+
+class BandejaMensajesTests(TestCase):
+	"""/api/conversaciones/inbox/ cuesta las mismas consultas sin importar la página y cuenta
+	los no leídos de cada conversación; /leer/ es idempotente y respeta la marca ``hasta``."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.ana = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		cls.vendedores = [
+			Usuario.objects.create(nombres=f'Vendedor {i}', apellidos='V', email=f'vendedor{i}@example.com', password_hash='x')
+			for i in range(6)
+		]
+		cls.conversaciones = []
+		for i, vendedor in enumerate(cls.vendedores):
+			inmueble = Inmueble.objects.create(
+				codigo_referencia=f'BAN-{i}', titulo_publicacion=f'Casa {i}', direccion_exacta='Centro',
+				precio='100000.00', superficie_construccion='100', propietario=vendedor
+			)
+			conversacion = Conversacion.objects.create(inmueble=inmueble, usuario_interesado=cls.ana, usuario_vendedor=vendedor)
+			cls.conversaciones.append(conversacion)
+			# i mensajes del vendedor sin leer, uno ya leído y uno de Ana (que no cuentan)
+			for j in range(i):
+				Mensaje.objects.create(conversacion=conversacion, usuario_emisor=vendedor, contenido_mensaje=f'Hola {j}')
+			Mensaje.objects.create(conversacion=conversacion, usuario_emisor=vendedor, contenido_mensaje='Leído', leido=True)
+			Mensaje.objects.create(conversacion=conversacion, usuario_emisor=cls.ana, contenido_mensaje=f'Respuesta {i}')
+
+	def setUp(self):
+		self.client = APIClient()
+		self.client.force_authenticate(self.ana)
+
+	def bandeja(self, **params):
+		response = self.client.get('/api/conversaciones/inbox/', params)
+		self.assertEqual(response.status_code, 200)
+		return response.data
+
+	def test_constant_queries(self):
+		with CaptureQueriesContext(connection) as pequena:
+			self.assertEqual(len(self.bandeja(page_size=2)['results']), 2)
+		with CaptureQueriesContext(connection) as grande:
+			self.assertEqual(len(self.bandeja(page_size=10)['results']), 6)
+		self.assertEqual(len(pequena.captured_queries), len(grande.captured_queries))
+		# Página, conteo total, últimos mensajes y no leídos
+		self.assertLessEqual(len(grande.captured_queries), 4)
+
+	def test_unread_counts_and_last_message(self):
+		filas = self.bandeja()['results']
+		# La respuesta de Ana es lo último de cada conversación; la más reciente va primero
+		self.assertEqual([fila['id'] for fila in filas], [c.id for c in reversed(self.conversaciones)])
+		self.assertEqual([fila['no_leidos'] for fila in filas], [5, 4, 3, 2, 1, 0])
+		self.assertEqual(filas[0]['ultimo_mensaje']['contenido_mensaje'], 'Respuesta 5')
+
+		# Para el vendedor, la respuesta de Ana es su único no leído
+		self.client.force_authenticate(self.vendedores[3])
+		fila, = self.bandeja()['results']
+		self.assertEqual((fila['id'], fila['no_leidos']), (self.conversaciones[3].id, 1))
+
+	def leer(self, conversacion, **datos):
+		response = self.client.post(f'/api/conversaciones/{conversacion.pk}/leer/', datos, format='json')
+		self.assertEqual(response.status_code, 200)
+		return response.data
+
+	def test_leer_hasta_is_idempotent(self):
+		conversacion = self.conversaciones[5]
+		recibidos = list(
+			Mensaje.objects.filter(conversacion=conversacion, usuario_emisor=self.vendedores[5], leido=False)
+			.order_by('id').values_list('id', flat=True)
+		)
+		self.assertEqual(self.leer(conversacion, hasta=recibidos[2]), {'actualizados': 3, 'no_leidos': 2})
+		self.assertEqual(self.leer(conversacion, hasta=recibidos[2]), {'actualizados': 0, 'no_leidos': 2})
+
+		# Lo que llega después de la marca sigue sin leer aunque se repita la misma petición
+		nuevo = Mensaje.objects.create(conversacion=conversacion, usuario_emisor=self.vendedores[5], contenido_mensaje='Otro')
+		self.assertEqual(self.leer(conversacion, hasta=recibidos[2]), {'actualizados': 0, 'no_leidos': 3})
+		self.assertFalse(Mensaje.objects.get(pk=nuevo.pk).leido)
+
+		# Sin ``hasta`` se marcan todos los recibidos; los enviados por Ana no se tocan
+		self.assertEqual(self.leer(conversacion), {'actualizados': 3, 'no_leidos': 0})
+		self.assertEqual(self.leer(conversacion), {'actualizados': 0, 'no_leidos': 0})
+		self.assertFalse(Mensaje.objects.get(conversacion=conversacion, usuario_emisor=self.ana).leido)
+
+	def test_leer_requires_participant(self):
+		self.client.force_authenticate(self.vendedores[0])
+		response = self.client.post(f'/api/conversaciones/{self.conversaciones[5].pk}/leer/', {}, format='json')
+		self.assertEqual(response.status_code, 403)
+		self.assertEqual(self.client.post(
+			f'/api/conversaciones/{self.conversaciones[0].pk}/leer/', {'hasta': 'x'}, format='json'
+		).status_code, 400)
+
+
+class AgendaTests(TestCase):
+	"""Las visitas del mismo inmueble o propietario no se solapan; una puede empezar justo
+	cuando termina otra, y /disponibilidad/ ofrece solo los horarios libres."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.propietario = Usuario.objects.create(nombres='Luis', apellidos='Gil', email='luis@example.com', password_hash='x')
+		cls.interesado = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		municipio = Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad)
+		tipo = TipoInmueble.objects.create(nombre_tipo='Casa')
+		cls.casa, cls.otra_casa = [
+			Inmueble.objects.create(
+				codigo_referencia=codigo, titulo_publicacion='Casa', direccion_exacta='Centro', precio='100000.00',
+				superficie_construccion='100', municipio=municipio, tipo_inmueble=tipo, propietario=cls.propietario,
+				estatus_moderacion='Aprobado'
+			)
+			for codigo in ('AGENDA-1', 'AGENDA-2')
+		]
+
+	def setUp(self):
+		self.client = APIClient()
+		self.client.force_authenticate(self.interesado)
+		zona = ZoneInfo(settings.CITA_ZONA_HORARIA)
+		self.dia = timezone.localdate(timezone=zona) + datetime.timedelta(days=7)
+		self.a_las = lambda hora, minuto=0: datetime.datetime.combine(self.dia, datetime.time(hora, minuto), zona)
+
+	def programar(self, inmueble, inicio, duracion=60):
+		return self.client.post(
+			f'/api/inmuebles/{inmueble.pk}/schedule-visit/',
+			{'fecha_hora_cita': inicio.isoformat(), 'duracion_minutos': duracion}, format='json'
+		)
+
+	def test_conflicts(self):
+		self.assertEqual(self.programar(self.casa, self.a_las(10)).status_code, 201)
+		self.assertEqual(Cita.objects.get().fecha_fin_cita, self.a_las(11))
+		# Mismo inmueble, o el mismo propietario en otro inmueble
+		self.assertEqual(self.programar(self.casa, self.a_las(10, 30)).status_code, 409)
+		self.assertEqual(self.programar(self.otra_casa, self.a_las(9, 30)).status_code, 409)
+		# Las canceladas no ocupan el horario
+		Cita.objects.update(estatus_cita='Cancelada')
+		self.assertEqual(self.programar(self.otra_casa, self.a_las(10, 30)).status_code, 201)
+
+	def test_back_to_back(self):
+		self.assertEqual(self.programar(self.casa, self.a_las(10)).status_code, 201)
+		self.assertEqual(self.programar(self.casa, self.a_las(11)).status_code, 201)
+		self.assertEqual(self.programar(self.otra_casa, self.a_las(9)).status_code, 201)
+		self.assertEqual(Cita.objects.count(), 3)
+
+	def test_completar_fin_citas(self):
+		# Una cita anterior a la columna: sin fin no choca con nada hasta completarla
+		self.assertEqual(self.programar(self.casa, self.a_las(10), duracion=90).status_code, 201)
+		Cita.objects.update(fecha_fin_cita=None)
+		self.assertEqual(self.programar(self.casa, self.a_las(11)).status_code, 201)
+		Cita.objects.filter(fecha_hora_cita=self.a_las(11)).delete()
+
+		call_command('completar_fin_citas', '--batch-size=1', stdout=StringIO())
+		self.assertEqual(Cita.objects.get().fecha_fin_cita, self.a_las(11, 30))
+		self.assertEqual(self.programar(self.casa, self.a_las(11)).status_code, 409)
+
+	@override_settings(CITA_HORA_INICIO=9, CITA_HORA_FIN=18, CITA_INTERVALO_MINUTOS=30)
+	def test_disponibilidad(self):
+		self.programar(self.otra_casa, self.a_las(10))
+		response = self.client.get(
+			f'/api/inmuebles/{self.casa.pk}/disponibilidad/', {'desde': self.dia.isoformat(), 'hasta': self.dia.isoformat()}
+		)
+		self.assertEqual(response.status_code, 200)
+		inicios = [horario['inicio'] for horario in response.data['horarios']]
+		# Cada 30 minutos de 9:00 a 17:00 (la última termina a las 18:00), salvo los que pisan 10:00-11:00
+		esperados = [self.a_las(9)] + [self.a_las(11) + datetime.timedelta(minutes=30 * i) for i in range(13)]
+		self.assertEqual(inicios, esperados)
+
+
+class CalendarioTests(TestCase):
+	"""El calendario ICS responde 304 sin consultas mientras no cambien las citas; su URL se
+	revoca al regenerarla o al desactivar al usuario."""
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.interesado = Usuario.objects.create(nombres='Ana', apellidos='Pérez', email='ana@example.com', password_hash='x')
+		cls.propietario = Usuario.objects.create(nombres='Luis', apellidos='Gil', email='luis@example.com', password_hash='x')
+		cls.otro = Usuario.objects.create(nombres='Eva', apellidos='Ruiz', email='eva@example.com', password_hash='x')
+		estado = Estado.objects.create(nombre_estado='Carabobo')
+		ciudad = Ciudad.objects.create(nombre_ciudad='Valencia', estado=estado)
+		inmueble = Inmueble.objects.create(
+			codigo_referencia='ICS-1', titulo_publicacion='Casa, con jardín', direccion_exacta='Av. Bolívar',
+			precio='100000.00', superficie_construccion='100', tipo_inmueble=TipoInmueble.objects.create(nombre_tipo='Casa'),
+			municipio=Municipio.objects.create(nombre_municipio='Valencia', ciudad=ciudad), propietario=cls.propietario
+		)
+		inicio = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) + datetime.timedelta(days=1)
+		cls.cita = Cita.objects.create(
+			inmueble=inmueble, usuario_interesado=cls.interesado, usuario_propietario=cls.propietario,
+			fecha_hora_cita=inicio, duracion_minutos=45
+		)
+
+	def setUp(self):
+		cache.clear()
+		autenticacion.usuarios.limpiar()
+		self.client = APIClient()
+		self.client.force_authenticate(self.interesado)
+		self.url = self.client.get('/api/citas/calendario/').data['url']
+
+	def test_ics(self):
+		response = self.client.get(self.url)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+		cuerpo = b''.join(response.streaming_content).decode('utf-8')
+		fin = self.cita.fecha_hora_cita + datetime.timedelta(minutes=45)
+		for linea in (
+			'BEGIN:VCALENDAR', f'UID:cita-{self.cita.pk}@inmuebles',
+			f"DTSTART:{self.cita.fecha_hora_cita.strftime('%Y%m%dT%H%M%SZ')}", f"DTEND:{fin.strftime('%Y%m%dT%H%M%SZ')}",
+			'SUMMARY:Visita: Casa\\, con jardín', 'STATUS:CONFIRMED', 'END:VCALENDAR',
+		):
+			self.assertIn(f'{linea}\r\n', cuerpo)
+
+	def test_not_modified_without_queries(self):
+		etag = self.client.get(self.url)['ETag']
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(len(ctx.captured_queries), 0)
+
+	def test_revoked_tokens(self):
+		url_nueva = self.client.post('/api/citas/calendario/').data['url']
+		self.assertEqual(self.client.get(self.url).status_code, 403)
+		self.assertEqual(self.client.get(url_nueva).status_code, 200)
+
+		self.interesado.activo = False
+		self.interesado.save()
+		self.assertEqual(self.client.get(url_nueva).status_code, 403)
+
+	def test_change_of_participant_invalidates_both(self):
+		versiones = lambda: [cache_respuestas.version(cache_respuestas.calendario(u.pk)) for u in (self.interesado, self.otro)]
+		antes = versiones()
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.patch(f'/api/citas/{self.cita.pk}/', {'usuario_interesado': self.otro.pk}, format='json')
+		self.assertEqual(response.status_code, 200)
+		despues = versiones()
+		self.assertTrue(all(d > a for a, d in zip(antes, despues)))
+
+		# Con el participante diferido lo consulta pre_save
+		cita = Cita.objects.defer('usuario_interesado').get(pk=self.cita.pk)
+		cita.usuario_interesado = self.interesado
+		with self.captureOnCommitCallbacks(execute=True):
+			cita.save()
+		self.assertTrue(all(n > d for d, n in zip(despues, versiones())))
+
+
+@override_settings(THROTTLE_PRESUPUESTOS={'login': {'ip': '2/min'}, 'search': {'ip': '100/min', 'usuario': '2/min'}})
+class ThrottlingTests(TestCase):
+	"""Baldes por IP (REMOTE_ADDR salvo que se confíe en proxies) y por usuario."""
+
+	def setUp(self):
+		almacen = mock.patch.object(throttling, '_almacen', throttling.AlmacenMemoria(procesos=1))
+		almacen.start()
+		self.addCleanup(almacen.stop)
+		self.client = APIClient()
+
+	def login(self, **cabeceras):
+		return self.client.post('/api/auth/login/', {}, format='json', REMOTE_ADDR='203.0.113.5', **cabeceras)
+
+	def test_ip_bucket(self):
+		self.assertEqual([self.login().status_code for _ in range(2)], [400, 400])
+		response = self.login()
+		self.assertEqual(response.status_code, 429)
+		# Una ficha cada 30 s
+		self.assertTrue(0 < int(response['Retry-After']) <= 30)
+		# Otra IP tiene su propio balde
+		self.assertEqual(self.client.post('/api/auth/login/', {}, format='json', REMOTE_ADDR='203.0.113.6').status_code, 400)
+
+	def test_forwarded_for_is_ignored_without_proxies(self):
+		self.login()
+		self.login()
+		self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.1').status_code, 429)
+		with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+			self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.1').status_code, 400)
+
+	def test_ipv6_grouped_by_prefix(self):
+		for sufijo in ('1', '2'):
+			self.client.post('/api/auth/login/', {}, format='json', REMOTE_ADDR=f'2001:db8:1:2::{sufijo}')
+		response = self.client.post('/api/auth/login/', {}, format='json', REMOTE_ADDR='2001:db8:1:2:ffff::3')
+		self.assertEqual(response.status_code, 429)
+
+	def test_user_bucket(self):
+		usuarios = [
+			Usuario.objects.create(nombres='Ana', apellidos='Pérez', email=f'ana{i}@example.com', password_hash='x')
+			for i in range(2)
+		]
+		self.client.force_authenticate(usuarios[0])
+		codigos = [self.client.get('/api/inmuebles/search/').status_code for _ in range(3)]
+		self.assertEqual(codigos, [200, 200, 429])
+		# Misma IP, otro usuario
+		self.client.force_authenticate(usuarios[1])
+		self.assertEqual(self.client.get('/api/inmuebles/search/').status_code, 200)
+
+	def test_budget_split_between_processes(self):
+		almacen = throttling.AlmacenMemoria(procesos=2)
+		admitidas = [almacen.consumir('clave', *throttling.parse_presupuesto('4/min')) == 0 for _ in range(3)]
+		self.assertEqual(admitidas, [True, True, False])
+
+
+class ModeracionTests(TestCase):
+	"""Dos moderadores reclaman lotes distintos y solo deciden sobre lo que tienen reservado."""
+
+	@classmethod
+	def setUpTestData(cls):
+		admin = Rol.objects.create(nombre_rol='Administrador')
+		cls.ana = Usuario.objects.create(nombres='Ana', apellidos='A', email='ana@example.com', password_hash='x', rol=admin)
+		cls.beto = Usuario.objects.create(nombres='Beto', apellidos='B', email='beto@example.com', password_hash='x', rol=admin)
+		cls.cliente = Usuario.objects.create(nombres='Caro', apellidos='C', email='caro@example.com', password_hash='x')
+		for i in range(5):
+			Inmueble.objects.create(
+				codigo_referencia=f'MOD-{i}', titulo_publicacion=f'Casa {i}', direccion_exacta='Centro',
+				precio=1000, superficie_construccion=80
+			)
+
+	def cliente_de(self, usuario):
+		client = APIClient()
+		client.force_authenticate(usuario)
+		return client
+
+	def reclamar(self, usuario, cantidad):
+		response = self.cliente_de(usuario).post('/api/inmuebles/moderacion/reclamar/', {'cantidad': cantidad}, format='json')
+		self.assertEqual(response.status_code, 200)
+		return [fila['id'] for fila in response.data['results']]
+
+	def test_claims_do_not_overlap(self):
+		de_ana = self.reclamar(self.ana, 3)
+		de_beto = self.reclamar(self.beto, 3)
+		self.assertEqual(len(de_ana), 3)
+		self.assertEqual(len(de_beto), 2)
+		self.assertFalse(set(de_ana) & set(de_beto))
+		# Reclamar de nuevo renueva el mismo lote
+		self.assertEqual(self.reclamar(self.ana, 3), de_ana)
+
+	def test_bulk_decisions_skip_others_reservations(self):
+		de_ana = self.reclamar(self.ana, 2)
+		de_beto = self.reclamar(self.beto, 2)
+		response = self.cliente_de(self.ana).post(
+			'/api/inmuebles/moderacion/aprobar/', {'ids': de_ana + de_beto}, format='json'
+		)
+		self.assertEqual(response.data, {'actualizados': sorted(de_ana), 'omitidos': sorted(de_beto)})
+		self.assertEqual(Inmueble.objects.filter(estatus_moderacion='Aprobado', moderador=self.ana).count(), 2)
+
+		client = self.cliente_de(self.beto)
+		self.assertEqual(client.post('/api/inmuebles/moderacion/rechazar/', {'ids': de_beto}, format='json').status_code, 400)
+		response = client.post('/api/inmuebles/moderacion/rechazar/', {'ids': de_beto, 'motivo': 'Fotos'}, format='json')
+		self.assertEqual(response.data['actualizados'], sorted(de_beto))
+		self.assertFalse(Inmueble.objects.filter(pk__in=de_beto, reservado_por__isnull=False).exists())
+
+	def test_released_claims_return_to_queue(self):
+		de_ana = self.reclamar(self.ana, 5)
+		response = self.cliente_de(self.ana).post('/api/inmuebles/moderacion/liberar/', {}, format='json')
+		self.assertEqual(response.data, {'liberados': 5})
+		self.assertEqual(self.reclamar(self.beto, 5), de_ana)
+
+	def test_only_moderators(self):
+		response = self.cliente_de(self.cliente).post('/api/inmuebles/moderacion/reclamar/', {}, format='json')
+		self.assertEqual(response.status_code, 403)
+
+
+class ServidorClaves(ThreadingHTTPServer):
+	"""Servidor local que reemplaza al de certificados de Google en las pruebas."""
+
+	def __init__(self, certificados, max_age=3600):
+		self.certificados = certificados
+		self.max_age = max_age
+		self.descargas = 0
+		servidor = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def do_GET(self):
+				servidor.descargas += 1
+				cuerpo = json.dumps(servidor.certificados).encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(cuerpo)))
+				self.send_header('Cache-Control', f'public, max-age={servidor.max_age}')
+				self.end_headers()
+				self.wfile.write(cuerpo)
+
+			def log_message(self, *args):
+				pass
+
+		super().__init__(('127.0.0.1', 0), Handler)
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+
+	@property
+	def url(self):
+		return f'http://127.0.0.1:{self.server_address[1]}/oauth2/v1/certs'
+
+
+class ClavesGoogleTests(TestCase):
+	"""Las claves de Google se descargan una vez y se reutilizan hasta que vencen."""
+
+	def setUp(self):
+		self.servidor = ServidorClaves({'k1': 'certificado-1'})
+		self.addCleanup(self.servidor.server_close)
+		self.addCleanup(self.servidor.shutdown)
+		self.claves = verificacion_google.ClavesGoogle(url=self.servidor.url)
+
+	def test_cached_until_expiry(self):
+		self.assertEqual(self.claves.obtener('k1'), {'k1': 'certificado-1'})
+		self.assertEqual(self.claves.obtener('k1'), {'k1': 'certificado-1'})
+		self.assertEqual(self.servidor.descargas, 1)
+
+	def test_unknown_kid_refreshes(self):
+		self.claves.obtener('k1')
+		self.servidor.certificados = {'k1': 'certificado-1', 'k2': 'certificado-2'}
+		with self.settings(GOOGLE_CLAVES_REINTENTO=0):
+			self.assertIn('k2', self.claves.obtener('k2'))
+		self.assertEqual(self.servidor.descargas, 2)
+
+	def test_stale_keys_when_server_is_down(self):
+		self.servidor.max_age = 0
+		self.claves.obtener('k1')
+		self.servidor.shutdown()
+		self.servidor.server_close()
+		self.claves.url = 'http://127.0.0.1:9/oauth2/v1/certs'
+		self.assertEqual(self.claves.obtener('k1'), {'k1': 'certificado-1'})
+
+	@skipUnless(find_spec('google') and find_spec('cryptography'), 'requiere google-auth y cryptography')
+	def test_verify_token_locally(self):
+		from google.auth import crypt, jwt as google_jwt
+		from cryptography import x509
+		from cryptography.hazmat.primitives import hashes, serialization
+		from cryptography.hazmat.primitives.asymmetric import rsa
+		from cryptography.x509.oid import NameOID
+
+		clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+		nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'prueba')])
+		ahora = datetime.datetime.now(datetime.timezone.utc)
+		certificado = (
+			x509.CertificateBuilder().subject_name(nombre).issuer_name(nombre).public_key(clave.public_key())
+			.serial_number(1).not_valid_before(ahora).not_valid_after(ahora + datetime.timedelta(days=1))
+			.sign(clave, hashes.SHA256())
+		)
+		self.servidor.certificados = {'prueba': certificado.public_bytes(serialization.Encoding.PEM).decode('ascii')}
+		pem = clave.private_bytes(
+			serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+		)
+		firmante = crypt.RSASigner.from_string(pem, key_id='prueba')
+		token = google_jwt.encode(firmante, {
+			'iss': 'https://accounts.google.com', 'aud': 'cliente', 'sub': '1', 'email': 'ana@example.com',
+			'iat': int(time.time()), 'exp': int(time.time()) + 600,
+		}).decode('ascii')
+
+		with mock.patch.object(verificacion_google, 'claves', self.claves):
+			self.assertEqual(verificacion_google.verificar(token, audiencia='cliente')['email'], 'ana@example.com')
+			with self.assertRaises(ValueError):
+				verificacion_google.verificar(token, audiencia='otro')
+		self.assertEqual(self.servidor.descargas, 1)
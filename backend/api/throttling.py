@@ -0,0 +1,163 @@
+"""
+Límite de peticiones con token bucket por IP y por usuario.
+
+Cada alcance (``login``, ``search``...) tiene sus presupuestos en
+``THROTTLE_PRESUPUESTOS``: ``'ip'`` se aplica a toda petición y ``'usuario'`` además a las
+autenticadas. Un presupuesto ``'10/min'`` es un balde de 10 fichas que se rellena a 10 por
+minuto: admite ráfagas de 10 y luego una petición cada 6 segundos. Sin fichas la
+respuesta es 429 con ``Retry-After``.
+
+DRF revisa los límites antes de ejecutar la vista, así que una petición rechazada no llega a
+la BD. Las vistas de autenticación no tienen autenticación propia y la de usuarios se sirve
+desde la caché de api/autenticacion.py.
+
+La IP es la de ``get_ident`` de DRF con ``NUM_PROXIES`` (0 por defecto: REMOTE_ADDR, sin
+creer en X-Forwarded-For, que el cliente puede inventar); detrás de N proxies de confianza
+se configura ``NUM_PROXIES=N``. Las IPv6 se agrupan por /64, lo que suele tener un cliente.
+
+El estado vive en ``THROTTLE_ALMACEN``: ``AlmacenCache`` (la caché de Django; el
+predeterminado con ``REDIS_URL``, compartido entre workers) o ``AlmacenMemoria`` (por
+proceso). En memoria cada worker lleva su cuenta, así que el presupuesto se reparte entre
+los ``THROTTLE_PROCESOS`` del servidor; como el número de baldes está acotado, un cliente
+con muchas IPs puede hacer olvidar baldes ajenos, por eso en producción conviene Redis.
+Otro almacén solo necesita implementar ``consumir``.
+"""
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_presupuesto(presupuesto):
+	"""``'10/min'`` -> (capacidad 10, 10/60 fichas por segundo)."""
+	cantidad, periodo = presupuesto.split('/')
+	capacidad = int(cantidad)
+	return capacidad, capacidad / PERIODOS[periodo.strip()[0].lower()]
+
+
+def _rellenar(estado, capacidad, tasa, ahora):
+	fichas, ultimo = estado if estado is not None else (capacidad, ahora)
+	return min(capacidad, fichas + (ahora - ultimo) * tasa)
+
+
+def _consumir(estado, capacidad, tasa, ahora):
+	"""(nuevo estado, segundos de espera; 0 si se admite)."""
+	fichas = _rellenar(estado, capacidad, tasa, ahora)
+	if fichas >= 1:
+		return (fichas - 1, ahora), 0
+	return (fichas, ahora), (1 - fichas) / tasa
+
+
+class Almacen:
+	"""Interfaz de los almacenes de baldes."""
+
+	def consumir(self, clave, capacidad, tasa):
+		"""Toma una ficha del balde ``clave``; devuelve 0 si la había o los segundos de espera."""
+		raise NotImplementedError
+
+
+class AlmacenMemoria(Almacen):
+	"""Baldes en la memoria del proceso, acotados en número. Cada uno de los ``procesos``
+	workers admite su parte del presupuesto (al menos una ficha)."""
+
+	def __init__(self, max_claves=None, procesos=None):
+		self.max_claves = max_claves or settings.THROTTLE_MAX_CLAVES
+		self.procesos = procesos or settings.THROTTLE_PROCESOS
+		self._baldes = OrderedDict()
+		self._lock = threading.Lock()
+
+	def consumir(self, clave, capacidad, tasa):
+		capacidad, tasa = max(capacidad / self.procesos, 1), tasa / self.procesos
+		with self._lock:
+			estado, espera = _consumir(self._baldes.get(clave), capacidad, tasa, time.monotonic())
+			self._baldes[clave] = estado
+			self._baldes.move_to_end(clave)
+			while len(self._baldes) > self.max_claves:
+				self._baldes.popitem(last=False)
+			return espera
+
+	def limpiar(self):
+		with self._lock:
+			self._baldes.clear()
+
+
+class AlmacenCache(Almacen):
+	"""Baldes en la caché de Django (compartidos si la caché lo es).
+
+	La lectura y escritura no son atómicas: con peticiones simultáneas de la misma clave se
+	pueden colar unas pocas de más, lo que basta para frenar ráfagas.
+	"""
+	prefijo = 'throttle:'
+
+	def consumir(self, clave, capacidad, tasa):
+		clave = self.prefijo + clave
+		estado, espera = _consumir(cache.get(clave), capacidad, tasa, time.time())
+		# Un balde lleno equivale a uno inexistente: la entrada puede expirar entonces
+		cache.set(clave, estado, timeout=int((capacidad - estado[0]) / tasa) + 1)
+		return espera
+
+
+_almacen = None
+_lock_almacen = threading.Lock()
+
+
+def get_almacen():
+	global _almacen
+	with _lock_almacen:
+		if _almacen is None:
+			_almacen = import_string(settings.THROTTLE_ALMACEN)()
+		return _almacen
+
+
+def cliente(ip):
+	"""Clave de la IP ``ip``: las IPv6 por su red /64."""
+	try:
+		direccion = ipaddress.ip_address(ip)
+	except ValueError:
+		return ip
+	if direccion.version == 6:
+		if direccion.ipv4_mapped is not None:
+			return str(direccion.ipv4_mapped)
+		return str(ipaddress.ip_network(f'{direccion}/64', strict=False))
+	return str(direccion)
+
+
+class TokenBucketThrottle(BaseThrottle):
+	"""Throttle de DRF con los presupuestos del alcance ``scope`` (ver ``limitar``)."""
+	scope = None
+
+	def allow_request(self, request, view):
+		presupuestos = settings.THROTTLE_PRESUPUESTOS.get(self.scope, {})
+		almacen = get_almacen()
+		self.espera = 0
+
+		# Primero la IP, que se conoce sin autenticar
+		if 'ip' in presupuestos:
+			clave = f'{self.scope}:ip:{cliente(self.get_ident(request))}'
+			self.espera = almacen.consumir(clave, *parse_presupuesto(presupuestos['ip']))
+			if self.espera:
+				return False
+
+		if 'usuario' in presupuestos:
+			usuario = getattr(request, 'user', None)
+			if usuario is not None and usuario.is_authenticated:
+				clave = f'{self.scope}:usuario:{usuario.pk}'
+				self.espera = almacen.consumir(clave, *parse_presupuesto(presupuestos['usuario']))
+				if self.espera:
+					return False
+		return True
+
+	def wait(self):
+		return self.espera or None
+
+
+def limitar(alcance):
+	"""Clase de throttle para ``throttle_classes`` con los presupuestos de ``alcance``."""
+	return type('TokenBucketThrottle', (TokenBucketThrottle,), {'scope': alcance})
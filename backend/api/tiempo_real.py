@@ -0,0 +1,266 @@
+"""
+Entrega de mensajes en tiempo real por Server-Sent Events (GET /api/mensajes/stream/).
+
+Cada cliente conectado se suscribe al canal de su usuario. Al confirmarse un Mensaje nuevo
+la señal ``publicar_mensaje_creado`` lo publica en los canales de los dos participantes de la
+conversación y el backend de difusión lo entrega a las conexiones abiertas: mientras nadie
+escribe, una conexión no consulta la BD (solo envía un latido cada ``LATIDO`` segundos).
+
+Backends (``TIEMPO_REAL_BACKEND``):
+
+- ``DifusionMemoria``: un solo proceso (runserver, un worker ASGI).
+- ``DifusionRedis``: varios workers; publica por Redis pub/sub y cada proceso reparte a sus
+  conexiones. Requiere el paquete ``redis`` y ``REDIS_URL``.
+
+Otro broker se integra heredando de ``Difusion``.
+
+El flujo solo funciona sirviendo la app por ASGI (``uvicorn config.asgi:application``): un
+servidor WSGI (runserver, gunicorn sin worker de uvicorn) intentaría leer la respuesta
+entera y la conexión no terminaría nunca, así que en ese caso la vista responde 503.
+
+EventSource no admite cabeceras, así que el usuario va en ``?token=``. Para no dejar el JWT
+de acceso en los logs de proxies y servidores, ese token lo emite ``POST
+/api/mensajes/stream/token/``: solo sirve para abrir el flujo y vence a los
+``TIEMPO_REAL_TOKEN_SEGUNDOS`` (el cliente pide otro al reconectar).
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Mensaje
+
+# Segundos entre latidos (mantiene viva la conexión a través de proxies)
+LATIDO = 15
+
+# Eventos pendientes por conexión; si un cliente no los consume se descartan y los recupera
+# al reconectar con Last-Event-ID
+MAX_PENDIENTES = 100
+
+# Mensajes reenviados como máximo al reconectar con Last-Event-ID
+MAX_REENVIO = 200
+
+
+SAL = 'api.tiempo_real'
+
+
+def token_de(usuario_id):
+	return signing.TimestampSigner(salt=SAL).sign(str(usuario_id))
+
+
+def usuario_de(token):
+	"""Id del usuario del token, o None si la firma no es válida o el token venció."""
+	try:
+		return int(signing.TimestampSigner(salt=SAL).unsign(token or '', max_age=settings.TIEMPO_REAL_TOKEN_SEGUNDOS))
+	except (signing.BadSignature, ValueError):
+		return None
+
+
+def canal_usuario(usuario_id):
+	return f'usuario:{usuario_id}'
+
+
+class Suscripcion:
+	"""Cola de eventos de una conexión. ``entregar`` se puede llamar desde cualquier hilo."""
+
+	def __init__(self, loop):
+		self.loop = loop
+		self.cola = asyncio.Queue(MAX_PENDIENTES)
+
+	def entregar(self, evento):
+		self.loop.call_soon_threadsafe(self._poner, evento)
+
+	def _poner(self, evento):
+		try:
+			self.cola.put_nowait(evento)
+		except asyncio.QueueFull:
+			pass
+
+	async def recibir(self, timeout):
+		return await asyncio.wait_for(self.cola.get(), timeout)
+
+
+class Difusion:
+	"""Interfaz de los backends de difusión."""
+
+	def publicar(self, canal, evento):
+		"""Envía ``evento`` (dict serializable a JSON) a los suscriptores de ``canal``."""
+		raise NotImplementedError
+
+	async def suscribir(self, canal):
+		"""Devuelve una Suscripcion que recibe los eventos de ``canal``."""
+		raise NotImplementedError
+
+	async def cancelar(self, canal, suscripcion):
+		raise NotImplementedError
+
+
+class DifusionMemoria(Difusion):
+	"""Reparte los eventos entre las conexiones del proceso actual."""
+
+	def __init__(self):
+		self._canales = defaultdict(set)
+		self._lock = threading.Lock()
+
+	def publicar(self, canal, evento):
+		self.repartir(canal, evento)
+
+	def repartir(self, canal, evento):
+		with self._lock:
+			suscripciones = list(self._canales.get(canal, ()))
+		for suscripcion in suscripciones:
+			suscripcion.entregar(evento)
+
+	async def suscribir(self, canal):
+		suscripcion = Suscripcion(asyncio.get_running_loop())
+		with self._lock:
+			self._canales[canal].add(suscripcion)
+		return suscripcion
+
+	async def cancelar(self, canal, suscripcion):
+		with self._lock:
+			suscripciones = self._canales.get(canal)
+			if suscripciones is not None:
+				suscripciones.discard(suscripcion)
+				if not suscripciones:
+					del self._canales[canal]
+
+
+class DifusionRedis(DifusionMemoria):
+	"""Publica por Redis pub/sub; un hilo por proceso escucha todos los canales y reparte
+	localmente con DifusionMemoria (los eventos sin conexiones locales se ignoran)."""
+	prefijo = 'tiempo_real:'
+
+	def __init__(self, url=None):
+		super().__init__()
+		import redis
+
+		self._cliente = redis.Redis.from_url(url or settings.REDIS_URL)
+		self._hilo = None
+		self._lock_hilo = threading.Lock()
+
+	def publicar(self, canal, evento):
+		self._cliente.publish(self.prefijo + canal, json.dumps(evento, cls=DjangoJSONEncoder))
+
+	async def suscribir(self, canal):
+		self._escuchar()
+		return await super().suscribir(canal)
+
+	def _escuchar(self):
+		with self._lock_hilo:
+			if self._hilo is not None:
+				return
+			pubsub = self._cliente.pubsub(ignore_subscribe_messages=True)
+			pubsub.psubscribe(**{self.prefijo + '*': self._recibido})
+			self._hilo = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+	def _recibido(self, mensaje):
+		canal = mensaje['channel']
+		if isinstance(canal, bytes):
+			canal = canal.decode('utf-8')
+		self.repartir(canal[len(self.prefijo):], json.loads(mensaje['data']))
+
+
+_backend = None
+_lock_backend = threading.Lock()
+
+
+def get_backend():
+	global _backend
+	with _lock_backend:
+		if _backend is None:
+			_backend = import_string(settings.TIEMPO_REAL_BACKEND)()
+		return _backend
+
+
+def evento_mensaje(mensaje):
+	"""Evento ``mensaje`` de un Mensaje (con ``usuario_emisor`` cargado)."""
+	from .serializers import MensajeResumenSerializer
+
+	return {
+		'id': mensaje.id,
+		'tipo': 'mensaje',
+		'datos': {**MensajeResumenSerializer(mensaje).data, 'conversacion': mensaje.conversacion_id},
+	}
+
+
+def publicar_mensaje(mensaje_id):
+	"""Publica un mensaje ya confirmado en los canales de los participantes."""
+	mensaje = (
+		Mensaje.objects.select_related('usuario_emisor', 'conversacion')
+		.filter(pk=mensaje_id).first()
+	)
+	if mensaje is None:
+		return
+	evento = evento_mensaje(mensaje)
+	backend = get_backend()
+	conversacion = mensaje.conversacion
+	for usuario_id in {conversacion.usuario_interesado_id, conversacion.usuario_vendedor_id}:
+		backend.publicar(canal_usuario(usuario_id), evento)
+
+
+def publicar_leidos(conversacion, usuario_id, hasta=None):
+	"""Avisa a los participantes que ``usuario_id`` leyó la conversación (hasta ``hasta``).
+
+	Sin id: no forma parte de lo que se reenvía al reconectar, que es solo la lista de mensajes.
+	"""
+	evento = {
+		'id': None,
+		'tipo': 'leidos',
+		'datos': {'conversacion': conversacion.pk, 'usuario': usuario_id, 'hasta': hasta},
+	}
+	backend = get_backend()
+	for participante in {conversacion.usuario_interesado_id, conversacion.usuario_vendedor_id}:
+		backend.publicar(canal_usuario(participante), evento)
+
+
+def mensajes_desde(usuario_id, ultimo_id):
+	"""Eventos de los mensajes posteriores a ``ultimo_id`` en las conversaciones del usuario."""
+	mensajes = (
+		Mensaje.objects
+		.filter(Q(conversacion__usuario_interesado_id=usuario_id) | Q(conversacion__usuario_vendedor_id=usuario_id))
+		.filter(id__gt=ultimo_id)
+		.select_related('usuario_emisor')
+		.order_by('id')[:MAX_REENVIO]
+	)
+	return [evento_mensaje(mensaje) for mensaje in mensajes]
+
+
+def formato_sse(evento):
+	datos = json.dumps(evento['datos'], cls=DjangoJSONEncoder, ensure_ascii=False)
+	linea_id = f"id: {evento['id']}\n" if evento['id'] is not None else ''
+	return f"{linea_id}event: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+async def eventos(usuario_id, ultimo_id=None, pendientes=None):
+	"""Flujo SSE de un usuario. ``pendientes`` (async) devuelve los eventos posteriores a
+	``ultimo_id`` que se perdieron mientras el cliente estaba desconectado."""
+	backend = get_backend()
+	canal = canal_usuario(usuario_id)
+	# Suscribirse antes de leer los pendientes para no perder nada entre ambos pasos
+	suscripcion = await backend.suscribir(canal)
+	try:
+		yield 'retry: 3000\n\n'
+		reenviados = set()
+		if ultimo_id is not None and pendientes is not None:
+			for evento in await pendientes(usuario_id, ultimo_id):
+				reenviados.add(evento['id'])
+				yield formato_sse(evento)
+		while True:
+			try:
+				evento = await suscripcion.recibir(LATIDO)
+			except asyncio.TimeoutError:
+				yield ': ping\n\n'
+				continue
+			# Un mensaje confirmado durante la lectura de pendientes llega por ambos caminos
+			if evento['id'] is not None and evento['id'] in reenviados:
+				continue
+			yield formato_sse(evento)
+	finally:
+		await backend.cancelar(canal, suscripcion)
@@ -0,0 +1,40 @@
+"""Árbol Estado -> Ciudad -> Municipio construido con tres consultas planas."""
+from .models import Ciudad, Estado, Municipio
+
+
+def construir_arbol(estado_id=None):
+	"""Lista de estados con sus ciudades y municipios anidados, ordenados por nombre.
+
+	Con ``estado_id`` devuelve sólo el subárbol de ese estado (lista vacía si no existe).
+	"""
+	estados = Estado.objects.order_by('nombre_estado').values('id', 'nombre_estado')
+	ciudades = Ciudad.objects.filter(estado__isnull=False).order_by('nombre_ciudad').values('id', 'nombre_ciudad', 'estado_id')
+	municipios = Municipio.objects.filter(ciudad__isnull=False).order_by('nombre_municipio').values('id', 'nombre_municipio', 'ciudad_id')
+	if estado_id is not None:
+		estados = estados.filter(id=estado_id)
+		ciudades = ciudades.filter(estado_id=estado_id)
+		municipios = municipios.filter(ciudad__estado_id=estado_id)
+
+	municipios_por_ciudad = {}
+	for municipio in municipios:
+		municipios_por_ciudad.setdefault(municipio['ciudad_id'], []).append({
+			'id': municipio['id'],
+			'nombre_municipio': municipio['nombre_municipio'],
+		})
+
+	ciudades_por_estado = {}
+	for ciudad in ciudades:
+		ciudades_por_estado.setdefault(ciudad['estado_id'], []).append({
+			'id': ciudad['id'],
+			'nombre_ciudad': ciudad['nombre_ciudad'],
+			'municipios': municipios_por_ciudad.get(ciudad['id'], []),
+		})
+
+	return [
+		{
+			'id': estado['id'],
+			'nombre_estado': estado['nombre_estado'],
+			'ciudades': ciudades_por_estado.get(estado['id'], []),
+		}
+		for estado in estados
+	]
@@ -19,6 +19,10 @@ router.register(r'conversaciones', views.ConversacionViewSet)
 router.register(r'mensajes', views.MensajeViewSet)
 
 urlpatterns = [
+    # Before the router, whose mensajes/<pk>/ route would otherwise match it
+    path('mensajes/stream/', views.mensajes_stream, name='mensajes-stream'),
+    path('mensajes/stream/token/', views.mensajes_stream_token, name='mensajes-stream-token'),
+    path('citas/calendario.ics', views.citas_calendario, name='citas-calendario-ics'),
     path('', include(router.urls)),
     # Authentication endpoints
     path('auth/register/', views.register_user, name='register'),
@@ -28,6 +32,8 @@ urlpatterns = [
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # Property endpoints
     path('casas/', views.casas_publicas, name='casas-list'),
+    path('estadisticas/mercado/', views.estadisticas_mercado, name='estadisticas-mercado'),
+    path('ubicaciones/arbol/', views.arbol_ubicaciones, name='ubicaciones-arbol'),
     path('inmuebles/search/', views.InmuebleViewSet.as_view({'get': 'search'}), name='inmuebles-search'),
     path('inmuebles/<int:pk>/schedule-visit/', views.InmuebleViewSet.as_view({'post': 'schedule_visit'}), name='schedule-visit'),
 ]
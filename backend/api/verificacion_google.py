@@ -0,0 +1,148 @@
+"""
+Verificación local de ID tokens de Google con las claves públicas en caché.
+
+``google_id_token.verify_oauth2_token`` descarga los certificados de Google en cada login,
+así que el tiempo de login dependía de esa ida y vuelta. Aquí los certificados se guardan
+en memoria el tiempo que indica el ``Cache-Control: max-age`` de la respuesta (o
+``GOOGLE_CLAVES_TTL``) y la firma se comprueba localmente con ``google.auth.jwt``:
+
+- Antes de que venzan (``GOOGLE_CLAVES_MARGEN`` segundos) se renuevan en un hilo aparte.
+- Si vencieron y la descarga falla se siguen usando las anteriores: Google publica las
+  claves nuevas con antelación, así que un corte breve no impide el login.
+- Solo se espera a la red sin claves cargadas o ante un ``kid`` desconocido (rotación), y
+  esto último como mucho una vez por ``GOOGLE_CLAVES_REINTENTO`` segundos.
+
+Las descargas reutilizan una conexión HTTP persistente. ``GOOGLE_CERTS_URL`` puede apuntar
+a un servidor local que sirva certificados propios (pruebas, entornos sin salida a internet).
+"""
+import base64
+import http.client
+import json
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EMISORES = ('accounts.google.com', 'https://accounts.google.com')
+
+# Tolerancia de reloj al validar iat/exp
+DESFASE_RELOJ = 10
+
+
+class ClavesGoogle:
+	"""Certificados (``kid`` -> PEM) de ``url`` en caché, renovados en segundo plano."""
+
+	def __init__(self, url=None, timeout=5):
+		self.url = url
+		self.timeout = timeout
+		self._claves = None
+		self._vence = 0
+		self._ultimo_intento = 0
+		self._conexion = None
+		self._lock = threading.Lock()
+		self._lock_descarga = threading.Lock()
+		self._renovando = False
+
+	def _url(self):
+		return self.url or settings.GOOGLE_CERTS_URL
+
+	def _descargar(self):
+		"""(claves, segundos de vigencia) reutilizando la conexión abierta."""
+		partes = urlsplit(self._url())
+		ruta = partes.path + (f'?{partes.query}' if partes.query else '')
+		for intento in range(2):
+			if self._conexion is None:
+				clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+				self._conexion = clase(partes.netloc, timeout=self.timeout)
+			try:
+				self._conexion.request('GET', ruta, headers={'Accept': 'application/json'})
+				respuesta = self._conexion.getresponse()
+				cuerpo = respuesta.read()
+			except (http.client.HTTPException, OSError):
+				# Conexión cerrada por el servidor entre descargas: se reabre una vez
+				self._conexion.close()
+				self._conexion = None
+				if intento:
+					raise
+				continue
+			if respuesta.status != 200:
+				raise ValueError(f'Respuesta {respuesta.status} al descargar las claves de Google')
+			edad = re.search(r'max-age=(\d+)', respuesta.getheader('Cache-Control', ''))
+			return json.loads(cuerpo), int(edad.group(1)) if edad else settings.GOOGLE_CLAVES_TTL
+
+	def renovar(self):
+		"""Descarga las claves ahora. Devuelve True si se actualizaron."""
+		with self._lock_descarga:
+			self._ultimo_intento = time.monotonic()
+			try:
+				claves, vigencia = self._descargar()
+			except (ValueError, http.client.HTTPException, OSError):
+				logger.warning('No se pudieron descargar las claves de Google', exc_info=True)
+				return False
+			with self._lock:
+				self._claves = claves
+				self._vence = time.monotonic() + vigencia
+			return True
+
+	def _renovar_en_segundo_plano(self):
+		with self._lock:
+			if self._renovando:
+				return
+			self._renovando = True
+
+		def tarea():
+			try:
+				self.renovar()
+			finally:
+				self._renovando = False
+
+		threading.Thread(target=tarea, name='claves-google', daemon=True).start()
+
+	def obtener(self, kid=None):
+		"""Claves vigentes; solo bloquea si no hay ninguna o si falta ``kid``."""
+		with self._lock:
+			claves, restante = self._claves, self._vence - time.monotonic()
+		if claves is None:
+			self.renovar()
+		elif kid is not None and kid not in claves:
+			if time.monotonic() - self._ultimo_intento >= settings.GOOGLE_CLAVES_REINTENTO:
+				self.renovar()
+		elif restante < settings.GOOGLE_CLAVES_MARGEN:
+			self._renovar_en_segundo_plano()
+		with self._lock:
+			if self._claves is None:
+				raise ValueError('No hay claves de Google disponibles')
+			return self._claves
+
+
+claves = ClavesGoogle()
+
+
+def _kid(token):
+	try:
+		cabecera = token.split('.')[0]
+		return json.loads(base64.urlsafe_b64decode(cabecera + '=' * (-len(cabecera) % 4))).get('kid')
+	except (ValueError, AttributeError):
+		raise ValueError('Token mal formado')
+
+
+def verificar(token, audiencia=None):
+	"""Datos (claims) de un ID token de Google válido; ValueError si no lo es."""
+	from google.auth import exceptions as google_exceptions
+	from google.auth import jwt as google_jwt
+
+	certificados = claves.obtener(_kid(token))
+	try:
+		datos = google_jwt.decode(
+			token, certs=certificados, audience=audiencia, clock_skew_in_seconds=DESFASE_RELOJ
+		)
+	except google_exceptions.GoogleAuthError as e:
+		raise ValueError(str(e))
+	if datos.get('iss') not in EMISORES:
+		raise ValueError('Emisor del token inválido')
+	return datos
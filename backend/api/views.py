@@ -1,20 +1,58 @@
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import time
+from zoneinfo import ZoneInfo
+
 from rest_framework import viewsets, permissions, filters, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes, throttle_classes
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce, Now
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
 
 from .models import (
 	Estado, Ciudad, Municipio, Rol, Usuario, TipoInmueble, Caracteristica,
-	Inmueble, InmuebleCaracteristica, Operacion, Cita, Conversacion, Mensaje
+	Inmueble, InmuebleCaracteristica, InmuebleListado, Operacion, Cita, Conversacion, Mensaje,
+	EstadisticaMercado, clave_calendario_nueva
 )
 from .serializers import (
 	EstadoSerializer, CiudadSerializer, MunicipioSerializer, RolSerializer, UsuarioSerializer,
 	TipoInmuebleSerializer, CaracteristicaSerializer, InmuebleSerializer, InmuebleCaracteristicaSerializer,
-	OperacionSerializer, CitaSerializer, ConversacionSerializer, MensajeSerializer
+	OperacionSerializer, CitaSerializer, ConversacionSerializer, ConversacionInboxSerializer, MensajeSerializer,
+	related_paths
+)
+from . import (
+	agenda, autenticacion, cache as cache_respuestas, calendario as calendario_ics, estadisticas, geo,
+	moderacion, tiempo_real, verificacion_google
 )
+from .batch import procesar_lote
+from .export import FORMATOS as FORMATOS_EXPORTACION, respuesta_exportacion
+from .facets import calcular_facetas
+from .pagination import KeysetPagination
+from .search import BusquedaTextoFilter
+from .sync import SincronizacionMixin
+from .throttling import limitar
+from .ubicaciones import construir_arbol
 
 
 class ReadOnlyOrIsOwner(permissions.BasePermission):
@@ -26,94 +64,222 @@ class ReadOnlyOrIsOwner(permissions.BasePermission):
 		return request.user and request.user.is_authenticated
 
 
-class EstadoViewSet(viewsets.ModelViewSet):
+class EsModerador(permissions.BasePermission):
+	"""Permiso: usuarios cuyo rol está en MODERACION_ROLES."""
+
+	def has_permission(self, request, view):
+		rol = getattr(request.user, 'rol', None)
+		return bool(request.user and request.user.is_authenticated and rol and rol.nombre_rol in settings.MODERACION_ROLES)
+
+
+class SparseFieldsMixin:
+	"""Con ?fields= / ?expand= sólo se consultan las relaciones que la respuesta va a mostrar
+	(ver DynamicFieldsMixin en serializers.py)."""
+
+	def sparse_fields_requested(self):
+		params = self.request.query_params
+		return self.request.method in permissions.SAFE_METHODS and ('fields' in params or 'expand' in params)
+
+	def get_queryset(self):
+		queryset = super().get_queryset()
+		if self.sparse_fields_requested():
+			select, prefetch = related_paths(self.get_serializer())
+			queryset = queryset.select_related(None).prefetch_related(None)
+			if select:
+				queryset = queryset.select_related(*select)
+			if prefetch:
+				queryset = queryset.prefetch_related(*prefetch)
+		return queryset
+
+
+def version_etag(version, clave):
+	return quote_etag(f'{version}-{hashlib.md5(clave.encode("utf-8")).hexdigest()[:16]}')
+
+
+def with_cache_headers(response, etag, last_modified):
+	response['ETag'] = etag
+	response['Last-Modified'] = http_date(last_modified)
+	response['Cache-Control'] = 'no-cache'
+	return response
+
+
+class ReferenciaCacheMixin:
+	"""Datos de referencia casi estáticos (estados, ciudades, tipos...).
+
+	Las lecturas se sirven desde la memoria del worker mientras no cambie la versión global
+	del espacio 'referencia', que se incrementa en cada escritura (ver api/signals.py).
+	Las respuestas llevan ETag/Last-Modified y las peticiones condicionales reciben 304.
+	"""
+	cache_espacio = cache_respuestas.REFERENCIA
+
+	def list(self, request, *args, **kwargs):
+		return self.cached_response(request, super().list, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+	def cached_response(self, request, handler, *args, **kwargs):
+		version = cache_respuestas.version(self.cache_espacio)
+		last_modified = cache_respuestas.modificado(self.cache_espacio)
+		clave = request.get_full_path()
+		etag = version_etag(version, clave)
+
+		not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+		if not_modified is not None:
+			return with_cache_headers(not_modified, etag, last_modified)
+
+		data = cache_respuestas.memoria.get(self.cache_espacio, version, clave)
+		if data is None:
+			response = handler(request, *args, **kwargs)
+			if response.status_code != status.HTTP_200_OK:
+				return response
+			data = response.data
+			cache_respuestas.memoria.set(self.cache_espacio, version, clave, data)
+		return with_cache_headers(Response(data), etag, last_modified)
+
+
+class ExportMixin:
+	"""Acción ``export``: descarga en streaming de todas las filas (filtradas) en NDJSON o CSV.
+
+	``?formato=ndjson`` (por defecto) o ``?formato=csv``. Ver api/export.py.
+	"""
+	export_nombre = None
+
+	@action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+	def export(self, request):
+		formato = request.query_params.get('formato', 'ndjson')
+		if formato not in FORMATOS_EXPORTACION:
+			return Response(
+				{'error': f'Formato no soportado. Opciones: {", ".join(FORMATOS_EXPORTACION)}'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+		queryset = self.filter_queryset(self.get_queryset())
+		return respuesta_exportacion(self.export_nombre, queryset, formato)
+
+
+class EstadoViewSet(ReferenciaCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Estado.objects.all().order_by('nombre_estado')
 	serializer_class = EstadoSerializer
 	permission_classes = [permissions.AllowAny]
 
 
-class CiudadViewSet(viewsets.ModelViewSet):
+class CiudadViewSet(ReferenciaCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Ciudad.objects.select_related('estado').all()
 	serializer_class = CiudadSerializer
 	permission_classes = [permissions.AllowAny]
 
 
-class MunicipioViewSet(viewsets.ModelViewSet):
+class MunicipioViewSet(ReferenciaCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Municipio.objects.select_related('ciudad').all()
 	serializer_class = MunicipioSerializer
 	permission_classes = [permissions.AllowAny]
 
 
-class RolViewSet(viewsets.ModelViewSet):
+class RolViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Rol.objects.all()
 	serializer_class = RolSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Usuario.objects.all()
 	serializer_class = UsuarioSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class TipoInmuebleViewSet(viewsets.ModelViewSet):
+class TipoInmuebleViewSet(ReferenciaCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = TipoInmueble.objects.all()
 	serializer_class = TipoInmuebleSerializer
 	permission_classes = [permissions.AllowAny]
 
 
-class CaracteristicaViewSet(viewsets.ModelViewSet):
+class CaracteristicaViewSet(ReferenciaCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Caracteristica.objects.all()
 	serializer_class = CaracteristicaSerializer
 	permission_classes = [permissions.AllowAny]
 
 
-class InmuebleViewSet(viewsets.ModelViewSet):
-	queryset = Inmueble.objects.select_related('tipo_inmueble', 'municipio__ciudad').all().order_by('-fecha_publicacion')
+class InmuebleViewSet(ExportMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+	# Every relation InmuebleSerializer nests is fetched here (joins + one prefetch),
+	# so a page costs a constant number of queries. api.tests guards this.
+	queryset = Inmueble.objects.select_related(
+		'tipo_inmueble', 'municipio__ciudad__estado', 'propietario__rol', 'moderador__rol'
+	).prefetch_related(
+		Prefetch('inmueblecaracteristica_set', queryset=InmuebleCaracteristica.objects.select_related('caracteristica'))
+	).all().order_by('-fecha_publicacion', '-id')
 	serializer_class = InmuebleSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-	filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-	search_fields = ['titulo_publicacion', 'descripcion_publica', 'codigo_referencia', 'municipio__nombre_municipio', 'municipio__ciudad__nombre_ciudad']
+	pagination_class = KeysetPagination
+	# ?search= usa el índice de texto completo (ver api/search.py) y ordena por relevancia
+	filter_backends = [BusquedaTextoFilter, filters.OrderingFilter]
 	ordering_fields = ['precio', 'fecha_publicacion']
+	export_nombre = 'inmuebles'
 
 	# Custom route to return a simplified list compatible with frontend /api/casas
 	@action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
 	def casas(self, request):
-		queryset = self.filter_queryset(self.get_queryset())
-		page = self.paginate_queryset(queryset)
-		serializer = self.get_serializer(page or queryset, many=True)
-		# Transform to the lightweight shape the frontend expects
-		def to_front(item):
-			return {
-				'id': str(item.get('id')),
-				'title': item.get('titulo_publicacion'),
-				'description': item.get('descripcion_publica') or item.get('titulo_publicacion'),
-				'price': float(item.get('precio') or 0),
-				'location': f"{item.get('municipio', {}).get('ciudad', {}).get('nombre_ciudad', 'N/A')}, {item.get('municipio', {}).get('nombre_municipio', 'N/A')}",
-				'bedrooms': item.get('habitaciones', 0),
-				'bathrooms': item.get('banos', 0),
-				'size': float(item.get('superficie_construccion') or 0),
-				'image': '/placeholder.svg?height=400&width=600&text=Casa',
-				'features': [char.get('caracteristica', {}).get('nombre_caracteristica', '') for char in item.get('caracteristicas', [])],
-				'yearBuilt': item.get('ano_construccion'),
-				'energyRating': 'A',  # Default value
-			}
+		"""Todas las tarjetas, leídas del modelo de lectura InmuebleListado (sin joins).
 
-		data = [to_front(i) for i in serializer.data]
+		Admite ``?search=`` y ``?ordering=`` como el listado normal: la tabla comparte la pk
+		y los campos de orden con Inmueble.
+		"""
+		queryset = self.filter_queryset(InmuebleListado.objects.order_by('-fecha_publicacion', '-pk'))
+		page = self.paginate_queryset(queryset)
+		data = [fila.a_front() for fila in (page if page is not None else queryset)]
 		return self.get_paginated_response(data) if page is not None else Response(data)
 
-	@action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+	@action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], throttle_classes=[limitar('search')])
 	def search(self, request):
-		"""Búsqueda avanzada de inmuebles"""
-		queryset = self.get_queryset()
-		
+		"""Búsqueda avanzada de inmuebles.
+
+		``?facets=1`` agrega los conteos por filtro (``facets``) a la respuesta;
+		``?facets=only`` devuelve únicamente las facetas, sin filas.
+
+		Modos geográficos (ver api/geo.py):
+		``?bbox=min_lng,min_lat,max_lng,max_lat`` limita al rectángulo visible; con
+		``&zoom=<n>`` por debajo de MAPA_ZOOM_AGRUPAR devuelve ``clusters`` en lugar de filas.
+		``?lat=&lng=&radio_km=`` limita al círculo y ordena por distancia (salvo ``?ordering=``).
+		"""
+		params = request.query_params
+		queryset = self.filtrar_busqueda(self.filter_queryset(self.get_queryset()), params)
+
+		zoom = params.get('zoom')
+		if params.get('bbox') and zoom is not None:
+			try:
+				zoom = int(zoom)
+			except ValueError:
+				return Response({'error': 'zoom debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+			if zoom < geo.ZOOM_AGRUPAR:
+				return Response({'zoom': zoom, 'clusters': geo.agrupar(queryset, geo.precision_para_zoom(zoom))})
+
+		if 'distancia_km' in queryset.query.annotations and not params.get('ordering'):
+			queryset = queryset.order_by('distancia_km', 'id')
+
+		modo_facetas = params.get('facets', '').lower()
+		if modo_facetas == 'only':
+			return Response({'facets': calcular_facetas(queryset)})
+		# Cualquier otro valor (0, false...) deja la respuesta como sin facetas
+		con_facetas = modo_facetas in ('1', 'true', 'yes')
+
+		page = self.paginate_queryset(queryset)
+		serializer = self.get_serializer(page if page is not None else queryset, many=True)
+		if page is not None:
+			response = self.get_paginated_response(serializer.data)
+		else:
+			response = Response({'results': serializer.data} if con_facetas else serializer.data)
+		if con_facetas:
+			response.data['facets'] = calcular_facetas(queryset)
+		return response
+
+	def filtrar_busqueda(self, queryset, params):
+		"""Aplica los filtros de la búsqueda avanzada (compartidos por resultados y facetas)."""
 		# Filtros
-		tipo_inmueble = request.query_params.get('tipo_inmueble')
-		ciudad = request.query_params.get('ciudad')
-		precio_min = request.query_params.get('precio_min')
-		precio_max = request.query_params.get('precio_max')
-		habitaciones = request.query_params.get('habitaciones')
-		banos = request.query_params.get('banos')
+		tipo_inmueble = params.get('tipo_inmueble')
+		ciudad = params.get('ciudad')
+		precio_min = params.get('precio_min')
+		precio_max = params.get('precio_max')
+		habitaciones = params.get('habitaciones')
+		banos = params.get('banos')
 		
 		if tipo_inmueble:
 			queryset = queryset.filter(tipo_inmueble__id=tipo_inmueble)
@@ -127,24 +293,172 @@ class InmuebleViewSet(viewsets.ModelViewSet):
 			queryset = queryset.filter(habitaciones__gte=habitaciones)
 		if banos:
 			queryset = queryset.filter(banos__gte=banos)
-		
-		page = self.paginate_queryset(queryset)
-		serializer = self.get_serializer(page or queryset, many=True)
-		return self.get_paginated_response(serializer.data) if page is not None else Response(serializer.data)
+
+		bbox = params.get('bbox')
+		if bbox:
+			min_lng, min_lat, max_lng, max_lat = self.coordenadas(bbox, 'bbox', 4)
+			if min_lat > max_lat or min_lng > max_lng:
+				raise ValidationError({'bbox': 'Se esperaba min_lng,min_lat,max_lng,max_lat'})
+			queryset = geo.en_bbox(queryset, min_lat, min_lng, max_lat, max_lng)
+		if params.get('lat') or params.get('lng'):
+			lat, lng, radio_km = self.coordenadas(
+				f"{params.get('lat', '')},{params.get('lng', '')},{params.get('radio_km', 5)}", 'lat/lng/radio_km', 3
+			)
+			if not (-90 <= lat <= 90 and -180 <= lng <= 180 and radio_km > 0):
+				raise ValidationError({'lat/lng/radio_km': 'Coordenadas o radio fuera de rango'})
+			queryset = geo.filtrar_radio(queryset, lat, lng, radio_km)
+		return queryset
+
+	@staticmethod
+	def coordenadas(valor, nombre, cantidad):
+		try:
+			numeros = [float(parte) for parte in valor.split(',')]
+		except ValueError:
+			numeros = []
+		if len(numeros) != cantidad or not all(math.isfinite(n) for n in numeros):
+			raise ValidationError({nombre: f'Se esperaban {cantidad} números'})
+		return numeros
+
+	@action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+	def batch(self, request):
+		"""Crea (sin ``id``) o actualiza (con ``id``, parcial) una lista de inmuebles.
+
+		Responde un resultado por elemento; 200 si todos se guardaron, 207 si solo algunos y
+		400 si ninguno.
+		"""
+		items = request.data
+		if not isinstance(items, list) or not items:
+			return Response({'error': 'Se esperaba una lista de inmuebles'}, status=status.HTTP_400_BAD_REQUEST)
+		if len(items) > settings.INMUEBLES_LOTE_MAX:
+			return Response(
+				{'error': f'El lote admite como máximo {settings.INMUEBLES_LOTE_MAX} inmuebles'},
+				status=status.HTTP_400_BAD_REQUEST
+			)
+
+		try:
+			resultados = procesar_lote(items, self.get_serializer_context())
+		except IntegrityError:
+			# Otro proceso insertó el mismo código de referencia entre la validación y la escritura
+			return Response(
+				{'error': 'Conflicto al guardar el lote; vuelva a intentarlo'},
+				status=status.HTTP_409_CONFLICT
+			)
+
+		errores = sum(1 for r in resultados if r['status'] == 'error')
+		if errores == 0:
+			codigo = status.HTTP_200_OK
+		elif errores < len(resultados):
+			codigo = status.HTTP_207_MULTI_STATUS
+		else:
+			codigo = status.HTTP_400_BAD_REQUEST
+		return Response({
+			'created': sum(1 for r in resultados if r['status'] == 'created'),
+			'updated': sum(1 for r in resultados if r['status'] == 'updated'),
+			'errors': errores,
+			'results': resultados,
+		}, status=codigo)
+
+	@staticmethod
+	def ids_moderacion(data, requeridos=True):
+		"""Lista de ids del cuerpo (``ids``) acotada a MODERACION_LOTE_MAX; None si no vino."""
+		ids = data.get('ids')
+		if ids is None and not requeridos:
+			return None
+		if (
+			not isinstance(ids, list) or not ids or len(ids) > settings.MODERACION_LOTE_MAX
+			or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+		):
+			raise ValidationError({'ids': f'Se esperaba una lista de 1 a {settings.MODERACION_LOTE_MAX} ids'})
+		return ids
+
+	@action(detail=False, methods=['post'], url_path='moderacion/reclamar', permission_classes=[EsModerador])
+	def moderacion_reclamar(self, request):
+		"""Reserva para el moderador los ``cantidad`` pendientes más antiguos libres (ver api/moderacion.py)."""
+		try:
+			cantidad = int(request.data.get('cantidad', settings.MODERACION_LOTE))
+		except (TypeError, ValueError):
+			cantidad = 0
+		if not 0 < cantidad <= settings.MODERACION_LOTE_MAX:
+			raise ValidationError({'cantidad': f'Debe estar entre 1 y {settings.MODERACION_LOTE_MAX}.'})
+
+		reservados = moderacion.reclamar(request.user, cantidad)
+		lote = list(self.get_queryset().filter(pk__in=reservados.values('pk')).order_by('fecha_publicacion', 'id'))
+		return Response({
+			'reservado_hasta': lote[0].reservado_hasta if lote else None,
+			'results': self.get_serializer(lote, many=True).data,
+		})
+
+	@action(detail=False, methods=['post'], url_path='moderacion/liberar', permission_classes=[EsModerador])
+	def moderacion_liberar(self, request):
+		"""Devuelve a la cola las reservas del moderador (las de ``ids`` o todas)."""
+		liberados = moderacion.liberar(request.user, self.ids_moderacion(request.data, requeridos=False))
+		return Response({'liberados': liberados})
+
+	@action(detail=False, methods=['post'], url_path='moderacion/aprobar', permission_classes=[EsModerador])
+	def moderacion_aprobar(self, request):
+		return self.decidir_moderacion(request, 'Aprobado')
+
+	@action(detail=False, methods=['post'], url_path='moderacion/rechazar', permission_classes=[EsModerador])
+	def moderacion_rechazar(self, request):
+		motivo = (request.data.get('motivo') or '').strip()
+		if not motivo:
+			raise ValidationError({'motivo': 'Indique el motivo del rechazo.'})
+		return self.decidir_moderacion(request, 'Rechazado', motivo)
+
+	def decidir_moderacion(self, request, estatus, motivo=None):
+		"""Decide en bloque; los ids reservados por otro moderador o ya decididos se omiten."""
+		ids = self.ids_moderacion(request.data)
+		decididos = moderacion.decidir(request.user, ids, estatus, motivo)
+		return Response({
+			'actualizados': decididos,
+			'omitidos': sorted(set(ids) - set(decididos)),
+		})
+
+	@action(detail=True, methods=['get'])
+	def disponibilidad(self, request, pk=None):
+		"""Horarios libres para visitar el inmueble entre ``?desde=`` y ``?hasta=`` (fechas
+		AAAA-MM-DD, por defecto los próximos 7 días), de ``?duracion=`` minutos."""
+		inmueble = self.get_object()
+		hoy = timezone.localdate(timezone=ZoneInfo(settings.CITA_ZONA_HORARIA))
+		params = request.query_params
+		try:
+			desde = parse_date(params['desde']) if 'desde' in params else hoy
+			hasta = parse_date(params['hasta']) if 'hasta' in params else desde + datetime.timedelta(days=6)
+			duracion = int(params.get('duracion', settings.CITA_DURACION_MINUTOS))
+			if desde is None or hasta is None:
+				raise ValueError
+		except (TypeError, ValueError):
+			raise ValidationError({'error': 'Use fechas AAAA-MM-DD y una duración en minutos.'})
+		if hasta < desde or (hasta - desde).days >= agenda.MAX_DIAS:
+			raise ValidationError({'hasta': f'El rango debe ser de 1 a {agenda.MAX_DIAS} días.'})
+		if not 0 < duracion <= settings.CITA_DURACION_MAXIMA_MINUTOS:
+			raise ValidationError({'duracion': f'Debe estar entre 1 y {settings.CITA_DURACION_MAXIMA_MINUTOS} minutos.'})
+
+		return Response({
+			'inmueble': inmueble.pk,
+			'duracion_minutos': duracion,
+			'horarios': agenda.disponibilidad(inmueble, desde, hasta, duracion),
+		})
 
 	@action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
 	def schedule_visit(self, request, pk=None):
 		"""Programar una visita a un inmueble"""
 		inmueble = self.get_object()
 		data = request.data
-		
-		cita = Cita.objects.create(
+		serializer = CitaSerializer(data={
+			'fecha_hora_cita': data.get('fecha_hora_cita'),
+			'duracion_minutos': data.get('duracion_minutos', settings.CITA_DURACION_MINUTOS),
+			'observaciones': data.get('observaciones', ''),
+		})
+		serializer.is_valid(raise_exception=True)
+
+		# Responde 409 si el horario choca con otra visita del inmueble o del propietario
+		cita = agenda.guardar(Cita(
 			inmueble=inmueble,
 			usuario_interesado_id=request.user.id,
-			usuario_propietario=inmueble.propietario,
-			fecha_hora_cita=data.get('fecha_hora_cita'),
-			observaciones=data.get('observaciones', '')
-		)
+			usuario_propietario_id=inmueble.propietario_id,
+			**serializer.validated_data
+		))
 		
 		return Response({
 			'message': 'Visita programada exitosamente',
@@ -152,85 +466,171 @@ class InmuebleViewSet(viewsets.ModelViewSet):
 		}, status=status.HTTP_201_CREATED)
 
 
-class InmuebleCaracteristicaViewSet(viewsets.ModelViewSet):
+class InmuebleCaracteristicaViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = InmuebleCaracteristica.objects.select_related('inmueble', 'caracteristica').all()
 	serializer_class = InmuebleCaracteristicaSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class OperacionViewSet(viewsets.ModelViewSet):
+class OperacionViewSet(ExportMixin, SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Operacion.objects.select_related('inmueble').all()
 	serializer_class = OperacionSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+	export_nombre = 'operaciones'
 
 
-class CitaViewSet(viewsets.ModelViewSet):
-	queryset = Cita.objects.select_related('inmueble').all()
+class CitaViewSet(SincronizacionMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+	queryset = Cita.objects.select_related('inmueble').all().order_by('-fecha_hora_cita', '-id')
 	serializer_class = CitaSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+	pagination_class = KeysetPagination
+
+	@action(detail=False, methods=['get', 'post'], permission_classes=[permissions.IsAuthenticated])
+	def calendario(self, request):
+		"""URL del calendario ICS del usuario, para suscribirse desde un cliente de calendario.
+
+		``POST`` genera una URL nueva y revoca las anteriores.
+		"""
+		usuario = request.user
+		if request.method == 'POST':
+			usuario = Usuario.objects.get(pk=request.user.id)
+			usuario.clave_calendario = clave_calendario_nueva()
+			usuario.save(update_fields=['clave_calendario'])
+		url = request.build_absolute_uri(reverse('citas-calendario-ics'))
+		return Response({'url': f'{url}?token={calendario_ics.token_de(usuario)}'})
 
+	# Las altas y cambios pasan por la detección de choques de api/agenda.py
+	def perform_create(self, serializer):
+		serializer.instance = agenda.guardar(Cita(**serializer.validated_data))
 
-class ConversacionViewSet(viewsets.ModelViewSet):
+	def perform_update(self, serializer):
+		for campo, valor in serializer.validated_data.items():
+			setattr(serializer.instance, campo, valor)
+		agenda.guardar(serializer.instance)
+
+
+class ConversacionViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
 	queryset = Conversacion.objects.select_related('inmueble').all()
 	serializer_class = ConversacionSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+	@action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+	def inbox(self, request):
+		"""Conversaciones del usuario actual (como interesado o vendedor), de la más reciente
+		a la más antigua, con su último mensaje y los no leídos que le enviaron.
+
+		Paginado por cursor; cuesta las mismas consultas sin importar el tamaño de la página:
+		la página (con el id del último mensaje como subconsulta), los últimos mensajes y
+		los conteos de no leídos (más el conteo total salvo ``?count=false``).
+		"""
+		usuario_id = request.user.id
+		mensajes = Mensaje.objects.filter(conversacion=OuterRef('pk')).order_by('-fecha_envio', '-id')
+		queryset = (
+			Conversacion.objects
+			.filter(Q(usuario_interesado_id=usuario_id) | Q(usuario_vendedor_id=usuario_id))
+			.select_related('inmueble__listado', 'usuario_interesado', 'usuario_vendedor')
+			.annotate(
+				ultimo_mensaje_id=Subquery(mensajes.values('id')[:1]),
+				ultima_actividad=Coalesce(Subquery(mensajes.values('fecha_envio')[:1]), 'fecha_creacion'),
+			)
+			.order_by('-ultima_actividad', '-id')
+		)
+
+		paginator = KeysetPagination()
+		page = paginator.paginate_queryset(queryset, request, view=self)
+
+		ids = [conversacion.id for conversacion in page]
+		ultimos = {
+			mensaje.conversacion_id: mensaje
+			for mensaje in Mensaje.objects.filter(
+				pk__in=[c.ultimo_mensaje_id for c in page if c.ultimo_mensaje_id]
+			).select_related('usuario_emisor')
+		} if ids else {}
+		no_leidos = dict(
+			Mensaje.objects.filter(conversacion_id__in=ids, leido=False)
+			.exclude(usuario_emisor_id=usuario_id)
+			.values('conversacion_id').annotate(n=Count('id')).values_list('conversacion_id', 'n')
+		) if ids else {}
+
+		serializer = ConversacionInboxSerializer(
+			page, many=True, context={**self.get_serializer_context(), 'ultimos': ultimos, 'no_leidos': no_leidos}
+		)
+		return paginator.get_paginated_response(serializer.data)
+
+	@action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+	def leer(self, request, pk=None):
+		"""Marca como leídos los mensajes que el usuario recibió en la conversación hasta el
+		mensaje ``hasta`` (todos si se omite).
+
+		Es un solo UPDATE sobre el índice (conversacion, leido) y solo toca los que seguían sin
+		leer, así que repetirlo no cambia nada. Los participantes conectados al flujo en tiempo
+		real reciben un evento ``leidos`` para actualizar sus contadores.
+		"""
+		conversacion = self.get_object()
+		usuario_id = request.user.id
+		if usuario_id not in (conversacion.usuario_interesado_id, conversacion.usuario_vendedor_id):
+			return Response({'error': 'No participa en esta conversación'}, status=status.HTTP_403_FORBIDDEN)
+
+		hasta = request.data.get('hasta')
+		if hasta is not None and (isinstance(hasta, bool) or not str(hasta).isdigit()):
+			raise ValidationError({'hasta': 'Debe ser el id de un mensaje.'})
+
+		pendientes = Mensaje.objects.filter(conversacion=conversacion, leido=False).exclude(usuario_emisor_id=usuario_id)
+		marcados = pendientes
+		if hasta is not None:
+			marcados = marcados.filter(id__lte=int(hasta))
+		# update() no emite señales ni toca auto_now: la fecha la necesita la sincronización
+		actualizados = marcados.update(leido=True, fecha_actualizacion=Now())
+		if actualizados:
+			transaction.on_commit(
+				lambda: tiempo_real.publicar_leidos(conversacion, usuario_id, hasta and int(hasta)), robust=True
+			)
+		return Response({'actualizados': actualizados, 'no_leidos': pendientes.count()})
+
 
-class MensajeViewSet(viewsets.ModelViewSet):
-	queryset = Mensaje.objects.select_related('conversacion', 'usuario_emisor').all()
+class MensajeViewSet(SincronizacionMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+	queryset = Mensaje.objects.select_related('conversacion', 'usuario_emisor').all().order_by('-fecha_envio', '-id')
 	serializer_class = MensajeSerializer
 	permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+	pagination_class = KeysetPagination
 
 
 # Public property listing endpoint
 @api_view(['GET'])
+@authentication_classes([])
 @permission_classes([permissions.AllowAny])
 def casas_publicas(request):
-	"""Endpoint público para listar casas sin autenticación"""
+	"""Endpoint público para listar casas sin autenticación.
+
+	Lee las tarjetas ya armadas de InmuebleListado (una tabla, sin joins), paginado por
+	cursor y servido desde caché; las entradas se invalidan al guardar, eliminar o moderar
+	un inmueble (ver api/signals.py).
+	"""
 	try:
-		queryset = Inmueble.objects.select_related('tipo_inmueble', 'municipio__ciudad').filter(
-			estatus_moderacion='Aprobado'
-		).order_by('-fecha_publicacion')
-		
-		# Transform to the lightweight shape the frontend expects
-		def to_front(item):
-			# Mapear imágenes basado en el código de referencia
-			image_map = {
-				'ICA-001-VAL': '/Imagenes/20241203200818056423000000-o.jpg',
-				'ICA-002-NAG': '/Imagenes/casa_en_venta_en_naguanagua_carabobo_243_m2_3_hab_5900001739233253971.jpg',
-				'ICA-003-SAN': '/Imagenes/IMG-20230322-WA0294.jpg',
-				'ICA-004-GUA': '/Imagenes/MIL20241116120235.jpg',
-				'ICA-005-PUE': '/Imagenes/las-casas-coloniales-del-casco-historico-de-puerto-cabello-parecen-contar-leyendas-ancestralesjpg-4768.jpg',
-				'ICA-006-LOS': '/Imagenes/ApartamentolosGuayos.png',
-				'ICA-007-LIB': '/Imagenes/TocuyitoTownhouse.png',
-				'ICA-008-DIE': '/Imagenes/CasaMariara.png',
-				'ICA-009-VAL': '/Imagenes/ApartamentoValencia.png',
-				'ICA-010-GUA': '/Imagenes/ApartamentoGuacara.png',
-				'ICA-011-SAN': '/Imagenes/CasaSanJoaquin.png',
-				'ICA-012-NAG': '/Imagenes/ApartamentoNaguanagua.png',
-				'ICA-013-PUE': '/Imagenes/CasaPuertoCabello.png',
-				'ICA-014-LOS': '/Imagenes/ApartamentolosGuayos2.png',
-				'ICA-015-LIB': '/Imagenes/TownhouseTocuyito.png',
-			}
-			
-			return {
-				'id': str(item.id),
-				'title': item.titulo_publicacion,
-				'description': item.descripcion_publica or item.titulo_publicacion,
-				'price': float(item.precio or 0),
-				'location': f"{item.municipio.ciudad.nombre_ciudad if item.municipio and item.municipio.ciudad else 'N/A'}, {item.municipio.nombre_municipio if item.municipio else 'N/A'}",
-				'bedrooms': item.habitaciones or 0,
-				'bathrooms': item.banos or 0,
-				'size': float(item.superficie_construccion or 0),
-				'image': image_map.get(item.codigo_referencia, '/placeholder.svg?height=400&width=600&text=Casa'),
-				'features': [],
-				'yearBuilt': item.ano_construccion,
-				'energyRating': 'A',
-			}
-		
-		data = [to_front(item) for item in queryset]
+		paginator = KeysetPagination()
+		paginator.link_query_params = (
+			paginator.cursor_query_param, paginator.page_size_query_param, paginator.count_query_param
+		)
+		# La clave solo depende de lo que cambia la respuesta: otros parámetros no crean entradas
+		clave = cache_respuestas.clave(
+			cache_respuestas.CASAS_PUBLICAS, request.get_host(), request.is_secure(),
+			request.query_params.get(paginator.cursor_query_param, ''),
+			paginator.get_page_size(request), paginator.include_count(request)
+		)
+		data = cache.get(clave)
+		if data is None:
+			queryset = InmuebleListado.objects.filter(
+				estatus_moderacion='Aprobado'
+			).order_by('-fecha_publicacion', '-pk')
+
+			page = paginator.paginate_queryset(queryset, request)
+			data = paginator.get_paginated_response([fila.a_front() for fila in page]).data
+			cache.set(clave, data, settings.CASAS_PUBLICAS_CACHE_TIMEOUT)
 		return Response(data)
-		
+
+	except APIException:
+		# Cursor inválido (404), page_size mal formado, etc.: los responde DRF con su código
+		raise
 	except Exception as e:
 		return Response(
 			{'error': str(e)}, 
@@ -238,9 +638,196 @@ def casas_publicas(request):
 		)
 
 
+# Market statistics endpoint
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def estadisticas_mercado(request):
+	"""Estadísticas de mercado por municipio y tipo de inmueble, leídas de los resúmenes
+	precalculados (ver api/estadisticas.py): el coste depende del número de grupos.
+	Solo cuentan los inmuebles aprobados por moderación.
+
+	Filtros por id: ``?municipio=``, ``?tipo_inmueble=``, ``?ciudad=``.
+	``?agrupar=municipio`` o ``?agrupar=tipo_inmueble`` combina los grupos (sin medianas).
+	"""
+	params = request.query_params
+	filtros = {'municipio': 'municipio_id', 'tipo_inmueble': 'tipo_inmueble_id', 'ciudad': 'municipio__ciudad_id'}
+	queryset = EstadisticaMercado.objects.select_related('municipio', 'tipo_inmueble').order_by('municipio_id', 'tipo_inmueble_id')
+	for parametro, campo in filtros.items():
+		valor = params.get(parametro)
+		if valor is None:
+			continue
+		if not valor.isdigit():
+			return Response({'error': f'El parámetro {parametro} debe ser un id numérico'}, status=status.HTTP_400_BAD_REQUEST)
+		queryset = queryset.filter(**{campo: valor})
+
+	agrupar = params.get('agrupar')
+	if agrupar not in (None, 'municipio', 'tipo_inmueble'):
+		return Response({'error': 'agrupar debe ser municipio o tipo_inmueble'}, status=status.HTTP_400_BAD_REQUEST)
+
+	def municipio(fila):
+		return {'id': fila.municipio_id, 'nombre': fila.municipio.nombre_municipio} if fila.municipio_id else None
+
+	def tipo(fila):
+		return {'id': fila.tipo_inmueble_id, 'nombre': fila.tipo_inmueble.nombre_tipo} if fila.tipo_inmueble_id else None
+
+	ahora = time.time()
+	filas = list(queryset)
+	if agrupar is None:
+		resultados = [
+			{'municipio': municipio(fila), 'tipo_inmueble': tipo(fila), **estadisticas.resumen(fila, ahora)}
+			for fila in filas
+		]
+	else:
+		clave, etiqueta = (municipio, 'municipio') if agrupar == 'municipio' else (tipo, 'tipo_inmueble')
+		grupos = {}
+		for fila in filas:
+			grupos.setdefault(getattr(fila, f'{etiqueta}_id'), (clave(fila), []))[1].append(fila)
+		resultados = [
+			{etiqueta: descripcion, **estadisticas.resumen(estadisticas.combinar(miembros), ahora)}
+			for descripcion, miembros in grupos.values()
+		]
+	return Response({'moneda': estadisticas.MONEDA, 'results': resultados})
+
+
+# Per-user iCalendar feed
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def citas_calendario(request):
+	"""Citas del usuario del ``?token=`` en formato ICS (ver api/calendario.py).
+
+	Mientras no cambien sus citas, las peticiones condicionales reciben 304 sin consultar la BD.
+	"""
+	usuario_id = calendario_ics.usuario_de(request.query_params.get('token'))
+	if usuario_id is None:
+		return Response({'error': 'Token inválido'}, status=status.HTTP_403_FORBIDDEN)
+
+	espacio = cache_respuestas.calendario(usuario_id)
+	hoy = timezone.localdate(timezone=ZoneInfo(settings.CITA_ZONA_HORARIA))
+	etag = version_etag(cache_respuestas.version(espacio), f'{usuario_id}:{hoy.isoformat()}')
+	last_modified = cache_respuestas.modificado(espacio)
+	not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+	if not_modified is not None:
+		return with_cache_headers(not_modified, etag, last_modified)
+
+	desde, hasta = calendario_ics.ventana(hoy)
+	response = StreamingHttpResponse(
+		calendario_ics.exportar(usuario_id, desde, hasta), content_type='text/calendar; charset=utf-8'
+	)
+	response['Content-Disposition'] = 'inline; filename="citas.ics"'
+	return with_cache_headers(response, etag, last_modified)
+
+
+# Real-time messages (Server-Sent Events)
+def servido_por_asgi(request):
+	"""El flujo SSE no termina nunca: bajo WSGI la respuesta se leería entera y colgaría."""
+	return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mensajes_stream_token(request):
+	"""Token de corta duración para abrir GET /api/mensajes/stream/ (ver api/tiempo_real.py)."""
+	if not servido_por_asgi(request):
+		return Response(
+			{'error': 'El flujo en tiempo real requiere servir la app por ASGI'},
+			status=status.HTTP_503_SERVICE_UNAVAILABLE
+		)
+	return Response({'token': tiempo_real.token_de(request.user.id), 'expira_en': settings.TIEMPO_REAL_TOKEN_SEGUNDOS})
+
+
+def usuario_de_token(request):
+	"""Id del Usuario activo del token del flujo (``?token=``, ya que EventSource no permite
+	cabeceras propias) o del token de acceso en la cabecera Authorization, o None."""
+	usuario_id = tiempo_real.usuario_de(request.GET.get('token'))
+	cabecera = request.headers.get('Authorization', '')
+	if usuario_id is None and cabecera.startswith('Bearer '):
+		try:
+			usuario_id = int(AccessToken(cabecera[len('Bearer '):]).get(jwt_api_settings.USER_ID_CLAIM))
+		except (TokenError, TypeError, ValueError):
+			return None
+	if usuario_id is None:
+		return None
+	usuario = autenticacion.usuario_activo(usuario_id)
+	return usuario.pk if usuario is not None else None
+
+
+@require_GET
+async def mensajes_stream(request):
+	"""Flujo SSE con los mensajes nuevos de las conversaciones del usuario.
+
+	Al reconectar, el navegador envía ``Last-Event-ID`` (o ``?ultimo_id=``) y se reenvían
+	primero los mensajes posteriores a ese id.
+	"""
+	if not servido_por_asgi(request):
+		return JsonResponse(
+			{'error': 'El flujo en tiempo real requiere servir la app por ASGI'},
+			status=status.HTTP_503_SERVICE_UNAVAILABLE
+		)
+	usuario_id = await sync_to_async(usuario_de_token)(request)
+	if usuario_id is None:
+		return JsonResponse({'error': 'Token inválido o ausente'}, status=status.HTTP_401_UNAUTHORIZED)
+
+	ultimo_id = request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id')
+	ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+
+	response = StreamingHttpResponse(
+		tiempo_real.eventos(usuario_id, ultimo_id, sync_to_async(tiempo_real.mensajes_desde)),
+		content_type='text/event-stream'
+	)
+	response['Cache-Control'] = 'no-cache'
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+
+# Location tree endpoint
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def arbol_ubicaciones(request):
+	"""Árbol completo Estado -> Ciudad -> Municipio (o el de un estado con ?estado=<id>).
+
+	Se construye una vez por versión de los datos de referencia y se guarda en memoria ya
+	serializado y comprimido con gzip; admite ETag/Last-Modified como el resto de catálogos.
+	"""
+	estado = request.query_params.get('estado')
+	if estado is not None and not estado.isdigit():
+		return Response({'error': 'El parámetro estado debe ser un id numérico'}, status=status.HTTP_400_BAD_REQUEST)
+
+	espacio = cache_respuestas.REFERENCIA
+	version = cache_respuestas.version(espacio)
+	last_modified = cache_respuestas.modificado(espacio)
+	clave = f'arbol_ubicaciones:{estado or ""}'
+	# Cada codificación es otro cuerpo: su propio ETag, y Vary también en los 304
+	con_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+	etag = version_etag(version, f'{clave}:{"gzip" if con_gzip else "identity"}')
+
+	not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+	if not_modified is not None:
+		not_modified['Vary'] = 'Accept-Encoding'
+		return with_cache_headers(not_modified, etag, last_modified)
+
+	cuerpo = cache_respuestas.memoria.get(espacio, version, clave)
+	if cuerpo is None:
+		crudo = json.dumps(construir_arbol(int(estado) if estado else None), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+		cuerpo = (crudo, gzip.compress(crudo))
+		cache_respuestas.memoria.set(espacio, version, clave, cuerpo)
+
+	crudo, comprimido = cuerpo
+	if con_gzip:
+		response = HttpResponse(comprimido, content_type='application/json')
+		response['Content-Encoding'] = 'gzip'
+	else:
+		response = HttpResponse(crudo, content_type='application/json')
+	response['Vary'] = 'Accept-Encoding'
+	return with_cache_headers(response, etag, last_modified)
+
+
 # Authentication views
 @api_view(['POST'])
+@authentication_classes([])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([limitar('register')])
 def register_user(request):
 	"""Registrar un nuevo usuario"""
 	try:
@@ -293,7 +880,9 @@ def register_user(request):
 
 
 @api_view(['POST'])
+@authentication_classes([])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([limitar('login')])
 def login_user(request):
 	"""Iniciar sesión de usuario"""
 	try:
@@ -342,7 +931,9 @@ def login_user(request):
 
 
 @api_view(['POST'])
+@authentication_classes([])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([limitar('google_auth')])
 def google_auth(request):
 	"""Validar id_token de Google, crear/actualizar usuario y devolver tokens JWT."""
 	try:
@@ -350,11 +941,8 @@ def google_auth(request):
 		if not token:
 			return Response({'error': 'No token provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-		# Import here to avoid adding google-auth to runtime unless endpoint is used
-		from google.oauth2 import id_token as google_id_token
-		from google.auth.transport import requests as google_requests
-
-		idinfo = google_id_token.verify_oauth2_token(token, google_requests.Request(), audience=None)
+		# Firma comprobada localmente con las claves de Google en caché (api/verificacion_google.py)
+		idinfo = verificacion_google.verificar(token, audiencia=settings.GOOGLE_CLIENT_ID)
 
 		email = idinfo.get('email')
 		name = idinfo.get('name', '')
@@ -79,16 +79,27 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 
 # Database (default: MySQL from environment; keep for production-like setup)
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': os.environ.get('DB_NAME', ''),
-        'USER': os.environ.get('DB_USER', ''),
-        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
-        'HOST': os.environ.get('DB_HOST', 'localhost'),
-        'PORT': os.environ.get('DB_PORT', '3306'),
+# Set DB_ENGINE=django.db.backends.sqlite3 to run locally/tests without MySQL.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.mysql')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME') or os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', ''),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '3306'),
+        }
     }
-}
 
 # Allow all hosts in development (adjust in production)
 ALLOWED_HOSTS = ['*']
@@ -135,7 +146,7 @@ CORS_ALLOWED_ORIGINS = [
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.autenticacion.UsuarioJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -143,8 +154,119 @@ REST_FRAMEWORK = {
     # Use page-number pagination by default (Ferrepoco)
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': int(os.environ.get('PAGE_SIZE', 10)),
+    # Trusted reverse proxies in front of the app. 0 = rate limits use REMOTE_ADDR and ignore
+    # X-Forwarded-For (clients can forge it); behind nginx set NUM_PROXIES=1.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
+# Cache: per-process memory by default; set REDIS_URL so every worker shares entries
+# (see api/cache.py). Response-cache versions live in the database; each process re-reads
+# them after CACHE_VERSION_SEGUNDOS, the most a write can take to reach other workers
+# without Redis.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CACHE_VERSION_SEGUNDOS = int(os.environ.get('CACHE_VERSION_SEGUNDOS', 5))
+
+# Real-time message fan-out for /api/mensajes/stream/ (see api/tiempo_real.py): in-process
+# by default, Redis pub/sub when REDIS_URL is set so every worker receives every message.
+REDIS_URL = os.environ.get('REDIS_URL')
+TIEMPO_REAL_BACKEND = os.environ.get(
+    'TIEMPO_REAL_BACKEND',
+    'api.tiempo_real.DifusionRedis' if REDIS_URL else 'api.tiempo_real.DifusionMemoria'
+)
+# Lifetime of the stream-only token from POST /api/mensajes/stream/token/ (it is only checked
+# when the stream is opened, so a connection outlives it)
+TIEMPO_REAL_TOKEN_SEGUNDOS = int(os.environ.get('TIEMPO_REAL_TOKEN_SEGUNDOS', 60))
+
+# Seconds a cached /api/casas/ page lives (entries are also invalidated on every change)
+CASAS_PUBLICAS_CACHE_TIMEOUT = int(os.environ.get('CASAS_PUBLICAS_CACHE_TIMEOUT', 300))
+
+
+# Full-text search backend for Inmueble: 'auto' (FULLTEXT on MySQL, inverted index elsewhere),
+# 'fulltext' or 'invertido'. Rebuild with `python manage.py reindexar_busqueda`.
+BUSQUEDA_BACKEND = os.environ.get('BUSQUEDA_BACKEND', 'auto')
+
+# MySQL's innodb_ft_min_token_size: shorter terms are not in the FULLTEXT index, so the
+# 'fulltext' backend drops them (and InnoDB stopwords) from the boolean query
+BUSQUEDA_FT_MIN_TOKEN = int(os.environ.get('BUSQUEDA_FT_MIN_TOKEN', 3))
+
+# Maximum number of items accepted by POST /api/inmuebles/batch/
+INMUEBLES_LOTE_MAX = int(os.environ.get('INMUEBLES_LOTE_MAX', 500))
+
+# Visits (api/agenda.py): default and maximum length of a Cita, and the business hours
+# (in CITA_ZONA_HORARIA) and slot step offered by /api/inmuebles/<id>/disponibilidad/
+CITA_DURACION_MINUTOS = int(os.environ.get('CITA_DURACION_MINUTOS', 60))
+CITA_DURACION_MAXIMA_MINUTOS = int(os.environ.get('CITA_DURACION_MAXIMA_MINUTOS', 240))
+CITA_ZONA_HORARIA = os.environ.get('CITA_ZONA_HORARIA', 'America/Caracas')
+CITA_HORA_INICIO = int(os.environ.get('CITA_HORA_INICIO', 9))
+CITA_HORA_FIN = int(os.environ.get('CITA_HORA_FIN', 18))
+CITA_INTERVALO_MINUTOS = int(os.environ.get('CITA_INTERVALO_MINUTOS', 30))
+
+# ICS feed of a user's citas (/api/citas/calendario.ics): days before/after today included
+CALENDARIO_DIAS_ATRAS = int(os.environ.get('CALENDARIO_DIAS_ATRAS', 30))
+CALENDARIO_DIAS_ADELANTE = int(os.environ.get('CALENDARIO_DIAS_ADELANTE', 180))
+
+# Seconds an authenticated Usuario (with its Rol) stays in the per-process cache used by
+# api.autenticacion.UsuarioJWTAuthentication
+AUTH_USUARIO_CACHE_SEGUNDOS = int(os.environ.get('AUTH_USUARIO_CACHE_SEGUNDOS', 60))
+
+# Token-bucket limits (api/throttling.py) per scope: 'ip' applies to every request and
+# 'usuario' also to authenticated ones. '10/min' = bursts of 10, refilled at 10 per minute.
+# With REDIS_URL buckets are shared through the Django cache ('api.throttling.AlmacenCache');
+# otherwise each process keeps its own and admits 1/THROTTLE_PROCESOS of every budget
+# (defaults to WEB_CONCURRENCY, the worker count gunicorn and uvicorn read), tracking at most
+# THROTTLE_MAX_CLAVES buckets.
+THROTTLE_ALMACEN = os.environ.get(
+    'THROTTLE_ALMACEN',
+    'api.throttling.AlmacenCache' if REDIS_URL else 'api.throttling.AlmacenMemoria'
+)
+THROTTLE_PROCESOS = int(os.environ.get('THROTTLE_PROCESOS', os.environ.get('WEB_CONCURRENCY', 1)))
+THROTTLE_MAX_CLAVES = int(os.environ.get('THROTTLE_MAX_CLAVES', 10000))
+THROTTLE_PRESUPUESTOS = {
+    'login': {'ip': os.environ.get('THROTTLE_LOGIN', '10/min')},
+    'register': {'ip': os.environ.get('THROTTLE_REGISTER', '5/min')},
+    'google_auth': {'ip': os.environ.get('THROTTLE_GOOGLE_AUTH', '20/min')},
+    'search': {
+        'ip': os.environ.get('THROTTLE_SEARCH_IP', '120/min'),
+        'usuario': os.environ.get('THROTTLE_SEARCH_USUARIO', '240/min'),
+    },
+}
+
+# Google sign-in (api/verificacion_google.py). ID tokens are verified locally against
+# Google's certificates, cached for their max-age (GOOGLE_CLAVES_TTL when absent) and
+# refreshed in the background GOOGLE_CLAVES_MARGEN seconds before expiry. Point
+# GOOGLE_CERTS_URL at a local server to use stand-in keys. GOOGLE_CLIENT_ID, when set,
+# is required as the token audience.
+GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID') or None
+GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v1/certs')
+GOOGLE_CLAVES_TTL = int(os.environ.get('GOOGLE_CLAVES_TTL', 3600))
+GOOGLE_CLAVES_MARGEN = int(os.environ.get('GOOGLE_CLAVES_MARGEN', 300))
+GOOGLE_CLAVES_REINTENTO = int(os.environ.get('GOOGLE_CLAVES_REINTENTO', 60))
+
+# Moderation queue (api/moderacion.py): roles allowed to moderate, default and maximum
+# batch size, and minutes a claimed batch stays reserved to its moderator
+MODERACION_ROLES = [r.strip() for r in os.environ.get('MODERACION_ROLES', 'Administrador').split(',') if r.strip()]
+MODERACION_LOTE = int(os.environ.get('MODERACION_LOTE', 20))
+MODERACION_LOTE_MAX = int(os.environ.get('MODERACION_LOTE_MAX', 100))
+MODERACION_RESERVA_MINUTOS = int(os.environ.get('MODERACION_RESERVA_MINUTOS', 15))
+
+# Incremental sync of mensajes/citas (?since=, see api/sync.py): seconds of overlap kept
+# behind the watermark, and days deletion records are kept (purgar_eliminados)
+SYNC_MARGEN_SEGUNDOS = int(os.environ.get('SYNC_MARGEN_SEGUNDOS', 5))
+SYNC_RETENCION_DIAS = int(os.environ.get('SYNC_RETENCION_DIAS', 30))
+
 
 # Simple JWT configuration (merged)
 from datetime import timedelta
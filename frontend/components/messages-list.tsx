@@ -37,6 +37,8 @@ interface Conversation {
   }
   fecha_creacion: string
   mensajes: Message[]
+  ultimo_mensaje?: Message | null
+  no_leidos?: number
 }
 
 interface Message {
@@ -71,12 +73,14 @@ const MessagesList = () => {
     const loadConversations = async () => {
       try {
         setLoading(true)
-        // Aquí cargarías las conversaciones del usuario
-        // const data = await api.getUserConversations()
-        // setConversations(data)
-        
-        // Datos de ejemplo por ahora
-        setConversations([])
+        // La bandeja ya trae el último mensaje y los no leídos de cada conversación
+        const data = await api.getInbox()
+        setConversations(data.results.map((conversation) => ({
+          ...conversation,
+          inmueble: { ...conversation.inmueble, imagen: conversation.inmueble.imagen ?? undefined },
+          usuario_interesado: { telefono: '', ...conversation.usuario_interesado },
+          mensajes: conversation.ultimo_mensaje ? [conversation.ultimo_mensaje] : [],
+        })))
       } catch (err: any) {
         console.error('Error cargando conversaciones:', err)
         setError('Error al cargar las conversaciones')
@@ -86,8 +90,39 @@ const MessagesList = () => {
     }
 
     loadConversations()
+
+    // Los mensajes nuevos llegan por el flujo en tiempo real: la conversación sube al inicio
+    const unsubscribe = api.subscribeMessages((message) => {
+      setConversations((current) => {
+        const conversation = current.find((c) => c.id === message.conversacion)
+        if (!conversation || conversation.mensajes.some((m) => m.id === message.id)) return current
+        const recibido = message.usuario_emisor.id !== Number(user.id)
+        const updated = {
+          ...conversation,
+          mensajes: [...conversation.mensajes, message],
+          ultimo_mensaje: message,
+          no_leidos: (conversation.no_leidos ?? 0) + (recibido && !message.leido ? 1 : 0),
+        }
+        return [updated, ...current.filter((c) => c.id !== message.conversacion)]
+      })
+    })
+    return unsubscribe
   }, [user, router]) // Removemos 'api' de las dependencias
 
+  const handleSelectConversation = async (conversation: Conversation) => {
+    setSelectedConversation(conversation)
+    if (!conversation.no_leidos) return
+
+    // Un solo POST marca como leído todo lo visible (hasta el último mensaje cargado)
+    const lastMessage = conversation.mensajes[conversation.mensajes.length - 1]
+    try {
+      const { no_leidos } = await api.markConversationRead(conversation.id, lastMessage?.id)
+      setConversations((current) => current.map((c) => (c.id === conversation.id ? { ...c, no_leidos } : c)))
+    } catch (err: any) {
+      console.error('Error marcando mensajes como leídos:', err)
+    }
+  }
+
   const handleSendMessage = async (conversationId: number) => {
     if (!newMessage.trim()) return
 
@@ -126,6 +161,9 @@ const MessagesList = () => {
   }
 
   const getUnreadCount = (conversation: Conversation) => {
+    if (conversation.no_leidos !== undefined) {
+      return conversation.no_leidos
+    }
     return conversation.mensajes.filter(msg => !msg.leido && msg.usuario_emisor.id !== user?.id).length
   }
 
@@ -206,7 +244,7 @@ const MessagesList = () => {
                           className={`p-4 border-b cursor-pointer hover:bg-gray-50 transition-colors ${
                             selectedConversation?.id === conversation.id ? 'bg-blue-50 border-blue-200' : ''
                           }`}
-                          onClick={() => setSelectedConversation(conversation)}
+                          onClick={() => handleSelectConversation(conversation)}
                         >
                           <div className="flex items-start justify-between mb-2">
                             <div className="flex-1 min-w-0">
@@ -20,16 +20,22 @@ export default function PropertyList() {
   const [filteredProperties, setFilteredProperties] = useState<Property[]>([])
   const [selectedProperty, setSelectedProperty] = useState<Property | null>(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState<string | null>(null)
-  const { getProperties } = useApi()
+  // Enlace a la siguiente página del API y total de propiedades publicadas
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
+  const [totalCount, setTotalCount] = useState<number | null>(null)
+  const { getPropertiesPage } = useApi()
 
   useEffect(() => {
     const loadProperties = async () => {
       try {
         setLoading(true)
         setError(null)
-        const properties = await getProperties()
-        setFilteredProperties(properties)
+        const firstPage = await getPropertiesPage()
+        setFilteredProperties(firstPage.results)
+        setNextUrl(firstPage.next)
+        setTotalCount(firstPage.count ?? null)
       } catch (err) {
         console.error("Error al cargar propiedades:", err)
         setError("Error al cargar las propiedades. Por favor, inténtalo de nuevo.")
@@ -40,7 +46,7 @@ export default function PropertyList() {
     }
 
     loadProperties()
-  }, []) // Removemos getProperties de las dependencias
+  }, []) // Removemos getPropertiesPage de las dependencias
 
   const toggleFavorite = (id: string) => {
     setFavorites((prev) => (prev.includes(id) ? prev.filter((item) => item !== id) : [...prev, id]))
@@ -57,9 +63,27 @@ export default function PropertyList() {
   // PAGINACIÓN: mostrar 6 propiedades por página y botón para cambiar de página
   const [page, setPage] = useState(1);
   const pageSize = 6;
-  const totalPages = Math.ceil(filteredProperties.length / pageSize);
+  const totalPages = Math.ceil((totalCount ?? filteredProperties.length) / pageSize);
   const paginatedProperties = filteredProperties.slice((page - 1) * pageSize, page * pageSize);
 
+  // Las páginas del API traen más de una página de la vista: se pide la siguiente al llegar al final
+  const goToPage = async (target: number) => {
+    if (target * pageSize > filteredProperties.length && nextUrl) {
+      try {
+        setLoadingMore(true)
+        const more = await getPropertiesPage(nextUrl)
+        setFilteredProperties((prev) => [...prev, ...more.results])
+        setNextUrl(more.next)
+      } catch (err) {
+        console.error("Error al cargar más propiedades:", err)
+        return
+      } finally {
+        setLoadingMore(false)
+      }
+    }
+    setPage(target)
+  }
+
   if (loading) {
     return (
       <section id="propiedades" className="py-16 bg-gray-50">
@@ -238,16 +262,16 @@ export default function PropertyList() {
         {totalPages > 1 && (
           <div className="flex justify-center mt-8 gap-2">
             <Button
-              disabled={page === 1}
-              onClick={() => setPage(page - 1)}
+              disabled={page === 1 || loadingMore}
+              onClick={() => goToPage(page - 1)}
               className="bg-blue-100 text-blue-900 hover:bg-blue-200"
             >
               Anterior
             </Button>
             <span className="px-4 py-2 text-blue-900 font-semibold">Página {page} de {totalPages}</span>
             <Button
-              disabled={page === totalPages}
-              onClick={() => setPage(page + 1)}
+              disabled={page === totalPages || loadingMore}
+              onClick={() => goToPage(page + 1)}
               className="bg-blue-100 text-blue-900 hover:bg-blue-200"
             >
               Siguiente
@@ -51,6 +51,39 @@ export interface PropertySearchParams {
   search?: string
 }
 
+export interface InboxConversation {
+  id: number
+  inmueble: {
+    id: number
+    codigo_referencia: string
+    titulo_publicacion: string
+    precio: number
+    ubicacion: string | null
+    imagen: string | null
+  }
+  usuario_interesado: { id: number; nombres: string; apellidos: string }
+  usuario_vendedor: { id: number; nombres: string; apellidos: string }
+  fecha_creacion: string
+  ultima_actividad: string
+  ultimo_mensaje: {
+    id: number
+    contenido_mensaje: string
+    fecha_envio: string
+    leido: boolean
+    usuario_emisor: { id: number; nombres: string; apellidos: string }
+  } | null
+  no_leidos: number
+}
+
+export type InboxMessage = NonNullable<InboxConversation['ultimo_mensaje']> & { conversacion: number }
+
+export interface CursorPage<T> {
+  count?: number
+  next: string | null
+  previous: string | null
+  results: T[]
+}
+
 export interface VisitRequest {
   fecha_hora_cita: string
   observaciones?: string
@@ -155,10 +188,10 @@ class ApiService {
   }
 
   // Métodos para propiedades
-  async getProperties(): Promise<Property[]> {
-    // Endpoint público, no necesita autenticación
+  async getPropertiesPage(next?: string | null): Promise<CursorPage<Property>> {
+    // Endpoint público, no necesita autenticación; ``next`` es el enlace de la página anterior
     const baseUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api'
-    const response = await fetch(`${baseUrl}/casas/`, {
+    const response = await fetch(next || `${baseUrl}/casas/?page_size=50`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
@@ -169,7 +202,23 @@ class ApiService {
       throw new Error(`HTTP error! status: ${response.status}`)
     }
     
-    return await response.json()
+    // El endpoint es paginado por cursor: { count, next, previous, results }
+    const data = await response.json()
+    if (Array.isArray(data)) {
+      return { count: data.length, next: null, previous: null, results: data }
+    }
+    return { count: data.count, next: data.next, previous: data.previous, results: data.results || [] }
+  }
+
+  async getProperties(): Promise<Property[]> {
+    // Todas las propiedades, siguiendo los enlaces ``next``
+    let page = await this.getPropertiesPage()
+    const properties = [...page.results]
+    while (page.next) {
+      page = await this.getPropertiesPage(page.next)
+      properties.push(...page.results)
+    }
+    return properties
   }
 
   async searchProperties(params: PropertySearchParams): Promise<Property[]> {
@@ -232,6 +281,61 @@ class ApiService {
     return await this.request<any[]>(`/municipios/?ciudad=${ciudadId}`)
   }
 
+  // Bandeja de entrada: conversaciones del usuario con último mensaje y no leídos
+  async getInbox(cursor?: string): Promise<CursorPage<InboxConversation>> {
+    const url = cursor ? `/conversaciones/inbox/?cursor=${encodeURIComponent(cursor)}` : '/conversaciones/inbox/'
+    return await this.request<CursorPage<InboxConversation>>(url)
+  }
+
+  // Marca como leídos los mensajes recibidos en la conversación (hasta upTo, o todos)
+  async markConversationRead(conversationId: number, upTo?: number): Promise<{ actualizados: number; no_leidos: number }> {
+    return await this.request(`/conversaciones/${conversationId}/leer/`, {
+      method: 'POST',
+      body: JSON.stringify(upTo !== undefined ? { hasta: upTo } : {}),
+    })
+  }
+
+  // Mensajes nuevos en tiempo real (Server-Sent Events); devuelve la función para cerrar el flujo.
+  // EventSource no admite cabeceras: la URL lleva un token de corta duración que solo abre el
+  // flujo (no el JWT de acceso). Si el token venció al reconectar se pide otro y se reabre con
+  // ultimo_id para recibir lo que se perdió. Si el backend no se sirve por ASGI no hay flujo.
+  subscribeMessages(onMessage: (message: InboxMessage) => void): () => void {
+    if (typeof window === 'undefined' || !this.token) return () => {}
+    let source: EventSource | null = null
+    let closed = false
+    let lastId: string | null = null
+
+    const open = async () => {
+      let token: string
+      try {
+        token = (await this.request<{ token: string }>('/mensajes/stream/token/', { method: 'POST' })).token
+      } catch {
+        return
+      }
+      if (closed) return
+      const params = new URLSearchParams({ token })
+      if (lastId) params.set('ultimo_id', lastId)
+      source = new EventSource(`${this.baseURL}/mensajes/stream/?${params}`)
+      source.addEventListener('mensaje', (event) => {
+        const messageEvent = event as MessageEvent
+        lastId = messageEvent.lastEventId || lastId
+        onMessage(JSON.parse(messageEvent.data))
+      })
+      source.onerror = () => {
+        // CLOSED: el servidor rechazó la reconexión (token vencido); el navegador no reintenta
+        if (source?.readyState === EventSource.CLOSED && !closed) {
+          setTimeout(open, 3000)
+        }
+      }
+    }
+
+    open()
+    return () => {
+      closed = true
+      source?.close()
+    }
+  }
+
   async createProperty(propertyData: any): Promise<any> {
     return await this.request<any>('/inmuebles/', {
       method: 'POST',
@@ -250,6 +354,7 @@ export const useApi = () => {
     login: apiService.login.bind(apiService),
     logout: apiService.logout.bind(apiService),
     getProperties: apiService.getProperties.bind(apiService),
+    getPropertiesPage: apiService.getPropertiesPage.bind(apiService),
     searchProperties: apiService.searchProperties.bind(apiService),
     getProperty: apiService.getProperty.bind(apiService),
     scheduleVisit: apiService.scheduleVisit.bind(apiService),
@@ -262,6 +367,9 @@ export const useApi = () => {
     getCiudadesByEstado: apiService.getCiudadesByEstado.bind(apiService),
     getMunicipiosByCiudad: apiService.getMunicipiosByCiudad.bind(apiService),
     createProperty: apiService.createProperty.bind(apiService),
+    getInbox: apiService.getInbox.bind(apiService),
+    subscribeMessages: apiService.subscribeMessages.bind(apiService),
+    markConversationRead: apiService.markConversationRead.bind(apiService),
     getToken: apiService.getToken.bind(apiService),
   }
 }
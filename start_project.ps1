@@ -41,9 +41,9 @@ python manage.py migrate
 Write-Host "Inicializando datos básicos..." -ForegroundColor Yellow
 python manage.py init_data
 
-# Iniciar servidor Django en segundo plano
+# Iniciar servidor Django en segundo plano (por ASGI, necesario para los mensajes en tiempo real)
 Write-Host "Iniciando servidor Django en puerto 8000..." -ForegroundColor Yellow
-Start-Process -FilePath "python" -ArgumentList "manage.py", "runserver" -WindowStyle Minimized
+Start-Process -FilePath "python" -ArgumentList "-m", "uvicorn", "config.asgi:application", "--reload", "--port", "8000" -WindowStyle Minimized
 
 # Esperar un momento para que Django se inicie
 Start-Sleep -Seconds 3